@@ -10,6 +10,8 @@ valves (Swagelok SS-62TS4-41DC) located at the coolant I/O end of the stave.
 
 History: ----------------------------------------------------------------------
    V1.0 - Aug-2018  First public release.
+   V1.1 - Oct-2026  Streaming mode: the Arduino sends the flowmeter voltage
+           continuously and a background reader keeps a rolling average.
 
 Environment: ------------------------------------------------------------------
    This program is written in Python 3.6.  Python can be freely downloaded
@@ -25,27 +27,40 @@ Notes: -------------------------------------------------------------------------
    To install the serial module on your local computer, go to 
 https://github.com/pyserial/pyserial and install by typing: 
 pip3.6 install pyserial in a DOS command window.
+   Streaming mode (needs the Arduino sketch with the C and P commands, see
+doc/ChillerEquipmentCommunications.txt): "Cnnn" makes the board send a line
+"D x.xx" with the flowmeter voltage every nnn milliseconds, "P" stops it.
+While streaming, clsFlowStream reads all lines in a background thread, keeps
+the voltages of the last fltWindow seconds and hands the other lines back as
+command replies, so F (aRPS?) returns at once from the buffer.
+ArduinoEmulator.py stands in for the board on Linux/mac.
 
 Dictionary of abbreviations: ---------------------------------------------------
     bol - boolean
   cls - class
+  deq - deque
+  evt - event
   flt - float
   int - integer
   lst - list
+  que - queue
   str - string
 
 '''
 
 # Import section --------------------------------------------------------------
 
-import serial             # Serial communications over USB ports.
 import logging            # Flexible event logging functions/classes.
 import time
+import threading          # Background reader of the streaming mode.
+import queue              # Command replies received by the background reader.
+from collections import deque
 from enum import IntEnum  # Class to define enumerators.
 import random             # Generate pseuo-random numbers.
 
 # User defined classes
 from ChillerDevices import  clsDevice# Allows reading from devices.
+from ChillerFraming import clsLineFrame   # Arduino answers end with a new line.
 from ChillerPseudoDevices import clsPseudoDevice
 # Class global variables/enumerators
 
@@ -56,6 +71,118 @@ class valveState(IntEnum):
   OPEN = 0
   CLOSE = 1
   
+# ------------------------------------------------------------------------------
+class clsFlowStream:
+  def __init__(self, pdev, strName, fltWindow=2.0, fltMaxAge=2.0, intMaxSamples=512):
+    '''
+      Background reader of the streamed flowmeter voltages of the opened port
+    pdev.  Keeps the voltages of the last fltWindow seconds with their time stamps.
+    A value older than fltMaxAge seconds is not used.
+    '''
+    self._pdev = pdev
+    self.strName = strName
+    self.fltWindow = fltWindow
+    self.fltMaxAge = fltMaxAge
+    self._deqSamples = deque(maxlen=intMaxSamples)  # (time.monotonic(), voltage)
+    self._fltSum = 0.                                # sum of the voltages in _deqSamples
+    self._lock = threading.Lock()
+    self._queReplies = queue.Queue()                 # lines that are not "D x.xx"
+    self._evtStop = threading.Event()
+    self._thread = None
+    self.fltLastTime = 0.                            # time.time() of the last voltage
+
+  def start(self):
+    self._evtStop.clear()
+    self._thread = threading.Thread(target=self._run, name=self.strName + ' stream', daemon=True)
+    self._thread.start()
+
+  def stop(self):
+    self._evtStop.set()
+    if self._thread is not None:
+      self._thread.join(1.)
+    self._thread = None
+
+  def running(self):
+    return self._thread is not None and self._thread.is_alive()
+
+  def _run(self):
+    '''
+      Read whatever arrives, split it in lines and sort them.  Never blocks for
+    more than 0.1 s, so stop() is honored quickly.
+    '''
+    self._pdev.timeout = 0.1
+    bytesBuf = bytearray()
+    while not self._evtStop.is_set():
+      try:
+        bytesBuf += self._pdev.read(max(1, self._pdev.in_waiting))
+      except Exception as err:
+        logging.error(' <ERROR> ' + self.strName + ' stream reader stopped: ' + str(err))
+        break
+      intIdx = bytesBuf.find(b'\n')
+      while intIdx >= 0:
+        self._line(bytes(bytesBuf[:intIdx]).strip())
+        del bytesBuf[:intIdx + 1]
+        intIdx = bytesBuf.find(b'\n')
+
+  def _line(self, byteline):
+    if byteline[:2] == b'D ':
+      try:
+        fltVoltage = float(byteline[2:])
+      except ValueError:
+        logging.warning(' Received for flowrate: ' + byteline.decode(errors='replace'))
+        return
+      fltNow = time.monotonic()
+      with self._lock:
+        if len(self._deqSamples) == self._deqSamples.maxlen:
+          self._fltSum -= self._deqSamples[0][1]
+        self._deqSamples.append((fltNow, fltVoltage))
+        self._fltSum += fltVoltage
+        self._prune(fltNow)
+      self.fltLastTime = time.time()
+    elif byteline:
+      self._queReplies.put(byteline)
+
+  def _prune(self, fltNow):
+    '''
+      Drop the voltages older than the window, the lock must be held.
+    '''
+    fltOldest = fltNow - self.fltWindow
+    while self._deqSamples and self._deqSamples[0][0] < fltOldest:
+      self._fltSum -= self._deqSamples.popleft()[1]
+    if not self._deqSamples:
+      self._fltSum = 0.   # no rounding residue left behind
+
+  def average(self):
+    '''
+      Return (mean voltage of the window, age in seconds of the last voltage,
+    number of voltages).  Raise ValueError if there is no recent voltage.
+    '''
+    fltNow = time.monotonic()
+    with self._lock:
+      self._prune(fltNow)
+      intNum = len(self._deqSamples)
+      if intNum == 0:
+        raise ValueError(' No flowmeter voltage from ' + self.strName + ' in the last ' + \
+                         str(self.fltWindow) + ' s')
+      fltAge = fltNow - self._deqSamples[-1][0]
+      fltMean = self._fltSum / intNum
+    if fltAge > self.fltMaxAge:
+      raise ValueError(' Flowmeter voltage from ' + self.strName + ' is ' + str(round(fltAge, 1)) + ' s old')
+    return (fltMean, fltAge, intNum)
+
+  def command(self, byteCommand, fltTimeout):
+    '''
+      Send a command while streaming and return its reply line.
+    '''
+    while not self._queReplies.empty():
+      self._queReplies.get_nowait()
+    self._pdev.write(byteCommand)
+    try:
+      return self._queReplies.get(timeout=fltTimeout) + b'\n'
+    except queue.Empty:
+      raise TimeoutError(' ' + self.strName + ' no reply to ' + repr(byteCommand) + ' within ' + \
+                         str(fltTimeout) + ' s')
+
 # ------------------------------------------------------------------------------
 class clsArduino (clsDevice):
   def __init__(self, strName, strPort, intBaud=9600, bytesize=8, parity='N', stopbits=1, 
@@ -73,6 +200,8 @@ class clsArduino (clsDevice):
     self._enumInValve = valveState.CLOSE     # Power up state of the input valve.
     self._enumOutValve = valveState.CLOSE    # Power up state of the output valve.
     self._lstValveState = ['Open', 'Close']   # Possible states of valves.
+    self._istDecoder = clsLineFrame()         # Every answer is one line of text.
+    self._istStream = None                    # Background reader, in streaming mode only.
     self._value = 0
 
   def read(self, strCmdName, strCmdPara="",fltTempsfltRPS=[[],[]]):
@@ -83,7 +212,10 @@ class clsArduino (clsDevice):
     intNumMeas = 3
     intNumReal = intNumMeas
     
-    if strCmdName == 'F': #Read the flow meter voltage
+    if strCmdName == 'F' and self.streaming(): #Rolling average of the streamed voltages
+      self._value = self.streamFlowRate(staveTemp)
+
+    elif strCmdName == 'F': #Read the flow meter voltage
       for i in range(intNumMeas): #Do this intNumMeas times
         fltFlow = clsArduino.readFlowRate(self, staveTemp)
         if fltFlow == -1:
@@ -109,10 +241,79 @@ class clsArduino (clsDevice):
     elif strCmdName == 'O':
       bolOpen = clsArduino.openValves(self)
       self._value = bolOpen
+
+    elif strCmdName[:1] == 'C': #Start streaming, C<period in ms>
+      self._value = clsArduino.startStream(self, int(strCmdName[1:] or 100))
+
+    elif strCmdName == 'P': #Stop streaming
+      self._value = clsArduino.stopStream(self)
     logging.debug( self._strClassName + 'Command received')
+
   def last(self):
     return self._value
 
+# ------------------------------------------------------------------------------
+  def query(self, byteCommand, fltTimeout=None):
+    '''
+      While streaming the background reader owns the port, the reply is taken
+    from it.  Otherwise same as clsDevice.query.
+    '''
+    if self.streaming():
+      return self._istStream.command(byteCommand, fltTimeout or self.fltTimeout)
+    return super().query(byteCommand, fltTimeout)
+
+# ------------------------------------------------------------------------------
+  def streaming(self):
+    return self._istStream is not None and self._istStream.running()
+
+  def startStream(self, intPeriod=100, fltWindow=2.0):
+    '''
+      Ask the Arduino to send the flowmeter voltage every intPeriod ms and start
+    the background reader.  An Arduino sketch without streaming mode does not
+    answer, or not OK, then the flow rate is read on request as before.
+    '''
+    if self.streaming():
+      return True
+    try:
+      strReturnText = self.query(('C' + str(int(intPeriod)) + '\n').encode()).decode()
+    except (TimeoutError, ValueError) as err:
+      logging.warning(self._strClassName + ' No streaming mode in the Arduino sketch (' + str(err) + \
+                      '), reading the flow rate on request.')
+      return False
+    if "OK" not in strReturnText:
+      logging.warning(self._strClassName + ' No streaming mode in the Arduino sketch (' + strReturnText.strip() + \
+                      '), reading the flow rate on request.')
+      return False
+    self._istStream = clsFlowStream(self._pdev, self.strName, fltWindow, max(2.0, 5 * intPeriod / 1000.))
+    self._istStream.start()
+    logging.info(self._strClassName + ' Streaming flowmeter voltage every ' + str(int(intPeriod)) + ' ms')
+    return True
+
+  def stopStream(self):
+    '''
+      Stop the streaming mode and the background reader.
+    '''
+    if not self.streaming():
+      return True
+    try:
+      strReturnText = self.query(('P\n').encode()).decode()
+    except (TimeoutError, ValueError) as err:       # the reader stops anyway
+      logging.warning(self._strClassName + ' Streaming mode stop not answered (' + str(err) + ')')
+      strReturnText = ''
+    self._istStream.stop()
+    self._istStream = None
+    self._pdev.reset_input_buffer()
+    return "OK" in strReturnText
+
+  def streamFlowRate(self, fltCoolantTemp):
+    '''
+      Flow rate of the mean streamed voltage over the rolling window.  Raise
+    ValueError when no recent voltage came in, like a bad response would.
+    '''
+    fltVoltage, fltAge, intNum = self._istStream.average()
+    logging.debug('%s %d voltages, last one %.3f s old', self._strClassName, intNum, fltAge)
+    return self.funcFlowRate('OK ' + str(fltVoltage), fltCoolantTemp)
+
 # ------------------------------------------------------------------------------
   def readFlowRate(self, fltCoolantTemp):
     '''
@@ -128,17 +329,24 @@ class clsArduino (clsDevice):
       The value returned is a text string of the computed flow rate.  IF there
     was an error in reading the flowmeter analog value, return -1.00 for flow rate.
     '''
-    # Flow rate approximation is as given by: 
-    # F(V,T) = c0+c1V+c2T+c3VT+c4V^2+c5T^2+c6V^2T+c7VT^2+c8V^2T^2  #### ISU Calibration Oct 31, 2018
-    c0,c1,c2,c3,c4,c5,c6,c7,c8 = -0.221,1.270,0.00103,-0.00359,-0.0496,-2.23e-5,0.000619,-2.97e-5,1.51e-5
-    self._pdev.write(('F\n').encode())
+    byteline = self.query(('F\n').encode())
     logging.debug(self._strClassName + ': Sent command F (read Flowrate) to Arduino')
 
     # Read the returned text.  Should return "OK X.XX"
-    byteline = self._pdev.readline()
     strReturnText = byteline.decode()
     #strReturnText = self._pdev.readline() 
-       
+
+    return self.funcFlowRate(strReturnText, fltCoolantTemp)
+
+# ------------------------------------------------------------------------------
+  def funcFlowRate(self, strReturnText, fltCoolantTemp):
+    '''
+      Convert the text returned by the Arduino, "OK X.XX", into the flow rate in
+    liters/minute.  Return -1.00 if the text is not a valid flowmeter reading.
+    '''
+    # Flow rate approximation is as given by: 
+    # F(V,T) = c0+c1V+c2T+c3VT+c4V^2+c5T^2+c6V^2T+c7VT^2+c8V^2T^2  #### ISU Calibration Oct 31, 2018
+    c0,c1,c2,c3,c4,c5,c6,c7,c8 = -0.221,1.270,0.00103,-0.00359,-0.0496,-2.23e-5,0.000619,-2.97e-5,1.51e-5
     if "OK" in strReturnText:
       intIndex = strReturnText.index("K") + 2        # Find end of "OK " in text.
       fltFlowValue = float(strReturnText[intIndex:])  # Convert text value to float.
@@ -160,11 +368,10 @@ class clsArduino (clsDevice):
       Toggles the 3 actuator valves such that the inlet and the outlet to the stave are
       closed and the bypass is open.
     '''
-    self._pdev.write(('R\n'.encode()))
+    byteline = self.query(('R\n'.encode()))
     logging.debug(self._strClassName + ' Sent command R (reset Valves) to Arduino')
     
     # Read the returned text. Should return "OK"
-    byteline = self._pdev.readline()
     strReturnText = byteline.decode()
     if "OK" in strReturnText:
       bolResult = True
@@ -180,11 +387,10 @@ class clsArduino (clsDevice):
       Toggles the 3 actuator valves such that the inlet and the outlet to the stave are
       closed and the bypass is open.
     '''
-    self._pdev.write(('O\n'.encode()))
+    byteline = self.query(('O\n'.encode()))
     logging.debug(self._strClassName + ' Sent command O (reset Valves) to Arduino')
     
     # Read the returned text. Should return "OK"
-    byteline = self._pdev.readline()
     strReturnText = byteline.decode()
     if "OK" in strReturnText:
       bolResult = True
@@ -206,11 +412,10 @@ class clsArduino (clsDevice):
     The value return is boolean: True if operation completed, False if error.
     '''
 
-    self._pdev.write(('V\n').encode())
+    byteline = self.query(('V\n').encode())
     logging.debug(self._strClassName + ' Sent command V (toggle Valves) to Arduino')
 
     # Read the returned text.  Should return "OK" 
-    byteline = self._pdev.readline()
     strReturnText = byteline.decode()
     if "OK" in strReturnText:
       # Update the assumed state of the actuator valves.
@@ -0,0 +1,170 @@
+'''
+  Program ArduinoEmulator.py
+
+Description: ------------------------------------------------------------------
+   This file contains the class construct of an emulated Arduino UNO that
+speaks the same text protocol as the real board (F, V, R, O, S and the
+streaming commands Cnnn and P, see doc/ChillerEquipmentCommunications.txt).
+It sits behind a pseudo terminal, so clsArduino opens it like a serial port
+and the streaming mode can be checked without the board.
+
+   Run it alone to check clsArduino against it:
+     python ArduinoEmulator.py
+test_ArduinoDevice.py runs clsArduino against it.
+
+History: ----------------------------------------------------------------------
+   V1.0 - Oct-2026  First release.
+   V1.1 - Oct-2026  bolStreaming=False emulates a sketch without streaming mode.
+
+Environment: ------------------------------------------------------------------
+   This program is written in Python 3.8.  Python can be freely downloaded
+from http://www.python.org/.  Pseudo terminals (module pty) exist on Linux and
+mac only, this program does not run on Windows.
+
+Author List: -------------------------------------------------------------------
+  R. McKay    Iowa State University, USA  mckay@iastate.edu
+  J. Yu       Iowa State University, USA  jieyu@iastate.edu
+  W. Heidorn  Iowa State University, USA  wheidorn@iastate.edu
+
+Notes: -------------------------------------------------------------------------
+   Valve states start as on the board after power up: bypass open, in and out
+closed.
+
+Dictionary of abbreviations: ---------------------------------------------------
+  bol - boolean
+  cls - class
+  evt - event
+  flt - float
+  int - integer
+  lst - list
+  str - string
+'''
+
+# Import section --------------------------------------------------------------
+
+import os
+import pty
+import tty
+import time
+import random
+import threading
+
+# ------------------------------------------------------------------------------
+class clsArduinoEmulator:
+  def __init__(self, fltVoltage=1.0, fltNoise=0.02, bolStreaming=True):
+    '''
+      Open a pseudo terminal.  The flowmeter voltage is fltVoltage plus a
+    uniform noise of +- fltNoise.  With bolStreaming False it is an older
+    sketch: Cnnn and P get no answer.
+    '''
+    self.fltVoltage = fltVoltage
+    self.fltNoise = fltNoise
+    self.bolStreaming = bolStreaming
+    self._intMaster, intSlave = pty.openpty()
+    tty.setraw(intSlave)
+    self.strPort = os.ttyname(intSlave)  # pass this to clsArduino as strPort
+    self._intSlave = intSlave
+    self._lstValves = ['Open', 'Close', 'Close']   # bypass, in, out
+    self._fltPeriod = 0.                           # streaming period, 0 = off
+    self._lock = threading.Lock()                  # one line written at a time
+    self._evtStop = threading.Event()
+    self._lstThreads = [threading.Thread(target=self._serve, daemon=True),
+                        threading.Thread(target=self._stream, daemon=True)]
+    for thread in self._lstThreads:
+      thread.start()
+
+  def close(self):
+    self._evtStop.set()
+
+  def valves(self):
+    '''
+      States of the valves: bypass, in, out.
+    '''
+    return list(self._lstValves)
+
+  def voltage(self):
+    return self.fltVoltage + self.fltNoise * (2 * random.random() - 1)
+
+  def _write(self, strLine):
+    with self._lock:
+      os.write(self._intMaster, (strLine + '\n').encode())
+
+  def _serve(self):
+    '''
+      Answer the commands, one per line.
+    '''
+    bytesBuf = b''
+    while not self._evtStop.is_set():
+      try:
+        bytesBuf += os.read(self._intMaster, 256)
+      except OSError:
+        break
+      while b'\n' in bytesBuf:
+        bytesLine, bytesBuf = bytesBuf.split(b'\n', 1)
+        strReply = self._reply(bytesLine.decode().strip())
+        if strReply is not None:
+          self._write(strReply)
+
+  def _reply(self, strCmd):
+    '''
+      Answer of a command, None for no answer.
+    '''
+    if not self.bolStreaming and (strCmd == 'P' or strCmd[:1] == 'C'):
+      return None                          # unknown to an older sketch
+    if strCmd == 'F':
+      return 'OK {:.2f}'.format(self.voltage())
+    elif strCmd == 'V':
+      self._lstValves = ['Close' if strState == 'Open' else 'Open' for strState in self._lstValves]
+      return 'OK'
+    elif strCmd == 'R':
+      self._lstValves = ['Open', 'Close', 'Close']
+      return 'OK'
+    elif strCmd == 'O':
+      self._lstValves = ['Open', 'Open', 'Open']
+      return 'OK'
+    elif strCmd == 'S':
+      return 'OK Bypass:{:5s} In:{:5s} Out:{:5s}'.format(*self._lstValves)
+    elif strCmd[:1] == 'C' and strCmd[1:].isdigit() and int(strCmd[1:]) > 0:
+      self._fltPeriod = int(strCmd[1:]) / 1000.
+      return 'OK'
+    elif strCmd == 'P':
+      self._fltPeriod = 0.
+      return 'OK'
+    return 'ERR ' + strCmd
+
+  def _stream(self):
+    '''
+      Send "D x.xx" every period while streaming is on.
+    '''
+    while not self._evtStop.is_set():
+      if self._fltPeriod > 0:
+        self._write('D {:.2f}'.format(self.voltage()))
+        time.sleep(self._fltPeriod)
+      else:
+        time.sleep(0.01)
+
+
+if __name__ == '__main__':
+
+  import logging
+  from ArduinoDevice import clsArduino
+
+  logging.basicConfig(level=logging.INFO)
+  istEmulator = clsArduinoEmulator(fltVoltage=1.2)
+  istArduino = clsArduino('Arduino', istEmulator.strPort, 9600)
+  fltTemps = [20., 20., 20., 20., 20., 20., 20., 20.]
+
+  fltStart = time.time()
+  istArduino.read('F', '', [fltTemps, []])
+  print('polled   flow {:.3f} l/min in {:.3f} s'.format(istArduino.last(), time.time() - fltStart))
+
+  istArduino.read('C50', '', [fltTemps, []])
+  time.sleep(1.)
+  fltStart = time.time()
+  istArduino.read('F', '', [fltTemps, []])
+  print('streamed flow {:.3f} l/min in {:.1f} us'.format(istArduino.last(), 1e6 * (time.time() - fltStart)))
+  istArduino.read('V', '', [fltTemps, []])
+  print('toggle while streaming:', istArduino.last())
+  istArduino.read('P', '', [fltTemps, []])
+  print('stopped streaming:', istArduino.last())
+  istEmulator.close()
@@ -0,0 +1,340 @@
+'''
+  Program ChillerCommandBus.py
+
+Description: ------------------------------------------------------------------
+   This file contains the command bus of the chiller control.  Every device has
+one actor, a thread in the process owning the device, which sends the commands
+to the device one at a time.  Commands wait in a priority queue:
+
+     EMERGENCY < STOP < SETPOINT < COMMAND < POLL
+
+so stop and set point commands go before the routine polls waiting with them.
+EMERGENCY is the emergency stop: eshutdown (ChillerCtrl.py) calls cStop and
+iStop with it from the console, and the chiller and pump loops send their last
+stop with it on a FATAL status.  funcPriority() never gives it.
+A set point command (with '=') replaces the same one still waiting, e.g. two
+quick  tset  only send the last temperature; both callers get its result.
+A command already being sent is not interrupted, a serial exchange cannot be.
+
+   The owning process submits through the actor (clsChillerRun.sendcommand).
+Any other process, or a client started by hand, calls
+
+     istResult = funcCall('Arduino', 'aRPS?')
+
+which connects to the actor (multiprocessing.connection, a named pipe on
+Windows, a unix socket elsewhere) and returns a clsCommandResult:
+(command, ok, value, error, latency in seconds).
+
+History: ----------------------------------------------------------------------
+   V1.0 - Oct-2026  First release.
+
+Environment: ------------------------------------------------------------------
+   This program is written in Python 3.8.  Python can be freely downloaded
+from http://www.python.org/.  This program has been tested on PCs running
+Windows 10.
+
+Author List: -------------------------------------------------------------------
+  R. McKay    Iowa State University, USA  mckay@iastate.edu
+  J. Yu       Iowa State University, USA  jieyu@iastate.edu
+  W. Heidorn  Iowa State University, USA  wheidorn@iastate.edu
+
+Notes: -------------------------------------------------------------------------
+   funcBusSetup() in ChillerCtrl.py gives the run a bus id and an authentication
+key through environment variables, the processes inherit them.  The address of
+an actor is made of the bus id and the device name.  Without the variables the
+actors are local to their process only.
+   An actor is started by the first command its process sends to the device.
+
+Dictionary of abbreviations: ---------------------------------------------------
+  bol - boolean
+  cls - class
+  cmd - command
+  dict - dictionary
+  evt - event
+  flt - float
+  func - function
+  int - integer
+  ist - instance
+  lst - list
+  str - string
+'''
+
+# Import section --------------------------------------------------------------
+
+import os
+import sys
+import glob
+import time
+import heapq
+import atexit
+import logging
+import tempfile
+import threading
+import collections
+from enum import IntEnum
+from multiprocessing.connection import Listener, Client
+
+strBusIdEnv = 'CHILLER_BUS_ID'      # id of the run, part of the actor addresses
+strBusKeyEnv = 'CHILLER_BUS_KEY'    # authentication key of the connections (hex)
+strFamily = 'AF_PIPE' if sys.platform == 'win32' else 'AF_UNIX'
+
+# Result of a command: command sent, True if sent, device value (last()) after it,
+# error text, seconds from submit to result.
+clsCommandResult = collections.namedtuple('clsCommandResult', ['command', 'ok', 'value', 'error', 'latency'])
+
+_dictActors = {}                    # actors of this process, by device name
+_lockActors = threading.Lock()
+
+# ------------------------------------------------------------------------------
+class Priority(IntEnum):
+  EMERGENCY = 0
+  STOP      = 1
+  SETPOINT  = 2
+  COMMAND   = 3
+  POLL      = 4
+
+# ------------------------------------------------------------------------------
+def funcPriority(strUserCommand):
+  '''
+    Default priority of a command, e.g. cStop, cChangeSetpoint=20, aRPS?.
+  '''
+  strName = strUserCommand[1:].split('=')[0]
+  if 'Stop' in strName:
+    return Priority.STOP
+  if '=' in strUserCommand:
+    return Priority.SETPOINT
+  if strName.endswith('?') or strName == 'Read':
+    return Priority.POLL
+  return Priority.COMMAND
+
+# ------------------------------------------------------------------------------
+def funcAddress(strDevName, strBusId=None):
+  '''
+    Address of the actor of a device, None without a bus id.
+  '''
+  strBusId = strBusId or os.environ.get(strBusIdEnv)
+  if not strBusId:
+    return None
+  if strFamily == 'AF_PIPE':
+    return r'\\.\pipe\ChillerBus-' + strBusId + '-' + strDevName
+  return os.path.join(tempfile.gettempdir(), 'ChillerBus-' + strBusId + '-' + strDevName)
+
+def _funcAuthKey():
+  return bytes.fromhex(os.environ.get(strBusKeyEnv, ''))
+
+# ------------------------------------------------------------------------------
+def funcBusSetup():
+  '''
+    Called once by the main program before the processes start: bus id and key
+  for all of them, and removal of the unix sockets at exit.
+  '''
+  os.environ[strBusIdEnv] = str(os.getpid())
+  os.environ[strBusKeyEnv] = os.urandom(16).hex()
+  if strFamily == 'AF_UNIX':
+    atexit.register(_funcRemoveSockets, funcAddress('*'))
+
+def _funcRemoveSockets(strPattern):
+  '''
+    Close the actors of this process, then remove the sockets left by the
+  processes that were terminated.
+  '''
+  for istActor in list(_dictActors.values()):
+    istActor.close()
+  for strFile in glob.glob(strPattern):
+    try:
+      os.remove(strFile)
+    except OSError:
+      pass
+
+# ------------------------------------------------------------------------------
+class clsRequest:
+  '''
+    A submitted command, result() waits for its clsCommandResult.
+  '''
+  def __init__(self, strCommand):
+    self.strCommand = strCommand
+    self._fltSubmit = time.time()
+    self._evtDone = threading.Event()
+    self._istResult = None
+
+  def _set(self, strCommand, bolOK, value, strError):
+    self._istResult = clsCommandResult(strCommand, bolOK, value, strError, time.time() - self._fltSubmit)
+    self._evtDone.set()
+
+  def result(self, fltTimeout=None):
+    if not self._evtDone.wait(fltTimeout):
+      return clsCommandResult(self.strCommand, False, None, 'timeout', time.time() - self._fltSubmit)
+    return self._istResult
+
+# ------------------------------------------------------------------------------
+class _clsPending:
+  '''
+    Command waiting in the queue of an actor, with all the requests it answers.
+  '''
+  def __init__(self, strCommand, funcExecute, istRequest):
+    self.strCommand = strCommand
+    self.funcExecute = funcExecute
+    self.lstRequests = [istRequest]
+
+# ------------------------------------------------------------------------------
+# Class Device Actor -----------------------------------------------------------
+class clsDeviceActor:
+  def __init__(self, strDevName, funcExecute, strAddress=None):
+    '''
+      funcExecute(strUserCommand) sends one command to the device and returns
+    its value, it raises on failure.  With strAddress the actor also accepts
+    commands from other processes.
+    '''
+    self.strDevName = strDevName
+    self._funcExecute = funcExecute
+    self._lstHeap = []                    # [priority, sequence, _clsPending]
+    self._dictSetpoints = {}              # set point command name -> _clsPending waiting
+    self._intSeq = 0
+    self._cond = threading.Condition()
+    self._istListener = None
+    threading.Thread(target=self._serve, name='Actor ' + strDevName, daemon=True).start()
+    if strAddress is not None:
+      if strFamily == 'AF_UNIX' and os.path.exists(strAddress):
+        os.remove(strAddress)             # left by a killed process of this run
+      self._istListener = Listener(strAddress, strFamily, authkey=_funcAuthKey())
+      threading.Thread(target=self._accept, name='Bus ' + strDevName, daemon=True).start()
+
+  def submit(self, strCommand, intPriority=None, funcExecute=None):
+    '''
+      Queue a command, return its clsRequest.
+    '''
+    intPriority = funcPriority(strCommand) if intPriority is None else intPriority
+    istRequest = clsRequest(strCommand)
+    with self._cond:
+      strKey = strCommand.split('=')[0]
+      if '=' in strCommand and strKey in self._dictSetpoints:
+        istPending = self._dictSetpoints[strKey]        # coalesce: send only the newest value
+        istPending.strCommand = strCommand
+        istPending.funcExecute = funcExecute or istPending.funcExecute
+        istPending.lstRequests.append(istRequest)
+        return istRequest
+      istPending = _clsPending(strCommand, funcExecute or self._funcExecute, istRequest)
+      if '=' in strCommand:
+        self._dictSetpoints[strKey] = istPending
+      self._intSeq += 1
+      heapq.heappush(self._lstHeap, [int(intPriority), self._intSeq, istPending])
+      self._cond.notify()
+    return istRequest
+
+  def call(self, strCommand, intPriority=None, funcExecute=None, fltTimeout=None):
+    '''
+      Submit and wait for the clsCommandResult.
+    '''
+    return self.submit(strCommand, intPriority, funcExecute).result(fltTimeout)
+
+  def close(self):
+    '''
+      Stop accepting commands from other processes.
+    '''
+    istListener, self._istListener = self._istListener, None
+    if istListener is not None:
+      istListener.close()
+
+  def pending(self):
+    with self._cond:
+      return [(Priority(intPriority).name, istPending.strCommand) for intPriority, intSeq, istPending in sorted(self._lstHeap)]
+
+  def _serve(self):
+    '''
+      Send the waiting commands to the device, highest priority first.
+    '''
+    while True:
+      with self._cond:
+        while not self._lstHeap:
+          self._cond.wait()
+        intPriority, intSeq, istPending = heapq.heappop(self._lstHeap)
+        strKey = istPending.strCommand.split('=')[0]
+        if self._dictSetpoints.get(strKey) is istPending:
+          del self._dictSetpoints[strKey]
+        strCommand, funcExecute = istPending.strCommand, istPending.funcExecute
+      try:
+        value, bolOK, strError = funcExecute(strCommand), True, ''
+      except Exception as err:
+        value, bolOK, strError = None, False, str(err) or type(err).__name__
+      for istRequest in istPending.lstRequests:
+        istRequest._set(strCommand, bolOK, value, strError)
+
+  def _accept(self):
+    while True:
+      try:
+        istConn = self._istListener.accept()
+      except OSError:                      # authentication failed or listener closed
+        if self._istListener is None:
+          return
+        continue
+      threading.Thread(target=self._client, args=(istConn,), daemon=True).start()
+
+  def _client(self, istConn):
+    '''
+      Requests (command, priority, timeout) of one connection, answered in order.
+    '''
+    with istConn:
+      while True:
+        try:
+          strCommand, intPriority, fltTimeout = istConn.recv()
+        except (EOFError, OSError):
+          return
+        istConn.send(tuple(self.call(strCommand, intPriority, fltTimeout=fltTimeout)))
+
+# ------------------------------------------------------------------------------
+def funcActor(strDevName, funcExecute):
+  '''
+    The actor of a device owned by this process, started on the first call.
+  '''
+  with _lockActors:
+    if strDevName not in _dictActors:
+      _dictActors[strDevName] = clsDeviceActor(strDevName, funcExecute, funcAddress(strDevName))
+      logging.debug(' Command bus: actor of ' + strDevName + ' started.')
+    return _dictActors[strDevName]
+
+# ------------------------------------------------------------------------------
+def funcCall(strDevName, strCommand, intPriority=Priority.COMMAND, fltTimeout=10.):
+  '''
+    Send a command to a device from any process, return its clsCommandResult.
+  '''
+  fltStart = time.time()
+  if strDevName in _dictActors:            # the device is in this process
+    return _dictActors[strDevName].call(strCommand, intPriority, fltTimeout=fltTimeout)
+  strAddress = funcAddress(strDevName)
+  if strAddress is None:
+    return clsCommandResult(strCommand, False, None, 'no command bus', 0.)
+  while True:                              # the actor starts with its process' first command
+    try:
+      with Client(strAddress, strFamily, authkey=_funcAuthKey()) as istConn:
+        istConn.send((strCommand, int(intPriority), fltTimeout))
+        return clsCommandResult(*istConn.recv())
+    except (OSError, EOFError) as err:
+      if time.time() - fltStart > fltTimeout:
+        return clsCommandResult(strCommand, False, None, strDevName + ' not reachable: ' + str(err), time.time() - fltStart)
+      time.sleep(0.1)
+
+
+if __name__ == '__main__':
+
+  # A slow fake device: 30 polls queued, then a stop, two set points and a
+  # call from a second process.
+  import multiprocessing as mp
+
+  def funcSlowDevice(strCommand):
+    time.sleep(0.05)
+    return strCommand
+
+  funcBusSetup()
+  istActor = funcActor('Chiller', funcSlowDevice)
+  lstPolls = [istActor.submit('cPollCycle?') for i in range(30)]
+  istSet1 = istActor.submit('cChangeSetpoint=-20')
+  istSet2 = istActor.submit('cChangeSetpoint=-40')
+  istStop = istActor.submit('cStop')
+  print('queue:', istActor.pending()[:4], '...')
+  print('stop     :', istStop.result())
+  print('setpoint :', istSet1.result(), istSet2.result().latency)
+  print('last poll:', lstPolls[-1].result().latency)
+
+  mp.set_start_method('spawn')
+  with mp.Pool(1) as istPool:
+    print('other process:', istPool.apply(funcCall, ('Chiller', 'cTemp?')))
@@ -39,9 +39,34 @@ History: ----------------------------------------------------------------------
 				   Updated comments and modified screen messages to operater.
   V2.1 - Sep-2018  Replaced Omega HH147U with Omega HH109A.
   V2.2 - Oct-2018  Added auto flow control.
+  V2.3 - Oct-2026  Added --runtime=threads to run all routines as threads of one
+                   process (see ChillerRuntime.py).
+  V2.4 - Oct-2026  fltTemps, fltRPS, fltLPM and intSettings in one versioned shared
+                   memory block (see ChillerSharedState.py).
+  V2.5 - Oct-2026  Configuration and command files compiled once here, the processes
+                   load them from the cache (see ChillerRdConfig.funcCompiled).
+  V2.6 - Oct-2026  Added --profile-startup.  Device drivers, pseudo devices and email
+                   are imported only by the processes using them.
+  V2.7 - Oct-2026  Device commands go through one actor per device (command bus,
+                   see ChillerCommandBus.py).  fr reads the Arduino through it.
+  V2.8 - Oct-2026  info prints the latency, retries and failures of the device
+                   commands (see ChillerMetrics.py).
+  V2.9 - Oct-2026  Added --metrics-port, the live state in OpenMetrics format on
+                   http://127.0.0.1:PORT/metrics (see ChillerMetricsServer.py).
+  V2.10 - Oct-2026 The last hours of fltTemps, fltHumidity, fltRPS and fltLPM kept
+                   in the shared memory block, fltHumidity now one of its arrays.
+  V2.11 - Oct-2026 Measurements recorded in binary run files next to the log
+                   (see ChillerRecorder.py).
+  V2.12 - Oct-2026 Compact messages on the logging queue (ChillerLogQueue.py),
+                   info prints its depth and throughput.
+  V2.13 - Oct-2026 eshutdown sends the chiller and pump stops at once, ahead of the
+                   commands waiting on the command bus.
 Environment: ------------------------------------------------------------------
-	This program is written in Python 3.6.  Python can be freely downloaded from 
-http://www.python.org/.  This program has been tested on PCs running Windows 10.
+	This program is written in Python 3.8.  Python can be freely downloaded from 
+http://www.python.org/.  The shared memory block of the processes and the command
+statistics (ChillerSharedState.py, ChillerMetrics.py) need the module
+multiprocessing.shared_memory of Python 3.8 or newer.  This program has been
+tested on PCs running Windows 10.
 
 Author List: -------------------------------------------------------------------
 	R. McKay    Iowa State University, USA  mckay@iastate.edu
@@ -60,6 +85,14 @@ Notes: -------------------------------------------------------------------------
    the case of the chiller issueing a low fluid error condition.  The program
    will issue a critical shutdown for such a case.
 
+   Start with  python ChillerCtrl.py --runtime=threads  to run the routines as
+   threads of this one process instead of 8 spawned processes.  Everything else
+   (watchdog, user commands, log file) works the same.
+
+   python ChillerCtrl.py --profile-startup  logs for each process the time from
+   its start to its modules imported, its devices initialized and its first
+   device reply (lines starting with <STARTUP>).
+
 Dictionary of abbreviations: ---------------------------------------------------
 	bol - boolean
 	cmd - command
@@ -78,13 +111,23 @@ Dictionary of abbreviations: ---------------------------------------------------
 import logging                 # logging:             https://docs.python.org/3.6/howto/logging.html
 import sys                     # system specific:     https://docs.python.org/3.6/library/sys.html
 import time                    # Time access:         https://docs.python.org/3.6/library/time.html
+fltImportStart = time.time()   # Startup profile: imports of this module start here.
+import os                      # Environment passed to the processes: https://docs.python.org/3.6/library/os.html
 from datetime import datetime, timedelta  # Date and time types: https://docs.python.org/3.6/library/datetime.html
-from multiprocessing import Process, Value, Array   # https://docs.python.org/3.6/library/multiprocessing.html
+from multiprocessing import Process   # https://docs.python.org/3.6/library/multiprocessing.html
 import multiprocessing as mp          # Multiprocessing threading interface.
+import argparse                       # Command line options: https://docs.python.org/3.6/library/argparse.html
 from functools import total_ordering  # Allow to define rich comparison. i.e. __lt__().
 
 # User defined classes
 from ChillerRun import *     # This is our own code. States what each process does.
+from ChillerRuntime import funcRuntime, lstRuntimes  # Processes or threads.
+from ChillerRuntime import funcStartupReport, strProfileEnv, strStartEnv  # Startup profile.
+from ChillerSharedState import clsSharedState        # Shared arrays with seq. numbers & times.
+from ChillerCommandBus import funcBusSetup, funcCall, Priority  # Device commands from any process.
+from ChillerMetrics import funcMetricsSetup, funcMetrics  # Command latency & retry statistics.
+from ChillerRecorder import funcRecorderSetup             # Binary run files of the measurements.
+fltImportEnd = time.time()   # Startup profile: imports of this module done.
 
 # Global data section ----------------------------------------------------------
 
@@ -161,10 +204,12 @@ def procUserCommands(intStatusCode, intProcessStates, intSettings, fltTemps, flt
     help      - Prints to the screen the list of valid commands shown below.
     shutdown  - Sets the global status code to ERROR. This means the chiller & booster pump
                  will go through a normal shutdown. i.e. return coolant to room temperature.
-    eshutdown - Sets the global status code to FATAL. This means the chiller and
-                 pump will go through the shutdown commands and the system will shutdown 
-                 without returning the coolant to room temperature.
-    info      - Prints to the screen the current: code status, loop progress, temperatures.
+    eshutdown - Sets the global status code to FATAL and sends the chiller and pump
+                 stops at once, ahead of the commands waiting for the devices (EMERGENCY
+                 priority).  The system will shutdown without returning the coolant to
+                 room temperature.
+    info      - Prints to the screen the current: code status, loop progress, temperatures
+                 and the latency, retries and failures of the commands sent to each device.
     tav       - Toggle the 3 actuator valves located at the coolant I/O end of the stave.
                  Each time this command is issued, the 3 actuators flip to one of two states.
     tset      - Change the set temperature of coolant in chiller.
@@ -185,7 +230,8 @@ def procUserCommands(intStatusCode, intProcessStates, intSettings, fltTemps, flt
   cmdList = f''' Command list:
     info      = Shows: Current progress of the preprogrammed loop,
                        Current status of all running processes,
-                       last temp, humidity, and set temp values.
+                       last temp, humidity, and set temp values,
+                       command latency, retries and failures per device.
     kill      = Stops all processes, does not shutdown pump or chiller.
     pkill     = Kills a process.
     eshutdown = Stops the chiller and then pump without temperature change.
@@ -207,6 +253,13 @@ def procUserCommands(intStatusCode, intProcessStates, intSettings, fltTemps, flt
     if 'help' in strVal:
         print(cmdList)
       
+    elif 'eshutdown' in strVal:                # Emergency shutdown: FATAL, and the
+        intStatusCode.value = StatusCode.FATAL #  stops before any waiting command.
+        for strDevName, strCommand in (('Chiller', 'cStop'), ('Pump', 'iStop')):
+          istResult = funcCall(strDevName, strCommand, Priority.EMERGENCY)
+          if not istResult.ok:
+            print(f"\n {strDevName} stop not sent: {istResult.error}")
+            logging.error(f" Emergency stop of the {strDevName} not sent: {istResult.error}")
     elif 'shutdown' in strVal:                 # Find shutdown in input,
         intStatusCode.value = StatusCode.SHUTDOWN #  normal shutdown.
     elif 'abort' in strVal:
@@ -252,6 +305,20 @@ def procUserCommands(intStatusCode, intProcessStates, intSettings, fltTemps, flt
       print(" Pump Set: " + str(fltRPS[0])+ " rps")
       print(" Flow Set: " + str(fltLPM[0])+ " l/min")
       print(" FlowRate: " + str(round(fltRPS[1],3))+ " l/min")
+      print("\n Last 10 minutes     mean      min      max  slope/min")
+      for strName, fltChannel, i in [("TRes", fltTemps, 1), ("Tin ", fltTemps, 2), ("Tout", fltTemps, 3), \
+                                     ("Humidity", fltHumidity, 0), ("FlowRate", fltLPM, 1)]:
+        istWindow = fltChannel.window(i, 600)
+        if istWindow.count:
+          strSlope = f"{60 * istWindow.slope:9.3f}" if istWindow.slope is not None else "        -"
+          print(f"     {strName:9s} {istWindow.mean:8.2f} {istWindow.min:8.2f} {istWindow.max:8.2f} {strSlope}")
+      if funcMetrics() is not None:
+        print("\n Device Commands")
+        for strLine in funcMetrics().table():
+          print("     " + strLine)
+        dictQueue = funcMetrics().queuestats()
+        print(f"\n Log Queue  {dictQueue['depth']} waiting (max {dictQueue['max_depth']}), "
+              f"{dictQueue['messages']} messages, {dictQueue['bytes']} bytes, {dictQueue['rate']:.0f} bytes/s")
 
     elif 'tav' in strVal:                       # Found actuator valve toggle command.
       print(f"Actuator valves switched to other state.")
@@ -342,8 +409,11 @@ def procUserCommands(intStatusCode, intProcessStates, intSettings, fltTemps, flt
       intProcessStates[intProcessVal] = ProcessState.OK
       
     elif strVal == 'fr':
-      fltFlowRate = 3.21
-      print(f"\n Flow rate = {fltFlowRate} l/m");
+      istResult = funcCall('Arduino', 'aRPS?')    # Waits behind a stop or set point, not the polls.
+      if istResult.ok:
+        print(f"\n Flow rate = {istResult.value:.2f} l/m  ({istResult.latency:.1f} s)")
+      else:
+        print(f"\n Flow rate not read: {istResult.error}")
         
     elif strVal== '':
       i = 0  # Do nothing.  User just hit enter with no text.
@@ -458,26 +528,39 @@ def stopRun(mpList=[]):
 # ------------------------------------------------------------------------------
 # ---------------------------- MAIN ROUTINE ------------------------------------
 # ------------------------------------------------------------------------------
-def main():
+def main(strRuntime='processes', intMetricsPort=None):
   '''
     Main routine for controlling the thermo evaluation of ATLAS staves.  All 
     devices controlling the coolant system and devices monitoring the temperature
     and humidity are separate process.  Here these processes are started and at the
     end of the evaluation OR if the user commands a shutdown, stopped.  It all starts
     with asking the user a few questions about the intended mode of operation.
+    strRuntime = 'threads' runs them as threads of this process instead.
+    intMetricsPort serves the live state to the monitoring (None: no server).
   '''
+  # Queue, shared Value & Array and process class of the chosen runtime.
+  clsQueue, Value, Array, clsProcess = funcRuntime(strRuntime)
   
   # Generate name of log File and define the log file format.  
   # %Y = year, %m = month, %d = day, %I = 12 hour clock, %M = minute, %S = seconds, %p = AM|PM.
   strLogFilename = str(time.strftime('%Y-%m-%d_%I-%M%p_',time.localtime())) + 'ChillerRun.log'
-  logging.basicConfig(filename = strLogFilename, level = intLoggingLevel, \
-                        format = '%(asctime)s %(levelname)s: %(message)s', \
-                       datefmt = '%m/%d/%Y %I:%M:%S %p')
+  if strRuntime == 'threads':
+    # One process: the Listener thread writes the log file, main logs through its queue.
+    queue = clsQueue(-1)
+    clsChillerRun.funcLoggingConfig(queue, intLoggingLevel)
+  else:
+    logging.basicConfig(filename = strLogFilename, level = intLoggingLevel, \
+                          format = '%(asctime)s %(levelname)s: %(message)s', \
+                         datefmt = '%m/%d/%Y %I:%M:%S %p')
                        
   # Print code version info to the log file.
+  funcStartupReport('imported', fltImportEnd, fltImportStart)
   logging.info('Python version: ' + gblstrPyVersion)
   logging.info('Chiller Control Code version: ' + gblstrCodeVersion + '\n')
 
+  # Each process records the channels it writes to <log name>.<process>.chr
+  funcRecorderSetup(strLogFilename[:-len('.log')])
+
   banner(strLogFilename)  # Splash banner page on screen.
 
   # Ask the user questions about conditions to run the system.  Should the user
@@ -508,74 +591,113 @@ def main():
     elif strVal.lower() == 'q':  # User chose to quit now.
       stopRun()      
 
+  # Parse the configuration and command files once (or take them from the cache when the
+  # files did not change since the last run).  The processes load the compiled files.
+  funcConfig('ChillerConnectConfig.txt')
+  istRunCfg = funcConfig('ChillerRunConfig.txt')
+  istCommands = funcCommands('ChillerEquipmentCommands.txt')
+
+  # Command statistics, one region per device with a slot per command of the device.
+  lstDevNames = [strDevName for strDevName in istCommands.devicenames() if strDevName != 'ShortName']
+  funcMetricsSetup(lstDevNames, max(len(istCommands.devicekeys(strDevName)) for strDevName in lstDevNames), strRuntime)
+
   # Define the multiprocessing shared global data.  Value & Array memory require a typecode for the
   # data held in the shared data structure.  'i' = signed integer, 'd' = double precision float.
-  queue = mp.Queue(-1)                      # This must be set for the logger to work. VERY IMPORTANT.
+  if strRuntime != 'threads':
+    queue = clsQueue(-1)                    # This must be set for the logger to work. VERY IMPORTANT.
   intStatusCode = Value('i',StatusCode.OK)  # Start Status of the system.
   # Must set a starting status for each process created later.  Assume all is OK.
   intOK = ProcessState.OK   # Just to condense the shared intProcessStates list statement.
   #   Current process are: [listener, temp, humidity, chiller, bst pump, Arduino, routine]
   intProcessStates = Array('i',[ intOK,intOK,intOK,intOK,intOK,intOK,intOK])
 
-  intSettings = Array('i',[SysSettings.BOOT,False,False,0])  #  intSettings[0] = Current system setting
+  # History of the channels: Hours of rows, one per Resolution seconds at most.
+  try:
+    fltHistoryHours, fltResolution = istRunCfg.getfloat('History', 'Hours'), istRunCfg.getfloat('History', 'Resolution')
+  except ValueError:
+    logging.warning(' Section: History not found! Using 4 hours, 1 s.')
+    fltHistoryHours, fltResolution = 4., 1.
+  tupHistory = (max(1, int(fltHistoryHours * 3600 / fltResolution)), fltResolution)
+
+  # The arrays below are one shared memory block.  Each element also holds the number and
+  # time of its updates, e.g. fltLPM.sample(1) = (value, seq, time) of the flow rate, and the
+  # float arrays their history, e.g. fltTemps.window(1, 600) = TRes mean, min, max, slope
+  # over the last 10 minutes.
+  istState = clsSharedState([('intSettings', 'i', [SysSettings.BOOT,False,False,0]), \
+                             ('fltTemps',    'd', [20,20,20,20,20,20,20,20]), \
+                             ('fltHumidity', 'd', [100]), \
+                             ('fltRPS',      'd', [10,10]), \
+                             ('fltLPM',      'd', [0.5,0])], strRuntime, \
+                            dictHistory = {'fltTemps': tupHistory, 'fltHumidity': tupHistory, \
+                                           'fltRPS': tupHistory, 'fltLPM': tupHistory})
+
+  intSettings = istState.intSettings                         #  intSettings[0] = Current system setting
                                                              #  intSettings[1] = Need to change TSet?
                                                              #  intSettings[2] = Need to change PSet?
                                                              #  intSettings[3] = Valve Setting? Starts in bypass mode
 
-  fltTemps = Array('d',[20,20,20,20,20,20,20,20]) # Set temperature values at room temperature: 
+  fltTemps = istState.fltTemps                    # Set temperature values at room temperature: 
                                                   #   fltTemps[0]   = Chiller SetTempValue,
                                                   #   fltTemps[1]   = Chiller TempValue
                                                   #   fltTemps[2-5] = Temperature Recorder Temps,
                                                   #   fltTemps[6-7] = Humidity Logger Temps
-  fltHumidity = Value('d',100)             # Start humidity value of 100%.
-  fltRPS = Array('d',[10,10])                     #   fltRPS[0]   = Booster Pump Set Value rps
+  fltHumidity = istState.fltHumidity             # Start humidity value of 100%, used as a Value.
+  fltRPS = istState.fltRPS                        #   fltRPS[0]   = Booster Pump Set Value rps
                                                   #   fltRPS[1]   = Arduino Flow Rate
-  fltLPM = Array('d',[0.5,0])                # Flow rate settings
+  fltLPM = istState.fltLPM                        # Flow rate settings
                                                   #   fltLPM[0]   = User Set Flow Rate
                                                   #   fltLPM[1]   = Arduino Flow rate
 
   fltProgress = Value('d',0)                      # Start progress value. 0% at beginning.
 
+  if intMetricsPort is not None:                  # Scraped by the monitoring, localhost only.
+    from ChillerMetricsServer import clsMetricsServer, funcExposition
+    try:
+      clsMetricsServer(intMetricsPort, lambda: funcExposition(istState, intStatusCode, intProcessStates, \
+                                                              fltHumidity, fltProgress, funcMetrics()))
+    except OSError as err:                        # e.g. the port is in use: run without the endpoint
+      logging.warning(' Metrics server not started on port ' + str(intMetricsPort) + ': ' + str(err))
+
   mpList = [] # Empty process list to be filled by each process.
 
   # The listener process that allows logging from all processes.
-  mpList.append(mp.Process(target = clsChillerRun.procListener, name = 'Listener', \
+  mpList.append(clsProcess(target = clsChillerRun.procListener, name = 'Listener', \
                              args =(clsChillerRun, queue, intProcessStates, strLogFilename)))
 
   # The Temp Rec process reads temperature data from the Temp Recorder.
-  mpList.append(mp.Process(target = clsChillerRun.recordTemperature, name = 'Temp Rec', \
+  mpList.append(clsProcess(target = clsChillerRun.recordTemperature, name = 'Temp Rec', \
                              args =(clsChillerRun, queue, intStatusCode, intProcessStates, intSettings, fltTemps, \
                                     intLoggingLevel, bolRunPseudo)))
 
   # The Humi Rec process reads humidity data from the Humidity Recorder.
-  mpList.append(mp.Process(target = clsChillerRun.recordHumidity, name = 'Humi Rec', \
+  mpList.append(clsProcess(target = clsChillerRun.recordHumidity, name = 'Humi Rec', \
                              args =(clsChillerRun, queue, intStatusCode, intProcessStates, intSettings, fltTemps, fltHumidity, \
                                     intLoggingLevel, bolRunPseudo)))
 
   # The Arduino process reads the RPS data and changes valve settings.
-  mpList.append(mp.Process(target = clsChillerRun.procArduino, name = 'Arduino ', \
+  mpList.append(clsProcess(target = clsChillerRun.procArduino, name = 'Arduino ', \
                              args =(clsChillerRun,queue,intStatusCode,intProcessStates, intSettings, fltTemps, \
                                     fltRPS, fltLPM, intLoggingLevel, bolRunPseudo)))
 
   # The Chiller  process runs the chiller and reads chiller reservoir temp.
-  mpList.append(mp.Process(target = clsChillerRun.chillerControl, name = 'Chiller ', \
+  mpList.append(clsProcess(target = clsChillerRun.chillerControl, name = 'Chiller ', \
                              args =(clsChillerRun, queue, intStatusCode, intProcessStates, intSettings, fltTemps, \
                                     intLoggingLevel, bolRunPseudo)))
 
   # The Pump process runs the booster pump.
-  mpList.append(mp.Process(target = clsChillerRun.pumpControl, name = 'BstrPump', \
+  mpList.append(clsProcess(target = clsChillerRun.pumpControl, name = 'BstrPump', \
                              args =(clsChillerRun, queue, intStatusCode, intProcessStates, intSettings, \
                                     fltTemps, fltRPS, fltLPM, intLoggingLevel, bolRunPseudo, bolAutoFlow)))
 
   # The Routine process controls the Booster Pump and Chiller
-  mpList.append(mp.Process(target = clsChillerRun.procRoutine, name = 'Routine ', \
+  mpList.append(clsProcess(target = clsChillerRun.procRoutine, name = 'Routine ', \
                              args =(clsChillerRun, queue, intStatusCode, intProcessStates, intSettings, \
                                     fltTemps, fltHumidity, fltRPS, fltLPM, fltProgress, intLoggingLevel, \
                                     bolWaitInput, bolRoutine, bolRunPseudo, bolAutoFlow, gblstrStartTimeVal)))
  
   #The Watchdog process checks that all of the other processes are running
   procShortList = mpList
-  mpList.append(mp.Process(target = clsChillerRun.procWatchDog, name = 'WatchDog', \
+  mpList.append(clsProcess(target = clsChillerRun.procWatchDog, name = 'WatchDog', \
                              args =(clsChillerRun, queue, intStatusCode, intProcessStates, intSettings, fltTemps,\
                     fltHumidity, fltRPS, fltLPM, fltProgress, bolSendEmail,\
                     intLoggingLevel,gblstrStartTime,gblstrStartTimeVal,procShortList)))
@@ -587,8 +709,11 @@ def main():
     print("\n\n  ******************* STARTING PROCESSES *******************")
   print("---------------------------------------------------------------------------")
 
+  funcBusSetup() # Command bus id and key, inherited by the processes
+
   # Splash on the terminal each process info as they are started.    
   for p in mpList: # A loop that starts all of the process with a wait time
+    os.environ[strStartEnv] = repr(time.time()) # Start time for the startup profile
     p.start()
     print(f" Process: {p.name} PID: {p.pid} ALIVE?: {gblstrNoYes[p.is_alive()]}")
     #time.sleep(5) # Necessary to stop things from overlapping while each process starts
@@ -622,7 +747,19 @@ if __name__ == '__main__' :
   # windows. In mac the default method is 'fork' which is not possible on
   # a windows computer.
 
-  mp.set_start_method('spawn') 
-
-  main()
+  istParser = argparse.ArgumentParser(description = 'Chiller control of the ATLAS stave thermal evaluation.')
+  istParser.add_argument('--runtime', choices = lstRuntimes, default = 'processes', \
+                         help = 'run the routines as spawned processes (default) or threads of one process')
+  istParser.add_argument('--profile-startup', action = 'store_true', \
+                         help = 'log the import, initialization and first reply times of each process')
+  istParser.add_argument('--metrics-port', type = int, default = None, metavar = 'PORT', \
+                         help = 'serve the live state in OpenMetrics format on http://127.0.0.1:PORT/metrics')
+  istArgs, lstUnknown = istParser.parse_known_args()
+  if istArgs.profile_startup:
+    os.environ[strProfileEnv] = '1'     # Inherited by all processes.
+
+  if istArgs.runtime == 'processes':
+    mp.set_start_method('spawn') 
+
+  main(istArgs.runtime, istArgs.metrics_port)
 
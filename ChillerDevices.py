@@ -55,10 +55,13 @@ Dictionary of abbreviations: ---------------------------------------------------
 
 # Import section --------------------------------------------------------------
 
-import serial  # https://github.com/pyserial/pyserial, install: pip3.6 install pyserial
 import time
 import logging
+import struct
+from array import array
 from CycRedundCheck import *
+from ChillerFraming import *                   # Frame decoders, one per device protocol.
+from ModbusRTU import *                        # Modbus RTU client for the pump inverter.
 
 # ------------------------------------------------------------------------------
 # Class Device (base) ----------------------------------------------------------
@@ -76,6 +79,8 @@ class clsDevice:
     self._strClassName = ' < Device > '
 
     self._bolOpened = True
+    import serial  # https://github.com/pyserial/pyserial, install: pip3.6 install pyserial
+                   # imported here, pseudo device runs do not need it
     self._pdev = serial.Serial( strPort, intBaud) 
     self._pdev.bytesize = bytesize
     self._pdev.parity = parity
@@ -85,6 +90,10 @@ class clsDevice:
     self._bolOpened = self._pdev.is_open # need to check the device status first
 
     self.strName = strName
+    self.fltTimeout = 2.0         # seconds to wait for the first byte of a response
+    self.fltInterByte = fltInterByteTimeout(intBaud, bytesize, parity, stopbits) # max gap inside a frame
+    self._istDecoder = clsFrameDecoder()  # replaced by the protocol decoder of each device
+    self._bytesRx = bytearray()   # received bytes not yet part of a complete frame
     logging.info('Loading {:20s}'.format( strName ) + ' at port {:6s}'.format( strPort ) + \
                   ' baudrate at {:6d}'.format( intBaud ) + ' status {:b}'.format( self._bolOpened) );
 
@@ -101,6 +110,61 @@ class clsDevice:
     else:
       logging.debug( self._strClassName + ' Sending command ' + strCmdName + ' to device ' + self.strName + " with parameter " + strCmdPara )
 
+  def readframe(self, fltTimeout=None):
+    """
+      function to read one complete response, as found by the frame decoder
+      of the device.  Wait at most fltTimeout seconds for the response to start
+      and at most fltInterByte seconds between two bytes of the response.
+    """
+    if fltTimeout is None:
+      fltTimeout = self.fltTimeout
+    fltStart = time.monotonic()
+    fltPortTimeout = self._pdev.timeout  # restored at the end, a plain read() keeps its own
+    fltPhase = fltPortTimeout            # timeout set on the port, changed once per phase
+    try:
+      while True:
+        tupFrame = self._istDecoder.find( self._bytesRx )
+        if tupFrame is not None:
+          intStart, intEnd = tupFrame
+          byteline = bytes( self._bytesRx[intStart:intEnd] )
+          del self._bytesRx[:intEnd]
+          return byteline
+
+        fltElapsed = time.monotonic() - fltStart
+        if len( self._bytesRx ) == 0:     # waiting for the first byte
+          fltWait = max( 0, fltTimeout - fltElapsed )
+        elif fltElapsed < 2 * fltTimeout: # inside the frame
+          fltWait = self.fltInterByte
+        else:
+          fltWait = None                  # the frame takes too long
+        if fltWait is not None:
+          if fltWait != fltPhase:
+            self._pdev.timeout = fltPhase = fltWait
+          byteData = self._pdev.read( max(1, self._pdev.in_waiting) )
+        else:
+          byteData = b''
+        if len( byteData ) > 0:
+          self._bytesRx += byteData
+        elif len( self._bytesRx ) == 0:
+          raise TimeoutError( self._strClassName + self.strName + ' no response within ' + str(fltTimeout) + ' s' )
+        else:
+          strPartial = self._bytesRx.hex()
+          self._bytesRx.clear()
+          raise ValueError( self._strClassName + self.strName + ' incomplete ' + self._istDecoder.strName + \
+                            ' frame: ' + strPartial )
+    finally:
+      if fltPhase != fltPortTimeout:
+        self._pdev.timeout = fltPortTimeout
+
+  def query(self, byteCommand, fltTimeout=None):
+    """
+      function to send a command and return the complete response frame
+    """
+    self._bytesRx.clear()
+    self._pdev.reset_input_buffer()  # drop what is left from a previous response
+    self._pdev.write( byteCommand )
+    return self.readframe( fltTimeout )
+
   def last(self) :
     """
       function to get the last read out value(s)
@@ -119,9 +183,10 @@ class clsHumidity ( clsDevice ):
     super().__init__(strName, strPort, intBaud, bytesize, parity, stopbits, timeout)
 
     self._strClassName = ' < Humidity > '
+    self._istDecoder = clsStartByteFrame( 10, b'\x02', 'humidity', '>3xHhh' )  # 02 xx xx Hh hh Tt tt Tt tt 03
 
     # keep the last read out value, initialized with 100%
-    self._value = [100, 0, 0]
+    self._value = array('d', [100, 0, 0])
 
   def read(self, strCmdName, strCmdPara="",fltCurrentTemps=[]):
     """
@@ -133,22 +198,25 @@ class clsHumidity ( clsDevice ):
       logging.error( self._strClassName + ' device ' + self.strName + ' is still closed! Return! ' )
       return
 
-    self._pdev.write( (strCmdName + '\r\n').encode() )
-
-    # read 10 bits
-    byteline = self._pdev.read(10)
-    strLine = byteline.hex()
-    logging.debug(' READING current ' + self.strName + ' value: ' + strLine  )
-    humval = int(strLine[6:10], 16) / 10 
-    t1val = int(strLine[10:14],16)/10
-    t2val = int(strLine[14:18],16)/10
+    # read the 10 bytes frame
+    byteline = self.query( (strCmdName + '\r\n').encode() )
+    self._parse( byteline )
 
-    self._value = [humval,t1val,t2val]
-    #logging.info(' READING current ' + self.strName + ' value: {:4.1f}%'.format( humval )  )
-    # TODO: do I need to return the value??
-    #return humval
+  def _parse(self, byteline):
+    """
+      Humidity: decode humidity and the two temperatures into the sample buffer
+    """
+    self._istDecoder.unpack_into( byteline, self._value )
+    if logging.getLogger().isEnabledFor( logging.DEBUG ):
+      logging.debug(' READING current ' + self.strName + ' value: ' + byteline.hex()  )
 
   def last(self) : 
+    return list( self._value )
+
+  def samples(self) :
+    """
+      the sample buffer itself, overwritten by the next read
+    """
     return self._value
 
 
@@ -165,11 +233,12 @@ class clsThermocouple ( clsDevice ):
 
     super().__init__(strName, strPort, intBaud, bytesize, parity, stopbits, timeout) 
     self._intDataPoint =  4 # 4 thermocouple
+    self._istDecoder = clsStartByteFrame( 45, b'\x02', 'thermocouple', '>7x4h' ) # T1..T4 from byte 7
     self._ndataread = ndataread
     if ndataread < 1 :
       self._ndataread = 1
       logging.warning(' Cannot set data points to ' + str( ndataread ) + ' to ' + self.strName + '. Force it to 1.' )
-    self._temperaturedata =  [0 for x in range( self._intDataPoint )]
+    self._temperaturedata =  array('d', [0 for x in range( self._intDataPoint )])
 
 
   def read(self, strCmdName, strCmdPara="",fltCurrentTemps=[]):
@@ -177,35 +246,25 @@ class clsThermocouple ( clsDevice ):
       Thermocouple: function of reading data
     """
     logging.debug(' READING: Sending command ' + strCmdName + ' to device ' + self.strName )
-    self._pdev.write( (strCmdName + '').encode() )
     #should send HEX instead of a string
     #self._pdev.write( bytes.fromhex(strCmdName) )
 
     #print ('Start reading thermocouple reader!!! ' + strCmdName )
     
-    _intTotalBytes = 45
-    byteline = self._pdev.read( _intTotalBytes )
-    strLine = byteline.hex()
- 
-    logging.debug ("got "+ strLine)
-    if strLine[0:2] != '02':
+    byteline = self.query( (strCmdName + '').encode() )
+    self._parse( byteline )
+
+  def _parse(self, byteline):
+    """
+      Thermocouple: convert the response into the four temperatures
+    """
+    if byteline[0] != 0x02:
       logging.warning('Thermocouple returned bad response')
       raise Exception("THERMO HAD BAD RESPONSE")
-    else:
-      strDataHex = strLine[14:30]
-    logging.debug ("data in hex: "+strDataHex)
-    strT1sgn = 1
-    Temps = [0,0,0,0]
-    offset = 0
-    for i in range(len(Temps)):
-      Temps[i]= int(strDataHex[0+offset:4+offset],16)/10
-      offset +=4
-      logging.debug(Temps[i])
-      if Temps[i] > 3276.8: #Twos complement for negatives... ugh
-        Temps[i] = Temps[i]-6553.6
-
-    logging.debug("converted: "+str(Temps))
-    self._temperaturedata = Temps
+    # signed 16 bit values in tenth of degree, no two's complement fixup needed
+    self._istDecoder.unpack_into( byteline, self._temperaturedata )
+    if logging.getLogger().isEnabledFor( logging.DEBUG ):
+      logging.debug("got " + byteline.hex() + " converted: " + str(list(self._temperaturedata)))
 
   def last(self, lineIdx = 0) :
     """
@@ -214,7 +273,21 @@ class clsThermocouple ( clsDevice ):
     """
     return tuple( self._temperaturedata )
 
+  def samples(self) :
+    """
+      the sample buffer itself, overwritten by the next read
+    """
+    return self._temperaturedata
 
+# ------------------------------------------------------------------------------
+# Queries of the chiller poll cycle and the code of their reply, e.g.
+# PTLOC?<CRLF> -> OK<CRLF>F044=-0020.50!
+dictPollCodes = { 'ALMCODE?' : 'F076',   # alarm table, 0 = no alarm
+                  'PTLOC?'   : 'F044',   # reservoir temperature
+                  'SP?'      : 'F057',   # temperature set point
+                  'PUMP?'    : 'F046',   # circulating pump, 0 = off
+                  'REFRSW?'  : 'F051' }  # refrigeration, 0 = off
+lstPollQueries = list( dictPollCodes.keys() )
 
 # ------------------------------------------------------------------------------
 class clsChiller ( clsDevice ):
@@ -225,28 +298,98 @@ class clsChiller ( clsDevice ):
     super().__init__(strName, strPort, intBaud, bytesize, parity, stopbits, timeout)
 
     self._strClassName = ' < Chiller > '
+    self._istDecoder = clsChillerFrame()  # "OK!" or "OK<CRLF>Fxxx=...!"
 
     # keep the last read out value
     self._value = 0
 
-  def read(self, strCmdName, strCmdPara="",fltCurrentTemps=[]):
+  def _command(self, strCmdName, strCmdPara):
     """
-      Chiller: function of reading data
+      Chiller: build the text command sent to the device
     """
     if strCmdPara == "" :
       logging.debug(' READING: Sending command ' + strCmdName + ' to device ' + self.strName )
-      self._pdev.write( (strCmdName + '\r\n').encode() )
+      return (strCmdName + '\r\n').encode()
     else :
       logging.debug(' READING: Sending command ' + strCmdName + ' to device ' + self.strName + " with parameter " + strCmdPara)
-      self._pdev.write( (strCmdName + strCmdPara + '\r\n').encode() ) 
-    byteline = self._pdev.readline()
-    strinclines =  byteline.decode()
+      return (strCmdName + strCmdPara + '\r\n').encode()
+
+  def read(self, strCmdName, strCmdPara="",fltCurrentTemps=[]):
+    """
+      Chiller: function of reading data.  A command made of several queries
+      separated by spaces (see PollCycle? in ChillerEquipmentCommands.txt) runs
+      one poll cycle.
+    """
+    if ' ' in strCmdName.strip():
+      self.poll( strCmdName.split() )
+      return
+    byteline = self.query( self._command(strCmdName, strCmdPara) )
+    self._parse( byteline.decode() )
 
-     
-    for index, strLine in enumerate(strinclines.splitlines()) :
-      logging.debug(' Chiller returned: '+ strLine)
+  def poll(self, lstQueries=lstPollQueries):
+    """
+      Chiller: send all queries back-to-back and read one reply per query.
+      Return {query : value}, also kept for lastpoll().  last() gives the
+      reservoir temperature, or -9999 if an alarm is set.
+    """
+    lstFrames = [ self.query( self._pollcommand(lstQueries) ) ]
+    for _ in lstQueries[1:]:
+      lstFrames.append( self.readframe() )
+    return self._parsepoll( lstQueries, lstFrames )
+
+  def _pollcommand(self, lstQueries):
+    """
+      Chiller: all queries of a poll cycle in one write, each ending with CRLF
+    """
+    logging.debug(' READING: Sending poll %s to device %s', lstQueries, self.strName )
+    return ''.join( strQuery + '\r\n' for strQuery in lstQueries ).encode()
+
+  def _parsepoll(self, lstQueries, lstFrames):
+    """
+      Chiller: match the Fxxx= replies to the queries by their code.  A reply
+      with a code not in dictPollCodes goes to the query at the same position.
+    """
+    dictQueries = { dictPollCodes[strQuery] : strQuery for strQuery in lstQueries if strQuery in dictPollCodes }
+    dictValues = {}
+    for index, byteline in enumerate(lstFrames):
+      lstLines = byteline.decode().strip().splitlines()
+      logging.debug(' Chiller returned: %s', lstLines)
+      if len(lstLines) == 0 or 'OK' not in lstLines[0].upper():
+        logging.fatal(' Device ' + self.strName + ' Response from Chiller:' + ' '.join(lstLines) + '. FATAL! ' )
+        raise ValueError(" Garbled Response!!!! NOT GOOD")
+      if len(lstLines) < 2:
+        continue
+      strLine = lstLines[1].strip()
+      strvarname = strLine[0:4]
+      if strvarname[0:1] == 'E':
+        logging.fatal(' Device ' + self.strName + ' returned error message: ' + strLine)
+        raise ValueError("Error Message Returned")
+      elif strvarname in dictQueries:
+        dictValues[ dictQueries[strvarname] ] = float( strLine[5:-1] )
+      elif lstQueries[index] not in dictPollCodes:
+        dictValues[ lstQueries[index] ] = float( strLine[5:-1] )
+      else:
+        logging.info(" Device " + self.strName + ' gave weird result: ' + strLine)
+
+    self._dictPoll = dictValues
+    if dictValues.get('ALMCODE?', 0) != 0:
+      logging.fatal(' Device ' + self.strName + ' has given alarm: ' + str(dictValues['ALMCODE?']))
+      self._value = float(-9999)
+    elif 'PTLOC?' in dictValues:
+      self._value = dictValues['PTLOC?']
+    return dictValues
+
+  def lastpoll(self) :
+    return getattr(self, '_dictPoll', {})
+
+  def _parse(self, strinclines):
+    """
+      Chiller: check the OK line and interpret the returned Fxxx= or Exxx= value
+    """
+    for index, strLine in enumerate(strinclines.strip().splitlines()) :
+      logging.debug(' Chiller returned: %s', strLine)
       if index ==0 and ('ok' in strLine or 'Ok' in strLine or 'OK' in strLine) : 
-        logging.debug(' Device ' + self.strName + ' status :'+ strLine)
+        logging.debug(' Device %s status :%s', self.strName, strLine)
       elif index ==0 :
         logging.fatal(' Device ' + self.strName + ' Response from Chiller:' + strLine + '. FATAL! ' )
         raise ValueError(" Garbled Response!!!! NOT GOOD")
@@ -298,28 +441,29 @@ class clsPump ( clsDevice ):
     """
     super().__init__(strName, strPort, intBaud, bytesize, parity, stopbits, timeout)
     self.istCRC = CycRedundCheck()
+    self.istModbus = clsModbusRTU()
+    self._istDecoder = clsModbusFrame()
+    self.fltTimeout = 1.0
     self.fltRPSmin = 1.0
     self.fltRPSmax = 40.0
     self.fltRPSdefault = 12.0
+    # wire bytes of the static commands and of every RPS from fltRPSmin to fltRPSmax, built once
+    self.istFrames = clsFrameCache( self.istModbus, int(round(10 * self.fltRPSmin)), int(round(10 * self.fltRPSmax)) )
     self._value = 0
+    self.dictTelemetry = {}  # last telemetry read, register name -> value
 
 # ------------------------------------------------------------------------------
-  def read(self, strCmdName, strCmdParam="", fltCurrentTemps=[]):
+  def _command(self, strCmdName, strCmdParam):
     """
-      Send a command to the booster pump inverter and read the response.
-      The inverter will echo the command back, except for status commands.  Should
-      the command sent not valid, the inverter will not respond.
+      Build the hex command sent to the booster pump inverter.  Return the tuple
+      (command name used to check the response, command bytes).
     """
 	
 	# If there is no command parameter passed in, then assume the complete command with
 	# parameter(s) plus CRC was included with the command passed in.
     if strCmdParam == "" : 
       logging.debug('READ: Sending command ' + strCmdName + ' to ' + self.strName )
-      self._pdev.write( bytes.fromhex(strCmdName))
-      logging.debug('READ:    sent command ' + strCmdName + ' to ' + self.strName)
-      if '?' in strCmdName:
-        print("#TODO check pump output convert")
-      time.sleep(1)
+      return (strCmdName, self.istFrames.static(strCmdName))
 		
 	# Here we deal with commands that have a parameter and needs to calculate the CRC
 	# for a correct command to send to the device. Also look for the '=' sign as this
@@ -335,37 +479,62 @@ class clsPump ( clsDevice ):
                       + f' for {self.strName}.  Pump will be set to {self.fltRPSdefault} RPS' )
         fltCmdParam = self.fltRPSdefault
 
-      intCmdParam = int(10 * fltCmdParam)
+      intCmdParam = int(round(10 * fltCmdParam))  # e.g. 22.3 -> 223, int(10 * 22.3) gave 222
       logging.debug(f'READ: Sending command {strCmdName} to {self.strName} with parameter {strCmdParam}' )
-      strCmdParam = '{:04x}'.format(intCmdParam) # 
-      strCmdParam = strCmdParam.upper()
-      strCommand = strCmdName + strCmdParam
-      logging.debug(f" READ: {self.strName} calculating CRC from {strCommand} of length {str(len(strCommand))}" )
-
-      strCmdByteArr = bytearray.fromhex( strCommand )
-      logging.debug('READ: command string to calculate CRC: ' + str(strCmdByteArr) )
-      crc = 0xFFFF
-      for ch in strCmdByteArr:
-        crc = self.istCRC.calcByte(ch, crc)
-      strHexCRC = format(crc, '04x')
-      strHexCRC = strHexCRC[2:] + strHexCRC[0:2]  # Must swap bytes as CRC calculator result is little endian.
-      logging.debug(f'READ: Sending command {strCmdName} to {self.strName} with parameter ' \
-                  + f'{strCmdParam} + CRC {strHexCRC}')
-      theCommand = strCommand + strHexCRC.upper()
-      self._pdev.write( bytes.fromhex(theCommand) )
-      logging.debug('READ: full command sent: ' + theCommand )
-      time.sleep(1)
-    
-    byteline = self._pdev.readline(20)
-    strResponse = byteline.hex()
-    logging.debug(' Response from ' + self.strName +' = ' + strResponse)
-    if strResponse[0:4] != strCmdName[0:4]:
+      bytesCommand = self.istFrames.setpoint( strCmdName, intCmdParam )  # CRC included
+      return (strCmdName, bytesCommand)
+
+# ------------------------------------------------------------------------------
+  def read(self, strCmdName, strCmdParam="", fltCurrentTemps=[]):
+    """
+      Send a command to the booster pump inverter and read the response.
+      The inverter will echo the command back, except for status commands.  Should
+      the command sent not valid, the inverter will not respond.
+    """
+    if strCmdName == 'TELEMETRY':
+      self.readTelemetry()
+      return
+    strCmdName, bytesCommand = self._command(strCmdName, strCmdParam)
+    byteline = self.query( bytesCommand )
+    logging.debug('READ:    sent command ' + strCmdName + ' to ' + self.strName)
+    self._parse( byteline, bytesCommand )
+
+# ------------------------------------------------------------------------------
+  def readTelemetry(self, lstRegisters=lstTelemetry):
+    """
+      Read the registers in lstRegisters, one function 03 transaction for each
+      block of contiguous registers.  Return {register name : value}, also kept
+      in self.dictTelemetry.
+    """
+    dictValues = {}
+    for intStart, intCount in self.istModbus.plan( lstRegisters ):
+      bytesCommand = self.istModbus.readRegisters( intStart, intCount )
+      tupRaw = self.istModbus.decode( bytesCommand, self.query( bytesCommand ) )
+      dictValues.update( self.istModbus.values( intStart, tupRaw, lstRegisters ) )
+    self.dictTelemetry = dictValues
+    self._value = dictValues
+    return dictValues
+
+# ------------------------------------------------------------------------------
+  def _parse(self, byteline, bytesCommand):
+    """
+      Check the response of the inverter matches the command sent and decode
+      it: the register value(s) read, or the (address, value) of a write.
+    """
+    logging.debug(' Response from ' + self.strName +' = ' + byteline.hex())
+    try:
+      tupValues = self.istModbus.decode( bytesCommand, byteline )
+    except clsModbusError as err:
       logging.fatal(' PUMP: Communication returned back a value that was different from the one sent... Aborting program') 
-      logging.fatal(' PUMP: ' + strResponse[0:4] + " != " + strCmdName[0:4])
-      raise ValueError("Command and response, do not match!")
-      
-    # TODO: setting pump values OK???
-    self._value =  strResponse
+      logging.fatal(' PUMP: ' + str(err))
+      raise
+
+    if bytesCommand[1] == clsModbusRTU.READ_HOLDING:
+      intStart = struct.unpack_from('>H', bytesCommand, 2)[0]
+      tupValues = tuple( self.istModbus.value(intStart + i, intRaw) for i, intRaw in enumerate(tupValues) )
+      self._value = tupValues[0] if len(tupValues) == 1 else tupValues
+    else:
+      self._value = tupValues
 
   def last(self) : 
     return self._value
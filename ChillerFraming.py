@@ -0,0 +1,231 @@
+'''
+  Program ChillerFraming.py
+
+Description: ------------------------------------------------------------------
+   This file contains the frame decoders used to find where a response of one
+of the devices ends.  Each device speaks its own protocol:
+
+   FTS Systems RC211B0 recirculating cooler    text, ends with "!"
+   Lenze ESV751N02YXC inverter (Modbus RTU)    length given by function code
+                                               and byte count
+   Omega HH314A Humidity meter                 0x02 start byte, 10 bytes
+   Omega HH309A Data Logger Thermometer        0x02 start byte, 45 bytes
+   Arduino UNO board                           text, ends with "\n"
+
+   A decoder only looks at the bytes received so far and tells whether a
+complete frame is there.  The reading itself is done by clsDevice.readframe,
+so a command takes only as long as the device needs to answer.
+
+History: ----------------------------------------------------------------------
+   V1.0 - Oct-2026  First release.
+
+Environment: ------------------------------------------------------------------
+   This program is written in Python 3.8.  Python can be freely downloaded
+from http://www.python.org/.  This program has been tested on PCs running
+Windows 10.
+
+Author List: -------------------------------------------------------------------
+  R. McKay    Iowa State University, USA  mckay@iastate.edu
+  J. Yu       Iowa State University, USA  jieyu@iastate.edu
+  W. Heidorn  Iowa State University, USA  wheidorn@iastate.edu
+
+Notes: -------------------------------------------------------------------------
+   The silence allowed between two bytes of the same frame is derived from
+the baud rate (fltInterByteTimeout).  USB to serial adapters deliver bytes in
+packets, hence the lower bound fltMinGap.
+   The Omega frames carry big endian 16 bit fields in tenths of a degree (or
+of a percent).  clsStartByteFrame.unpack_into reads them with a precompiled
+struct straight from the received bytes into the preallocated sample buffer
+of the device, without going through hex strings.  Run this file to compare
+both ways:  python ChillerFraming.py
+
+Dictionary of abbreviations: ---------------------------------------------------
+  arr - array
+  cls - class
+  flt - float
+  idx - index
+  int - integer
+  stc - struct (precompiled format)
+  str - string
+'''
+
+# Import section --------------------------------------------------------------
+
+import struct
+
+# ------------------------------------------------------------------------------
+# Timing helpers ---------------------------------------------------------------
+def fltCharTime(intBaud, intByteSize=8, strParity='N', fltStopBits=1):
+  """
+    Time in seconds to transmit one character: start bit, data bits, optional
+    parity bit and stop bit(s).
+  """
+  intParityBits = 0 if strParity in ('N', None) else 1
+  return (1 + intByteSize + intParityBits + float(fltStopBits)) / float(intBaud)
+
+def fltInterByteTimeout(intBaud, intByteSize=8, strParity='N', fltStopBits=1, fltChars=3.5, fltMinGap=0.05):
+  """
+    Longest silence allowed between two bytes of one frame.  fltChars = 3.5 is
+    the Modbus RTU end of frame gap.
+  """
+  return max(fltChars * fltCharTime(intBaud, intByteSize, strParity, fltStopBits), fltMinGap)
+
+
+# ------------------------------------------------------------------------------
+# Class Frame Decoder (base) ---------------------------------------------------
+class clsFrameDecoder:
+  """
+    Base class of the decoders.  find( buffer ) returns None while the frame is
+    incomplete, otherwise the tuple (start index, end index) of the frame.
+    Bytes in front of the start index are garbage and dropped by the reader.
+  """
+  strName = 'frame'
+
+  def find(self, bytesBuf):
+    return (0, len(bytesBuf)) if len(bytesBuf) > 0 else None
+
+
+# ------------------------------------------------------------------------------
+class clsTerminatorFrame ( clsFrameDecoder ):
+  """
+    Text frame ending with bytesTerm.  Leading whitespace, i.e. a CRLF left over
+    from the previous response, is not part of the frame.
+  """
+  def __init__(self, bytesTerm, strName='text'):
+    self._bytesTerm = bytesTerm
+    self.strName = strName
+
+  def find(self, bytesBuf):
+    intIdx = bytesBuf.find(self._bytesTerm)
+    if intIdx < 0:
+      return None
+    intStart = 0
+    while intStart < intIdx and bytesBuf[intStart] in b' \r\n':
+      intStart += 1
+    return (intStart, intIdx + len(self._bytesTerm))
+
+
+# ------------------------------------------------------------------------------
+class clsChillerFrame ( clsTerminatorFrame ):
+  """
+    FTS chiller: "OK!" or "OK<CRLF>Fxxx=s00xx.xx!", always ending with "!".
+  """
+  def __init__(self):
+    super().__init__(b'!', 'chiller')
+
+
+# ------------------------------------------------------------------------------
+class clsLineFrame ( clsTerminatorFrame ):
+  """
+    Arduino: one line of text ending with "\\n".
+  """
+  def __init__(self):
+    super().__init__(b'\n', 'line')
+
+
+# ------------------------------------------------------------------------------
+class clsStartByteFrame ( clsFrameDecoder ):
+  """
+    Fixed length binary frame starting with bytesStart (Omega meters: 0x02).
+    strFields is the struct format of the values in the frame, e.g. '>7x4h'
+    for four signed 16 bit values after 7 bytes of header.
+  """
+  def __init__(self, intSize, bytesStart=b'\x02', strName='stx', strFields=None, fltDivisor=10.):
+    self._intSize = intSize
+    self._bytesStart = bytesStart
+    self.strName = strName
+    self._stcFields = struct.Struct(strFields) if strFields else None
+    self._fltDivisor = fltDivisor
+
+  def find(self, bytesBuf):
+    intStart = bytesBuf.find(self._bytesStart)
+    if intStart < 0 or len(bytesBuf) - intStart < self._intSize:
+      return None
+    return (intStart, intStart + self._intSize)
+
+  def unpack_into(self, bytesFrame, arrOut):
+    """
+      Decode the fields of a complete frame into the preallocated arrOut
+      (array('d') or list), each value divided by fltDivisor.
+    """
+    if bytesFrame[0] != self._bytesStart[0] or len(bytesFrame) < self._stcFields.size:
+      raise ValueError(' Bad ' + self.strName + ' frame: ' + bytes(bytesFrame).hex())
+    fltDivisor = self._fltDivisor
+    for idx, intRaw in enumerate(self._stcFields.unpack_from(bytesFrame)):
+      arrOut[idx] = intRaw / fltDivisor
+
+
+# ------------------------------------------------------------------------------
+class clsModbusFrame ( clsFrameDecoder ):
+  """
+    Modbus RTU response: address, function, data, 2 byte CRC.
+      exception (function | 0x80): 5 bytes
+      read registers (0x03, 0x04): 5 + byte count (3rd byte)
+      write single/multiple (0x05, 0x06, 0x0F, 0x10): 8 bytes
+  """
+  strName = 'modbus'
+
+  def find(self, bytesBuf):
+    intLen = len(bytesBuf)
+    if intLen < 2:
+      return None
+    intFunction = bytesBuf[1]
+    if intFunction & 0x80:
+      intSize = 5
+    elif intFunction in (0x01, 0x02, 0x03, 0x04):
+      if intLen < 3:
+        return None
+      intSize = 5 + bytesBuf[2]
+    else:
+      intSize = 8
+    if intLen < intSize:
+      return None
+    return (0, intSize)
+
+
+if __name__ == '__main__':
+
+  import timeit
+  from array import array
+
+  # HH309A frame, T1..T4 = 21.5, -20.0, 1.0, 0.0
+  bytesThermo = bytes.fromhex('02' + '00'*6 + '00d7ff38000a0000' + '00'*30)
+  istThermo = clsStartByteFrame(45, b'\x02', 'thermocouple', '>7x4h')
+  arrThermo = array('d', [0.] * 4)
+
+  def hexThermo():
+    strLine = bytesThermo.hex()
+    strDataHex = strLine[14:30]
+    Temps = [0,0,0,0]
+    offset = 0
+    for i in range(len(Temps)):
+      Temps[i]= int(strDataHex[0+offset:4+offset],16)/10
+      offset +=4
+      if Temps[i] > 3276.8:
+        Temps[i] = Temps[i]-6553.6
+    return Temps
+
+  def stcThermo():
+    istThermo.unpack_into(bytesThermo, arrThermo)
+
+  # HH314A frame, humidity 50.0 %, T1 20.0, T2 30.0
+  bytesHumi = bytes.fromhex('02000001f400c8012c03')
+  istHumi = clsStartByteFrame(10, b'\x02', 'humidity', '>3xHhh')
+  arrHumi = array('d', [0.] * 3)
+
+  def hexHumi():
+    strLine = bytesHumi.hex()
+    return [int(strLine[6:10], 16) / 10, int(strLine[10:14],16)/10, int(strLine[14:18],16)/10]
+
+  def stcHumi():
+    istHumi.unpack_into(bytesHumi, arrHumi)
+
+  stcThermo()
+  stcHumi()
+  print('thermocouple', hexThermo(), list(arrThermo))
+  print('humidity    ', hexHumi(), list(arrHumi))
+  intLoops = 200000
+  for strName, func in (('thermocouple hex', hexThermo), ('thermocouple struct', stcThermo), \
+                        ('humidity hex', hexHumi), ('humidity struct', stcHumi)):
+    fltTime = min(timeit.repeat(func, number=intLoops, repeat=3))
+    print('{:20s} {:6.3f} us/frame'.format(strName, 1e6 * fltTime / intLoops))
@@ -0,0 +1,205 @@
+'''
+  Program ChillerLogGrammar.py
+
+Description: ------------------------------------------------------------------
+   This file contains the grammar of the log lines of the chiller control, for
+the analysis tools (DataStripper.py, FindInfo.py).  A line
+
+     10/02/2018 10:15:42 AM INFO: <DATA> Arduino FlowRate = 0.97 l/min
+
+is matched once by one compiled regular expression holding the time prefix and
+every message the control program writes (lstKinds).  funcParseLines() yields
+typed records:
+
+     clsLogRecord(time, level, kind, values, text)
+       time    time.time() of the line (local time of the log)
+       level   'INFO', 'WARNING', ...
+       kind    'FlowRate', 'Thermo', ... of lstKinds
+       values  floats of the kind, named by dictFields[kind]
+       text    rest of the message, for the kinds without values
+
+History: ----------------------------------------------------------------------
+   V1.0 - Oct-2026  First release.
+
+Environment: ------------------------------------------------------------------
+   This program is written in Python 3.8.  Python can be freely downloaded
+from http://www.python.org/.  This program has been tested on PCs running
+Windows 10.
+
+Author List: -------------------------------------------------------------------
+  R. McKay    Iowa State University, USA  mckay@iastate.edu
+  J. Yu       Iowa State University, USA  jieyu@iastate.edu
+  W. Heidorn  Iowa State University, USA  wheidorn@iastate.edu
+
+Notes: -------------------------------------------------------------------------
+   The time of a line is the time.mktime() of its date and hour, made once per
+hour of the log (dictHours), plus its minutes and seconds: a day is parsed 24
+times, not once per line, and the daylight saving changes stay right.
+   The lines without the time prefix (a traceback) give no record.
+   A new message of the control program is a new entry of lstKinds, before the
+catch-all kinds at the end.  The first matching entry gives the kind.
+   python ChillerLogGrammar.py  runs the parsing benchmark on a synthetic log.
+
+Dictionary of abbreviations: ---------------------------------------------------
+  cls - class
+  dict - dictionary
+  flt - float
+  func - function
+  int - integer
+  ist - instance
+  lst - list
+  re - regular expression
+  str - string
+  tup - tuple
+'''
+
+# Import section --------------------------------------------------------------
+
+import re
+import time
+import collections
+
+clsLogRecord = collections.namedtuple('clsLogRecord', ['time', 'level', 'kind', 'values', 'text'])
+
+strNum = r'\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|nan|inf)'
+
+# (kind, names of the values, message pattern): a (...) of strNum per value,
+# at most one more (.*) for the text.
+lstKinds = [
+  ('FlowRate',     ('FlowRate',),                 r'<DATA> Arduino FlowRate =' + strNum + r' l/min'),
+  ('TRes',         ('TRes',),                     r'<DATA> TempReadings TRes =' + strNum),
+  ('Thermo',       ('T1', 'T2', 'T3', 'T4'),      r'<DATA> TempReadings T1:' + strNum + r', T2:' + strNum +
+                                                  r', T3:' + strNum + r', T4:' + strNum),
+  ('ThermoHidden', ('T1', 'T2', 'T3', 'T4'),      r'<HIDDEN> TempReadings T1:' + strNum + r', T2:' + strNum +
+                                                  r', T3:' + strNum + r', T4:' + strNum),
+  ('Temps',        ('TSet', 'TRes', 'T1', 'T2', 'T3', 'T4'),
+                                                  r'<DATA> Temps TSet:' + strNum + r', TRes:' + strNum + r', T1:' + strNum +
+                                                  r', T2:' + strNum + r', T3:' + strNum + r', T4:' + strNum),
+  ('Humidity',     ('Humidity', 'TH1', 'TH2'),    r'<DATA> Humidity:' + strNum + r', T1H:' + strNum + r', T2H:' + strNum),
+  ('Voltage',      ('Voltage',),                  r'<HIDDEN> Arduino Voltage:' + strNum),
+  ('Poll',         (),                            r'<HIDDEN> Chiller Poll: (.*)'),
+  ('Telemetry',    (),                            r'<HIDDEN> Pump Telemetry: (.*)'),
+  ('Commands',     (),                            r'<HIDDEN> Commands (.*)'),
+  ('Schedule',     (),                            r'<HIDDEN> Schedule (.*)'),
+  ('WaitTRes',     ('TSet',),                     r'< RUNNING > Waiting 1 min for TRes to be within one degree of TSet:' + strNum),
+  ('WaitSlope',    (),                            r'< RUNNING > Routine waiting (.*)'),
+  ('StaveReached', ('TStave',),                   r'< RUNNING > Stave reached Temperature' + strNum + r' C(.*)'),
+  ('PumpSet',      ('RPS',),                      r'< RUNNING > Pump Set RPS:' + strNum),
+  ('ChillerSet',   ('TSet',),                     r'< RUNNING > Chiller Set Temp:' + strNum),
+  ('Toggled',      (),                            r'< RUNNING > Arduino Toggled()'),
+  ('Running',      (),                            r'< RUNNING > ?(.*)'),       # catch-all kinds
+  ('Data',         (),                            r'<DATA> (.*)'),
+  ('Hidden',       (),                            r'<HIDDEN> (.*)'),
+  ('Message',      (),                            r'(.*)')]
+dictFields = {strKind: tupFields for strKind, tupFields, strPattern in lstKinds}
+
+# One expression: the time prefix, then one group per kind, the name of the kind.
+reLine = re.compile(r'(?P<date>\d\d/\d\d/\d{4} \d\d):(?P<min>\d\d):(?P<sec>\d\d) (?P<ampm>[AP]M) (?P<level>[A-Z]+): ?(?:' +
+                    '|'.join('(?P<{}>{})'.format(strKind, strPattern) for strKind, tupFields, strPattern in lstKinds) +
+                    r')\s*$')
+
+def _funcGroups():
+  '''
+    Group indexes of the time, the values and the text of each kind, for one
+  call of group(): 'date', 'ampm', 'min', 'sec', 'level', values..., text.
+  '''
+  dictGroups = {}
+  tupTime = tuple(reLine.groupindex[strName] for strName in ('date', 'ampm', 'min', 'sec', 'level'))
+  for strKind, tupFields, strPattern in lstKinds:
+    intFirst = reLine.groupindex[strKind] + 1
+    intCount = re.compile(strPattern).groups
+    dictGroups[strKind] = tupTime + tuple(range(intFirst, intFirst + len(tupFields))) + \
+                          ((intFirst + len(tupFields),) if intCount > len(tupFields) else ())
+  return dictGroups
+_dictGroups = _funcGroups()
+
+dictHours = {}                                  # '10/02/2018 10' + 'AM' -> time.mktime() of the hour
+strTimeFormat = '%m-%d-%Y_%H-%M-%S'             # times given to the tools, FindInfo.py
+
+# ------------------------------------------------------------------------------
+def funcHour(strDateHour, strAmPm):
+  '''
+    time.time() of the start of an hour of the log, e.g. '10/02/2018 10', 'AM'.
+  '''
+  strKey = strDateHour + strAmPm
+  fltHour = dictHours.get(strKey)
+  if fltHour is None:
+    intHour = int(strDateHour[11:13]) % 12 + (12 if strAmPm == 'PM' else 0)
+    fltHour = time.mktime((int(strDateHour[6:10]), int(strDateHour[0:2]), int(strDateHour[3:5]), intHour, 0, 0, 0, 0, -1))
+    dictHours[strKey] = fltHour
+  return fltHour
+
+def funcLineTime(strLine):
+  '''
+    time.time() of a log line, ValueError if it has no time prefix.
+  '''
+  istMatch = reLine.match(strLine)
+  if istMatch is None:
+    raise ValueError('no time in log line: ' + strLine[:40])
+  strDateHour, strAmPm, strMin, strSec = istMatch.group('date', 'ampm', 'min', 'sec')
+  return funcHour(strDateHour, strAmPm) + 60 * int(strMin) + int(strSec)
+
+def funcParseLine(strLine):
+  '''
+    clsLogRecord of a log line, None without the time prefix.
+  '''
+  istMatch = reLine.match(strLine)
+  if istMatch is None:
+    return None
+  strKind = istMatch.lastgroup
+  tupGroups = istMatch.group(*_dictGroups[strKind])
+  intValues = len(dictFields[strKind])
+  return clsLogRecord(funcHour(tupGroups[0], tupGroups[1]) + 60 * int(tupGroups[2]) + int(tupGroups[3]), tupGroups[4],
+                      strKind, tuple(map(float, tupGroups[5:5 + intValues])), tupGroups[5 + intValues] if len(tupGroups) > 5 + intValues else '')
+
+def funcTime(strTime):
+  '''
+    time.time() of a local time given to the tools, mm-dd-yyyy_hh-mm-ss.
+  '''
+  return time.mktime(time.strptime(strTime, strTimeFormat))
+
+def funcParseLines(iterLines):
+  '''
+    clsLogRecord of the lines with a time prefix.
+  '''
+  for strLine in iterLines:
+    istRecord = funcParseLine(strLine)
+    if istRecord is not None:
+      yield istRecord
+
+
+if __name__ == '__main__':
+
+  # Benchmark: one day of a synthetic log, a line per second of each kind of data.
+  import random
+
+  lstLines = []
+  fltStart = time.mktime((2024, 2, 28, 0, 0, 0, 0, 0, -1))   # across a leap day
+  for intSecond in range(86400):
+    strTime = time.strftime('%m/%d/%Y %I:%M:%S %p', time.localtime(fltStart + intSecond))
+    lstLines.append(strTime + ' INFO: <DATA> Arduino FlowRate = {:4.2f} l/min\n'.format(random.uniform(0.4, 1.5)))
+    lstLines.append(strTime + ' INFO: <HIDDEN> Arduino Voltage: {:.3f}\n'.format(random.random()))
+    lstLines.append(strTime + ' INFO: <HIDDEN> TempReadings T1: {:5.2f}, T2: {:5.2f}, T3: {:5.2f}, T4: {:5.2f} \n'.format(
+                    *[random.uniform(-40, 20) for i in range(4)]))
+    if intSecond % 5 == 0:
+      lstLines.append(strTime + ' INFO: <DATA> Humidity: {:4.1f}, T1H: {:4.1f}, T2H: {:4.1f}\n'.format(45., 20., 21.))
+      lstLines.append(strTime + ' INFO: <HIDDEN> Chiller Poll: {\'PTLOC?\': 20.0, \'SP?\': 20.0}\n')
+    if intSecond % 60 == 0:
+      lstLines.append(strTime + ' INFO: < RUNNING > Chiller Set Temp: -20.0\n')
+  intBytes = sum(len(strLine) for strLine in lstLines)
+
+  dictHours.clear()
+  fltClock = time.perf_counter()
+  dictCount = collections.Counter(istRecord.kind for istRecord in funcParseLines(lstLines))
+  fltParse = time.perf_counter() - fltClock
+  print('{} lines, {:.1f} MB: {:.2f} s, {:.0f} klines/s, {:.1f} MB/s'.format(len(lstLines), intBytes / 1e6, fltParse,
+        len(lstLines) / fltParse / 1e3, intBytes / 1e6 / fltParse))
+  print(dict(dictCount))
+
+  # Time of each line with time.strptime and time.mktime, as done before the cache
+  fltClock = time.perf_counter()
+  for strLine in lstLines[:100000]:
+    time.mktime(time.strptime(strLine[:22], '%m/%d/%Y %I:%M:%S %p'))
+  print('strptime + mktime: {:.1f} us per line, grammar with the hour cache: {:.1f} us per line'.format(
+        1e6 * (time.perf_counter() - fltClock) / 100000, 1e6 * fltParse / len(lstLines)))
+  print('last line:', funcParseLine(lstLines[-1]))
@@ -0,0 +1,146 @@
+'''
+  Program ChillerLogQueue.py
+
+Description: ------------------------------------------------------------------
+   This file contains the logging queue of the chiller control.  The processes
+log through clsLogQueueHandler (ChillerRun.funcLoggingConfig), which puts on the
+queue a compact clsLogMessage instead of the full LogRecord:
+
+     (time.time() of the record, level, message text, console)
+
+The message is formatted and the console routing decided in the logging
+process: the listener (ChillerRun.procListener) only writes the line and
+echoes it when console is True.  Records of a level below the root level are
+dropped by the logging module before any formatting, so the debug records
+with lazy arguments cost nothing with the default INFO level.
+
+   A pickled LogRecord is about 470 bytes, a clsLogMessage about 100: less
+pickling in the processes, less data through the pipe of the queue.
+
+History: ----------------------------------------------------------------------
+   V1.0 - Oct-2026  First release.
+
+Environment: ------------------------------------------------------------------
+   This program is written in Python 3.8.  Python can be freely downloaded
+from http://www.python.org/.  This program has been tested on PCs running
+Windows 10.
+
+Author List: -------------------------------------------------------------------
+  R. McKay    Iowa State University, USA  mckay@iastate.edu
+  J. Yu       Iowa State University, USA  jieyu@iastate.edu
+  W. Heidorn  Iowa State University, USA  wheidorn@iastate.edu
+
+Notes: -------------------------------------------------------------------------
+   The measured values do not need the log: every update of the shared arrays
+goes to the history rings (ChillerSharedState.py) and to the run file of the
+process (ChillerRecorder.py).  <HIDDEN> and TempReadings lines are written to
+the log file only, never to the console (lstQuiet).
+   The listener counts the messages and bytes it takes off the queue, and the
+queue depth, in the shared statistics block (ChillerMetrics.py).
+
+Dictionary of abbreviations: ---------------------------------------------------
+  bol - boolean
+  cls - class
+  flt - float
+  func - function
+  int - integer
+  lst - list
+  str - string
+'''
+
+# Import section --------------------------------------------------------------
+
+import time
+import logging
+import logging.handlers
+import collections
+
+# A record on the queue: time.time() of the record, its level, the formatted
+# message (with the traceback of an exception), True to echo it on the console.
+clsLogMessage = collections.namedtuple('clsLogMessage', ['created', 'levelno', 'message', 'console'])
+
+lstQuiet = ['HIDDEN', 'TempReadings']        # messages for the log file only
+strDateFormat = '%m/%d/%Y %I:%M:%S %p'
+
+# ------------------------------------------------------------------------------
+def funcConsole(strMessage):
+  '''
+    True if a message is also printed on the console.
+  '''
+  for strQuiet in lstQuiet:
+    if strQuiet in strMessage:
+      return False
+  return True
+
+# ------------------------------------------------------------------------------
+# Class Log Queue Handler ------------------------------------------------------
+class clsLogQueueHandler(logging.handlers.QueueHandler):
+  '''
+    QueueHandler putting a clsLogMessage on the queue.
+  '''
+  _istFormatter = logging.Formatter()       # tracebacks only
+
+  def prepare(self, record):
+    strMessage = record.getMessage()
+    if record.exc_info:
+      strMessage += '\n' + self._istFormatter.formatException(record.exc_info)
+    if record.stack_info:
+      strMessage += '\n' + self._istFormatter.formatStack(record.stack_info)
+    return clsLogMessage(record.created, record.levelno, strMessage, funcConsole(strMessage))
+
+# ------------------------------------------------------------------------------
+# Class Log Formatter ----------------------------------------------------------
+class clsLogFormatter:
+  '''
+    Lines of the log file and of the console of clsLogMessage, the time text is
+  made once per second.
+  '''
+  def __init__(self):
+    self._intSecond = None
+    self._strTime = ''
+
+  def asctime(self, fltCreated):
+    intSecond = int(fltCreated)
+    if intSecond != self._intSecond:
+      self._intSecond = intSecond
+      self._strTime = time.strftime(strDateFormat, time.localtime(fltCreated))
+    return self._strTime
+
+  def line(self, istMessage):
+    '''
+      Log file line, as '%(asctime)s %(levelname)s: %(message)s'.
+    '''
+    return self.asctime(istMessage.created) + ' ' + logging.getLevelName(istMessage.levelno) + ': ' + istMessage.message
+
+  def console(self, istMessage):
+    return self.asctime(istMessage.created) + ' ' + logging.getLevelName(istMessage.levelno) + ' ' + istMessage.message
+
+
+if __name__ == '__main__':
+
+  # 20000 <DATA> records through a multiprocessing queue: LogRecord vs clsLogMessage.
+  import pickle
+  import threading
+  import multiprocessing as mp
+
+  istRecord = logging.LogRecord('root', logging.INFO, __file__, 1, '<DATA> Arduino FlowRate = {:4.2f} l/min'.format(0.97), None, None)
+  istQueueHandler = logging.handlers.QueueHandler(None)
+  print('pickled LogRecord     : {} bytes'.format(len(pickle.dumps(istQueueHandler.prepare(istRecord)))))
+  print('pickled clsLogMessage : {} bytes'.format(len(pickle.dumps(clsLogQueueHandler(None).prepare(istRecord)))))
+
+  intCount = 20000
+  for clsHandler in (logging.handlers.QueueHandler, clsLogQueueHandler):
+    queue = mp.Queue()
+    istLog = logging.getLogger(clsHandler.__name__)
+    istLog.propagate = False
+    istLog.setLevel(logging.INFO)
+    istLog.addHandler(clsHandler(queue))
+    thread = threading.Thread(target=lambda: [queue.get() for i in range(intCount)])
+    thread.start()
+    fltStart = time.perf_counter()
+    for i in range(intCount):
+      istLog.info('<DATA> Arduino FlowRate = {:4.2f} l/min'.format(i * 1e-4))
+    fltPut = time.perf_counter() - fltStart
+    thread.join()
+    print('{:20s}: {:5.1f} us per record to put, {:5.1f} us to get all'.format(clsHandler.__name__,
+          1e6 * fltPut / intCount, 1e6 * (time.perf_counter() - fltStart) / intCount))
@@ -0,0 +1,325 @@
+'''
+  Program ChillerLogStore.py
+
+Description: ------------------------------------------------------------------
+   This file contains the log storage of the chiller control.  The listener
+(ChillerRun.procListener) writes the log of a run in segments
+
+     2018-10-02_10-15AM_ChillerRun.0001.log, .0002.log, ...
+
+of intSegmentBytes each.  A segment is gzip compressed once closed, to
+2018-10-02_10-15AM_ChillerRun.0001.log.gz, by a thread of the listener.  The
+sidecar index
+
+     2018-10-02_10-15AM_ChillerRun.idx
+
+has one csv row per block of about intBlockBytes of log lines: file, byte offset
+and length of the block in the file, time.time() of its first and last line.
+A compressed block is one gzip member, so a block is read and decompressed
+alone: a reader seeks straight to the blocks of the time window it needs.
+
+   funcLogLines(strFileName, fltFrom, fltTo) gives the lines of a log for the
+analysis tools (DataStripper.py), whatever the name given: the .log of the run,
+its .idx, a segment, compressed or not.
+
+History: ----------------------------------------------------------------------
+   V1.0 - Oct-2026  First release.
+
+Environment: ------------------------------------------------------------------
+   This program is written in Python 3.8.  Python can be freely downloaded
+from http://www.python.org/.  This program has been tested on PCs running
+Windows 10.
+
+Author List: -------------------------------------------------------------------
+  R. McKay    Iowa State University, USA  mckay@iastate.edu
+  J. Yu       Iowa State University, USA  jieyu@iastate.edu
+  W. Heidorn  Iowa State University, USA  wheidorn@iastate.edu
+
+Notes: -------------------------------------------------------------------------
+   A segment is indexed when it is opened (a row of length 0) and at the end of
+each block.  The lines after the last row of the open segment are read as a
+block of unknown last time.  When a segment is compressed, the rows of the .gz
+file are added and the plain file removed: a reader uses the .gz rows of a
+segment when there are any, so a compression cut short by the end of the
+process only leaves a stray .gz file.
+   The blocks end at the end of a write of the listener, always a whole line.
+   python ChillerLogStore.py file [from [to]]  prints the lines of a log, the
+times as mm-dd-yyyy_hh-mm-ss (FindInfo.py).
+
+Dictionary of abbreviations: ---------------------------------------------------
+  bol - boolean
+  byt - bytes
+  cls - class
+  flt - float
+  func - function
+  int - integer
+  ist - instance
+  lst - list
+  str - string
+  tup - tuple
+'''
+
+# Import section --------------------------------------------------------------
+
+import os
+import re
+import csv
+import gzip
+import time
+import threading
+from ChillerLogGrammar import funcTime   # times given to the tools
+
+intSegmentBytes = 16 << 20           # bytes of log lines per segment
+intBlockBytes = 64 << 10             # bytes of log lines per indexed block
+intCompressLevel = 6
+lstIndexColumns = ['file', 'offset', 'length', 'first', 'last']
+reSegment = re.compile(r'\.(\d{4,})\.log(\.gz)?$')
+
+# ------------------------------------------------------------------------------
+def funcBase(strFileName):
+  '''
+    Name of a run without extension, from its .log, .idx or a segment.
+  '''
+  strDir, strName = os.path.split(strFileName)
+  strName = reSegment.sub('', strName)
+  for strExt in ('.log', '.idx'):
+    if strName.endswith(strExt):
+      strName = strName[:-len(strExt)]
+  return os.path.join(strDir, strName)
+
+def funcSegmentName(strBase, intSegment):
+  return strBase + '.{:04d}.log'.format(intSegment)
+
+# ------------------------------------------------------------------------------
+# Class Log Store --------------------------------------------------------------
+class clsLogStore:
+  def __init__(self, strLogName, intSegment=intSegmentBytes, intBlock=intBlockBytes, bolCompress=True):
+    '''
+      Segments and index of the log strLogName (the .log name of the run).  A
+    restarted listener goes on with the next segment.
+    '''
+    self.strBase = funcBase(strLogName)
+    self.strIndexName = self.strBase + '.idx'
+    self._intSegmentBytes = intSegment
+    self._intBlockBytes = min(intBlock, intSegment)
+    self._bolCompress = bolCompress
+    self._lock = threading.Lock()            # index rows of the writer and the compressions
+    self._lstThreads = []
+    intLast = 0
+    if os.path.exists(self.strIndexName):
+      for dictRow in funcReadIndex(self.strIndexName, bolAll=True):
+        intLast = max(intLast, dictRow['segment'])
+    self._fileIndex = open(self.strIndexName, 'a', newline='')
+    self._istIndex = csv.writer(self._fileIndex)
+    if intLast == 0:
+      self._istIndex.writerow(lstIndexColumns)
+    self._intSegment = intLast
+    self._file = None
+    self._open()
+
+  def _row(self, lstRows):
+    with self._lock:
+      self._istIndex.writerows(lstRows)
+      self._fileIndex.flush()
+
+  def _open(self):
+    self._intSegment += 1
+    self.strSegmentName = funcSegmentName(self.strBase, self._intSegment)
+    self._file = open(self.strSegmentName, 'ab', buffering=1 << 16)
+    self._intOffset = self._file.tell()
+    self._intBlockStart = self._intOffset
+    self._fltFirst = self._fltLast = None
+    self._lstBlocks = []                     # (offset, length, first, last) of this segment
+    fltNow = time.time()
+    self._row([[os.path.basename(self.strSegmentName), self._intOffset, 0, repr(fltNow), repr(fltNow)]])
+
+  def _endblock(self):
+    '''
+      Index the lines written since the last row.
+    '''
+    intLength = self._intOffset - self._intBlockStart
+    if intLength == 0:
+      return
+    self._file.flush()                       # a reader finds the whole block
+    tupBlock = (self._intBlockStart, intLength, self._fltFirst, self._fltLast)
+    self._lstBlocks.append(tupBlock)
+    self._row([[os.path.basename(self.strSegmentName), tupBlock[0], tupBlock[1], repr(tupBlock[2]), repr(tupBlock[3])]])
+    self._intBlockStart = self._intOffset
+    self._fltFirst = self._fltLast = None
+
+  def write(self, strText, fltFirst, fltLast):
+    '''
+      Whole lines strText, of the times fltFirst to fltLast (time.time()).
+    '''
+    bytText = strText.encode('utf-8', errors='replace')
+    self._file.write(bytText)
+    self._intOffset += len(bytText)
+    self._fltFirst = fltFirst if self._fltFirst is None else min(self._fltFirst, fltFirst)
+    self._fltLast = fltLast if self._fltLast is None else max(self._fltLast, fltLast)
+    if self._intOffset - self._intBlockStart >= self._intBlockBytes:
+      self._endblock()
+      if self._intOffset >= self._intSegmentBytes:
+        self._rotate()
+
+  def _rotate(self):
+    self._file.close()
+    if self._bolCompress:
+      thread = threading.Thread(target=self._compress, args=(self.strSegmentName, self._lstBlocks),
+                                name='Compress ' + os.path.basename(self.strSegmentName))
+      thread.start()
+      self._lstThreads = [t for t in self._lstThreads if t.is_alive()] + [thread]
+    self._open()
+
+  def _compress(self, strSegmentName, lstBlocks):
+    '''
+      One gzip member per block, then the rows of the .gz file.
+    '''
+    strGzName = strSegmentName + '.gz'
+    lstRows = []
+    with open(strSegmentName, 'rb') as fileIn, open(strGzName, 'wb') as fileOut:
+      for intOffset, intLength, fltFirst, fltLast in lstBlocks:
+        fileIn.seek(intOffset)
+        bytBlock = gzip.compress(fileIn.read(intLength), intCompressLevel)
+        lstRows.append([os.path.basename(strGzName), fileOut.tell(), len(bytBlock), repr(fltFirst), repr(fltLast)])
+        fileOut.write(bytBlock)
+      fileOut.flush()
+      os.fsync(fileOut.fileno())
+    self._row(lstRows)
+    try:
+      os.remove(strSegmentName)
+    except OSError:                          # open by a reader (Windows), the .gz rows are used
+      pass
+
+  def flush(self, bolSync=False):
+    self._file.flush()
+    if bolSync:
+      os.fsync(self._file.fileno())
+
+  def close(self):
+    '''
+      The last segment stays plain, the compressions running are waited for.
+    '''
+    self._endblock()
+    self.flush(True)
+    self._file.close()
+    for thread in self._lstThreads:
+      thread.join()
+    self._fileIndex.close()
+
+# ------------------------------------------------------------------------------
+def funcReadIndex(strIndexName, bolAll=False):
+  '''
+    Rows {file, segment, offset, length, first, last} of an index in segment
+  and file order, the .gz rows of a segment when there are any (all with bolAll).
+  The lines after the last row of a plain segment are a row of last time inf.
+  '''
+  strDir = os.path.dirname(strIndexName)
+  dictSegments = {}                          # segment -> {'plain': rows, 'gz': rows}
+  with open(strIndexName, newline='') as file:
+    for dictRow in csv.DictReader(file):
+      istMatch = reSegment.search(dictRow['file'])
+      if istMatch is None or dictRow['last'] is None:
+        continue                             # a row cut short
+      dictRow = {'file': os.path.join(strDir, dictRow['file']), 'segment': int(istMatch.group(1)),
+                 'offset': int(dictRow['offset']), 'length': int(dictRow['length']),
+                 'first': float(dictRow['first']), 'last': float(dictRow['last'])}
+      dictSegments.setdefault(dictRow['segment'], {'plain': [], 'gz': []})[
+        'gz' if istMatch.group(2) else 'plain'].append(dictRow)
+  lstRows = []
+  for intSegment in sorted(dictSegments):
+    dictKinds = dictSegments[intSegment]
+    if bolAll:
+      lstRows += dictKinds['plain'] + dictKinds['gz']
+    elif dictKinds['gz']:
+      lstRows += dictKinds['gz']
+    elif dictKinds['plain']:
+      lstRows += [dictRow for dictRow in dictKinds['plain'] if dictRow['length']]
+      dictLast = dictKinds['plain'][-1]
+      try:
+        intSize = os.path.getsize(dictLast['file'])
+      except OSError:
+        continue
+      intEnd = dictLast['offset'] + dictLast['length']
+      if intSize > intEnd:                   # lines not indexed yet
+        lstRows.append(dict(dictLast, offset=intEnd, length=intSize - intEnd, first=dictLast['last'], last=float('inf')))
+  return lstRows
+
+def funcReadBlock(dictRow):
+  '''
+    Text of the block of an index row.
+  '''
+  with open(dictRow['file'], 'rb') as file:
+    file.seek(dictRow['offset'])
+    bytBlock = file.read(dictRow['length'])
+  if dictRow['file'].endswith('.gz'):
+    bytBlock = gzip.decompress(bytBlock)
+  return bytBlock.decode('utf-8', errors='replace')
+
+def funcLogLines(strFileName, fltFrom=None, fltTo=None):
+  '''
+    Lines of a log, of the blocks with lines from fltFrom to fltTo (time.time(),
+  None: no limit).  The .log or .idx of a run reads the .log written by the main
+  process (if any) then the segments through the index; a single file, plain
+  or .gz, is read whole.
+  '''
+  strBase = funcBase(strFileName)
+  bolRun = strFileName in (strBase + '.log', strBase + '.idx')
+  if not bolRun or os.path.exists(strBase + '.log'):
+    strName = strFileName if not bolRun else strBase + '.log'
+    with (gzip.open(strName, 'rt', errors='replace') if strName.endswith('.gz') else open(strName, errors='replace')) as file:
+      for strLine in file:
+        yield strLine
+  if bolRun and os.path.exists(strBase + '.idx'):
+    for dictRow in funcReadIndex(strBase + '.idx'):
+      if (fltFrom is None or dictRow['last'] >= fltFrom) and (fltTo is None or dictRow['first'] <= fltTo):
+        for strLine in funcReadBlock(dictRow).splitlines(True):
+          yield strLine
+
+def funcLogExists(strFileName):
+  '''
+    True if funcLogLines() has a log to read.
+  '''
+  strBase = funcBase(strFileName)
+  return os.path.exists(strFileName) or (strFileName in (strBase + '.log', strBase + '.idx') and
+                                         os.path.exists(strBase + '.idx'))
+
+
+if __name__ == '__main__':
+
+  import sys
+
+  if len(sys.argv) > 1:                    # the lines of a log
+    lstTimes = [funcTime(strTime) for strTime in sys.argv[2:4]] + [None, None]
+    for strLine in funcLogLines(sys.argv[1], lstTimes[0], lstTimes[1]):
+      sys.stdout.write(strLine)
+    sys.exit()
+
+  # 2 days of a line a second in 4 MB segments, then one minute read back.
+  import tempfile
+
+  strLogName = os.path.join(tempfile.mkdtemp(), 'Demo_ChillerRun.log')
+  istStore = clsLogStore(strLogName, intSegment=4 << 20)
+  fltStart = time.time() - 2 * 86400
+  fltWrite = time.perf_counter()
+  for i in range(0, 2 * 86400, 10):        # batches of 10 lines
+    strText = ''.join('{} INFO: <DATA> Arduino FlowRate = {:4.2f} l/min\n'.format(
+                      time.strftime('%m/%d/%Y %I:%M:%S %p', time.localtime(fltStart + j)), 1 + j % 100 / 1e3)
+                      for j in range(i, i + 10))
+    istStore.write(strText, fltStart + i, fltStart + i + 9)
+  istStore.close()
+  fltWrite = time.perf_counter() - fltWrite
+  strDir = os.path.dirname(strLogName)
+  intPlain = 2 * 86400 * len(strText) // 10
+  intStored = sum(os.path.getsize(os.path.join(strDir, strName)) for strName in os.listdir(strDir))
+  print('{} lines in {:.1f} s, {:.1f} MB of lines stored in {:.1f} MB: {}'.format(2 * 86400, fltWrite, intPlain / 1e6,
+        intStored / 1e6, sorted(os.listdir(strDir))))
+
+  fltFrom = fltStart + 86400
+  fltRead = time.perf_counter()
+  lstLines = list(funcLogLines(strLogName, fltFrom, fltFrom + 60))
+  intBlocks = sum(1 for dictRow in funcReadIndex(istStore.strIndexName) if dictRow['last'] >= fltFrom and dictRow['first'] <= fltFrom + 60)
+  print('1 minute after 1 day: {} lines of {} blocks read in {:.1f} ms'.format(len(lstLines), intBlocks,
+        1e3 * (time.perf_counter() - fltRead)))
+  fltRead = time.perf_counter()
+  intAll = sum(1 for strLine in funcLogLines(strLogName))
+  print('whole log: {} lines read in {:.1f} ms'.format(intAll, 1e3 * (time.perf_counter() - fltRead)))
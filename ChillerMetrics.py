@@ -0,0 +1,357 @@
+'''
+  Program ChillerMetrics.py
+
+Description: ------------------------------------------------------------------
+   This file contains the command statistics of the chiller control.  Every
+exchange with a device (one try of clsChillerRun.executecommand) is counted
+per device and per command in a shared memory block:
+
+     - number of tries and their latency histogram (buckets of tupBuckets),
+       sum and maximum,
+     - retries (tries that failed) and failures (commands given up after
+       the last retry, the run then goes FATAL),
+     - time and reason of the last failed try.
+
+   The info command of the console prints them, and each device process logs
+its devices every fltReportPeriod seconds:
+
+     <HIDDEN> Commands Chiller PollCycle?: 3600 tries, mean 12.1 ms, p50 < 20 ms,
+              p99 < 50 ms, max 210.4 ms, 0 retries, 0 failures
+
+so a serial device slowing its control loop shows long before the watchdog
+finds the process stuck.
+
+   The block also holds the logging queue statistics, written by the listener
+(ChillerRun.procListener): messages and bytes taken off the queue, bytes per
+second and queue depth.
+
+History: ----------------------------------------------------------------------
+   V1.0 - Oct-2026  First release.
+   V1.1 - Oct-2026  Logging queue statistics.
+
+Environment: ------------------------------------------------------------------
+   This program is written in Python 3.8.  Python can be freely downloaded
+from http://www.python.org/.  The module multiprocessing.shared_memory needs
+Python 3.8 or newer.  This program has been tested on PCs running Windows 10.
+
+Author List: -------------------------------------------------------------------
+  R. McKay    Iowa State University, USA  mckay@iastate.edu
+  J. Yu       Iowa State University, USA  jieyu@iastate.edu
+  W. Heidorn  Iowa State University, USA  wheidorn@iastate.edu
+
+Notes: -------------------------------------------------------------------------
+   The block has one region per device with intSlots command slots.  Only the
+actor of the device (ChillerCommandBus.py), in the process owning it, writes
+the region, so the slots need no lock: a writer bumps the slot counter to odd
+and back to even around an update, readers copy and retry, as the arrays of
+ChillerSharedState.py: after intRetries odd counters a reader takes the copy
+as it is.  A writer killed in an update (watchdog, threads runtime) leaves its
+counter odd, the next writer makes it even again before its own update.
+   A command takes the next free slot of its device the
+first time it is sent.
+   funcMetricsSetup() in ChillerCtrl.py creates the block and passes its name
+to the processes in the environment, funcMetrics() attaches to it.
+
+Dictionary of abbreviations: ---------------------------------------------------
+  bol - boolean
+  cls - class
+  cmd - command
+  dict - dictionary
+  flt - float
+  func - function
+  int - integer
+  ist - instance
+  lst - list
+  stc - structure (ctypes)
+  str - string
+  tup - tuple
+'''
+
+# Import section --------------------------------------------------------------
+
+import os
+import time
+import atexit
+import ctypes
+import logging
+from multiprocessing import shared_memory
+
+strMetricsEnv = 'CHILLER_METRICS'    # name of the shared memory block
+tupBuckets = (0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1., 2., 5., 10., float('inf'))  # seconds
+fltReportPeriod = 3600.              # seconds between two logs of a device
+fltRatePeriod = 10.                  # seconds of the log queue byte rate
+intRetries = 10000                   # reader tries before it stops waiting for a writer
+
+_istMetrics = None                   # block of this process
+
+# ------------------------------------------------------------------------------
+class stcCommand(ctypes.Structure):
+  _fields_ = [('intSeqLock',  ctypes.c_uint64),       # odd while written
+              ('strName',     ctypes.c_char * 24),    # e.g. PollCycle?, empty if free
+              ('intTries',    ctypes.c_uint64),
+              ('intRetries',  ctypes.c_uint64),       # tries that failed
+              ('intFailures', ctypes.c_uint64),       # commands given up
+              ('fltSum',      ctypes.c_double),       # latency of the tries, seconds
+              ('fltMax',      ctypes.c_double),
+              ('intBuckets',  ctypes.c_uint64 * len(tupBuckets)),
+              ('fltFailTime', ctypes.c_double),       # time.time() of the last failed try
+              ('strReason',   ctypes.c_char * 80)]    # its exception
+
+class stcLogQueue(ctypes.Structure):
+  _fields_ = [('intSeqLock',   ctypes.c_uint64),      # odd while written
+              ('intMessages',  ctypes.c_uint64),      # taken off the queue
+              ('intBytes',     ctypes.c_uint64),      # of message text
+              ('fltRate',      ctypes.c_double),      # bytes per second, last fltRatePeriod
+              ('intDepth',     ctypes.c_int64),       # messages waiting, -1 unknown
+              ('intMaxDepth',  ctypes.c_int64),
+              ('fltTime',      ctypes.c_double)]      # time.time() of the last update
+
+class stcHeader(ctypes.Structure):
+  _fields_ = [('intDevices', ctypes.c_uint32),
+              ('intSlots',   ctypes.c_uint32)]
+
+def _stcLayout(intDevices, intSlots):
+  stcDevice = type('stcDevice', (ctypes.Structure,), {'_fields_': [
+                   ('strName',   ctypes.c_char * 16),
+                   ('intUsed',   ctypes.c_uint32),
+                   ('stcCommands', stcCommand * intSlots)]})
+  return type('stcMetrics', (ctypes.Structure,), {'_fields_': [
+              ('stcHeader',  stcHeader),
+              ('stcLogQueue', stcLogQueue),
+              ('stcDevices', stcDevice * intDevices)]})
+
+# ------------------------------------------------------------------------------
+def funcPercentile(lstBuckets, fltQ):
+  '''
+    Upper bound (seconds) of the bucket holding the quantile fltQ of a histogram.
+  '''
+  intTotal = sum(lstBuckets)
+  intCount = 0
+  for fltBound, intBucket in zip(tupBuckets, lstBuckets):
+    intCount += intBucket
+    if intCount >= fltQ * intTotal and intTotal:
+      return fltBound
+  return 0.
+
+def funcCopy(stc, clsStc):
+  '''
+    Consistent copy of a structure with a seqlock, as it is when the counter
+  stays odd (a writer killed in an update).
+  '''
+  for iTry in range(intRetries):
+    intSeqLock = stc.intSeqLock
+    if intSeqLock & 1:
+      time.sleep(0)
+      continue
+    stcCopy = clsStc.from_buffer_copy(stc)
+    if stc.intSeqLock == intSeqLock:
+      return stcCopy
+  return clsStc.from_buffer_copy(stc)
+
+# ------------------------------------------------------------------------------
+# Class Command Metrics --------------------------------------------------------
+class clsCommandMetrics:
+  def __init__(self, lstDevNames=None, intSlots=None, strRuntime='processes', strName=None):
+    '''
+      lstDevNames and intSlots (commands per device) create the block, strName
+    attaches to an existing one.
+    '''
+    if strName is not None:                      # attach, the header gives the layout
+      self._shm = shared_memory.SharedMemory(name=strName)
+      istHeader = stcHeader.from_buffer_copy(self._shm.buf[:ctypes.sizeof(stcHeader)])
+      stcMetrics = _stcLayout(istHeader.intDevices, istHeader.intSlots)
+      buf = self._shm.buf
+    else:
+      stcMetrics = _stcLayout(len(lstDevNames), intSlots)
+      if strRuntime == 'threads':
+        self._shm = None
+        buf = bytearray(ctypes.sizeof(stcMetrics))
+      else:
+        self._shm = shared_memory.SharedMemory(create=True, size=ctypes.sizeof(stcMetrics))
+        buf = self._shm.buf
+        atexit.register(self._shm.unlink)
+    # Mapped by address, see ChillerSharedState.py
+    cFirst = ctypes.c_char.from_buffer(buf)
+    self._buf = buf
+    self._stc = stcMetrics.from_address(ctypes.addressof(cFirst))
+    del cFirst
+    if strName is None:
+      self._stc.stcHeader.intDevices = len(lstDevNames)
+      self._stc.stcHeader.intSlots = intSlots
+      for stcDevice, strDevName in zip(self._stc.stcDevices, lstDevNames):
+        stcDevice.strName = strDevName.encode()
+    self._dictDevices = {stcDevice.strName.decode(): stcDevice for stcDevice in self._stc.stcDevices}
+    self._dictSlots = {}                         # (device, command) -> stcCommand written here
+    self._dictReport = {}                        # device -> time.monotonic() of the next log
+    self._tupRateStart = (time.monotonic(), 0)   # log queue rate: start and bytes then
+
+  def name(self):
+    return self._shm.name if self._shm is not None else None
+
+  def devicenames(self):
+    return list(self._dictDevices.keys())
+
+  def _slot(self, strDevName, strCmdName):
+    '''
+      Slot of a command, taken on first use.  None if the device is unknown
+    or its slots are all used.
+    '''
+    tupKey = (strDevName, strCmdName)
+    if tupKey not in self._dictSlots:
+      stcDevice = self._dictDevices.get(strDevName)
+      if stcDevice is None:
+        return None
+      bytName = strCmdName.encode()[:23]
+      for stcSlot in stcDevice.stcCommands[:stcDevice.intUsed]:  # a restarted process
+        if stcSlot.strName == bytName:
+          break
+      else:
+        if stcDevice.intUsed >= len(stcDevice.stcCommands):
+          logging.warning(' Command statistics: no slot left for ' + strDevName + ' ' + strCmdName)
+          self._dictSlots[tupKey] = None
+          return None
+        stcSlot = stcDevice.stcCommands[stcDevice.intUsed]
+        stcSlot.strName = bytName
+        stcDevice.intUsed += 1
+      self._dictSlots[tupKey] = stcSlot
+    return self._dictSlots[tupKey]
+
+  def record(self, strDevName, strCmdName, fltLatency, strError=None, bolGiveUp=False):
+    '''
+      One try of a command: fltLatency seconds, strError if it failed, bolGiveUp
+    if it was the last one.
+    '''
+    stcSlot = self._slot(strDevName, strCmdName)
+    if stcSlot is None:
+      return
+    intBucket = 0
+    while fltLatency > tupBuckets[intBucket]:
+      intBucket += 1
+    if stcSlot.intSeqLock & 1:                   # left odd by a killed writer
+      stcSlot.intSeqLock += 1
+    stcSlot.intSeqLock += 1
+    stcSlot.intTries += 1
+    stcSlot.fltSum += fltLatency
+    stcSlot.fltMax = max(stcSlot.fltMax, fltLatency)
+    stcSlot.intBuckets[intBucket] += 1
+    if strError is not None:
+      stcSlot.intRetries += 1
+      stcSlot.intFailures += bolGiveUp
+      stcSlot.fltFailTime = time.time()
+      stcSlot.strReason = strError.encode(errors='replace')[:79]
+    stcSlot.intSeqLock += 1
+
+    fltNow = time.monotonic()
+    if fltNow >= self._dictReport.setdefault(strDevName, fltNow + fltReportPeriod) or bolGiveUp:
+      self._dictReport[strDevName] = fltNow + fltReportPeriod
+      for strLine in self.table(strDevName):
+        logging.info('<HIDDEN> Commands ' + strLine)
+
+  def recordqueue(self, intMessages, intBytes, intDepth):
+    '''
+      intMessages of intBytes taken off the logging queue, intDepth messages
+    still waiting (-1 if the queue cannot tell).  Listener only.
+    '''
+    stcQueue = self._stc.stcLogQueue
+    fltNow = time.monotonic()
+    fltStart, intStartBytes = self._tupRateStart
+    if stcQueue.intSeqLock & 1:                  # left odd by a killed listener
+      stcQueue.intSeqLock += 1
+    stcQueue.intSeqLock += 1
+    stcQueue.intMessages += intMessages
+    stcQueue.intBytes += intBytes
+    stcQueue.intDepth = intDepth
+    stcQueue.intMaxDepth = max(stcQueue.intMaxDepth, intDepth)
+    stcQueue.fltTime = time.time()
+    if fltNow - fltStart >= fltRatePeriod:
+      stcQueue.fltRate = (stcQueue.intBytes - intStartBytes) / (fltNow - fltStart)
+      self._tupRateStart = (fltNow, stcQueue.intBytes)
+    stcQueue.intSeqLock += 1
+
+  def queuestats(self):
+    '''
+      {messages, bytes, rate, depth, max_depth, time} of the logging queue.
+    '''
+    stcCopy = funcCopy(self._stc.stcLogQueue, stcLogQueue)
+    return {'messages': stcCopy.intMessages, 'bytes': stcCopy.intBytes, 'rate': stcCopy.fltRate,
+            'depth': stcCopy.intDepth, 'max_depth': stcCopy.intMaxDepth, 'time': stcCopy.fltTime}
+
+  def stats(self, strDevName=None):
+    '''
+      [{device, command, tries, retries, failures, mean, max, p50, p99, fail_time,
+      reason}] of the commands sent so far, of one device or all.
+    '''
+    lstStats = []
+    for strName, stcDevice in self._dictDevices.items():
+      if strDevName is not None and strName != strDevName:
+        continue
+      for stcSlot in stcDevice.stcCommands[:stcDevice.intUsed]:
+        stcCopy = funcCopy(stcSlot, stcCommand)  # consistent copy of the slot
+        lstBuckets = stcCopy.intBuckets[:]
+        lstStats.append({'device': strName, 'command': stcCopy.strName.decode(),
+                         'tries': stcCopy.intTries, 'retries': stcCopy.intRetries,
+                         'failures': stcCopy.intFailures, 'buckets': lstBuckets,
+                         'mean': stcCopy.fltSum / stcCopy.intTries if stcCopy.intTries else 0.,
+                         'max': stcCopy.fltMax, 'p50': funcPercentile(lstBuckets, 0.5),
+                         'p99': funcPercentile(lstBuckets, 0.99), 'fail_time': stcCopy.fltFailTime,
+                         'reason': stcCopy.strReason.decode(errors='replace')})
+    return lstStats
+
+  def table(self, strDevName=None):
+    '''
+      One line per command, for the console and the log.
+    '''
+    lstLines = []
+    for dictStats in self.stats(strDevName):
+      strLine = '{:12s} {:16s} {:6d} tries, mean {:7.1f} ms, p50 < {:g} ms, p99 < {:g} ms, max {:7.1f} ms, ' \
+                '{} retries, {} failures'.format(dictStats['device'], dictStats['command'], dictStats['tries'],
+                1e3 * dictStats['mean'], 1e3 * dictStats['p50'], 1e3 * dictStats['p99'],
+                1e3 * dictStats['max'], dictStats['retries'], dictStats['failures'])
+      if dictStats['retries']:
+        strLine += ', last {} ({})'.format(time.strftime('%H:%M:%S', time.localtime(dictStats['fail_time'])),
+                                           dictStats['reason'])
+      lstLines.append(strLine)
+    return lstLines
+
+# ------------------------------------------------------------------------------
+def funcMetricsSetup(lstDevNames, intSlots, strRuntime='processes'):
+  '''
+    Called once by the main program before the processes start.
+  '''
+  global _istMetrics
+  _istMetrics = clsCommandMetrics(lstDevNames, intSlots, strRuntime)
+  if _istMetrics.name() is not None:
+    os.environ[strMetricsEnv] = _istMetrics.name()
+  return _istMetrics
+
+def funcMetrics():
+  '''
+    The block of this process, attached on the first call.  None without
+  funcMetricsSetup() (a routine run alone).
+  '''
+  global _istMetrics
+  if _istMetrics is None and os.environ.get(strMetricsEnv):
+    _istMetrics = clsCommandMetrics(strName=os.environ[strMetricsEnv])
+  return _istMetrics
+
+
+if __name__ == '__main__':
+
+  # A fake device: 1000 polls of 1-30 ms, 2 % failing, and the cost of record().
+  import random
+
+  istMetrics = funcMetricsSetup(['Chiller', 'Pump'], 4, 'threads')
+  for i in range(1000):
+    fltLatency = random.uniform(0.001, 0.03)
+    strError = 'Bad Response!' if random.random() < 0.02 else None
+    istMetrics.record('Chiller', 'PollCycle?', fltLatency, strError)
+  istMetrics.record('Pump', 'RPS=', 1.2, 'timeout', bolGiveUp=True)
+  print('\n'.join(istMetrics.table()))
+  istMetrics.recordqueue(10, 800, 3)
+  print(istMetrics.queuestats())
+
+  intCount = 100000
+  fltStart = time.perf_counter()
+  for i in range(intCount):
+    istMetrics.record('Chiller', 'PollCycle?', 0.012)
+  print('record(): {:.2f} us'.format(1e6 * (time.perf_counter() - fltStart) / intCount))
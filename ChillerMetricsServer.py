@@ -0,0 +1,247 @@
+'''
+  Program ChillerMetricsServer.py
+
+Description: ------------------------------------------------------------------
+   This file contains the optional HTTP metrics endpoint of the chiller control.
+With  --metrics-port=PORT  the main program serves on http://127.0.0.1:PORT/metrics
+the live state in the OpenMetrics text format, for the monitoring to scrape:
+
+     - temperatures, humidity, pump setting, flow rate set and measured,
+       and the slope of the temperatures over the last fltSlopeWindow seconds,
+     - update counters and times of the shared arrays,
+     - status code, system setting, loop progress, state of each process,
+     - the command statistics of ChillerMetrics.py: latency histogram,
+       retries and failures per device and command,
+     - depth of the logging queue, messages and bytes through it.
+
+   Every scrape reads snapshots of the shared memory (no lock, no device
+access), so it costs the control loops nothing.  Building the text takes
+about 2.5 ms, most of it the slope windows of the temperature history
+(python ChillerMetricsServer.py).
+   A port already in use does not stop the control program: it logs a
+warning and runs without the endpoint.
+
+History: ----------------------------------------------------------------------
+   V1.0 - Oct-2026  First release.
+   V1.1 - Oct-2026  Logging queue.
+
+Environment: ------------------------------------------------------------------
+   This program is written in Python 3.8.  Python can be freely downloaded
+from http://www.python.org/.  This program has been tested on PCs running
+Windows 10.
+
+Author List: -------------------------------------------------------------------
+  R. McKay    Iowa State University, USA  mckay@iastate.edu
+  J. Yu       Iowa State University, USA  jieyu@iastate.edu
+  W. Heidorn  Iowa State University, USA  wheidorn@iastate.edu
+
+Notes: -------------------------------------------------------------------------
+   The server listens on localhost only.  Scraping from another machine goes
+through a proxy or an ssh tunnel.
+   OpenMetrics: https://github.com/OpenObservability/OpenMetrics/blob/main/specification/OpenMetrics.md
+
+Dictionary of abbreviations: ---------------------------------------------------
+  bol - boolean
+  cls - class
+  dict - dictionary
+  flt - float
+  func - function
+  int - integer
+  ist - instance
+  lst - list
+  str - string
+'''
+
+# Import section --------------------------------------------------------------
+
+import logging
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from ChillerRun import StatusCode, SysSettings, Process, ProcessState
+from ChillerMetrics import tupBuckets
+
+strContentType = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+fltSlopeWindow = 600.      # seconds of history of the temperature slopes
+lstTempNames = ['TSet', 'TRes', 'Tin', 'Tout', 'Tbox', 'Troo', 'Thum1', 'Thum2']   # as info
+
+# ------------------------------------------------------------------------------
+# Class OpenMetrics ------------------------------------------------------------
+class clsOpenMetrics:
+  def __init__(self):
+    '''
+      Text of one exposition, a family at a time.
+    '''
+    self._lstLines = []
+
+  def family(self, strName, strType, strHelp, strUnit=None):
+    self._lstLines.append('# TYPE ' + strName + ' ' + strType)
+    if strUnit:
+      self._lstLines.append('# UNIT ' + strName + ' ' + strUnit)
+    self._lstLines.append('# HELP ' + strName + ' ' + strHelp)
+
+  def sample(self, strName, value, dictLabels=None):
+    strLabels = ''
+    if dictLabels:
+      strLabels = '{' + ','.join('{}="{}"'.format(strKey, str(strValue).replace('\\', r'\\').replace('"', r'\"'))
+                                 for strKey, strValue in dictLabels.items()) + '}'
+    self._lstLines.append(strName + strLabels + ' ' + repr(float(value)))
+
+  def text(self):
+    return '\n'.join(self._lstLines + ['# EOF', ''])
+
+# ------------------------------------------------------------------------------
+def funcExposition(istState, intStatusCode, intProcessStates, fltHumidity, fltProgress, istMetrics=None):
+  '''
+    OpenMetrics text of the shared state and the command statistics.
+  '''
+  dictState = istState.snapshot()            # {array: (values, seqs, times)}
+  lstTemps = dictState['fltTemps'][0]
+  lstRPS = dictState['fltRPS'][0]
+  lstLPM = dictState['fltLPM'][0]
+  istOut = clsOpenMetrics()
+
+  istOut.family('chiller_temperature_celsius', 'gauge', 'Set, reservoir, stave, box, room and humidity logger temperatures.', 'celsius')
+  for strName, fltTemp in zip(lstTempNames, lstTemps):
+    istOut.sample('chiller_temperature_celsius', fltTemp, {'sensor': strName})
+  istOut.family('chiller_temperature_slope_celsius_per_minute', 'gauge',
+                'Least squares slope of the temperatures over the last {:g} s.'.format(fltSlopeWindow))
+  for i, strName in enumerate(lstTempNames):
+    fltSlope = istState.fltTemps.window(i, fltSlopeWindow).slope
+    if fltSlope is not None:
+      istOut.sample('chiller_temperature_slope_celsius_per_minute', 60 * fltSlope, {'sensor': strName})
+  istOut.family('chiller_humidity_percent', 'gauge', 'Relative humidity.', 'percent')
+  istOut.sample('chiller_humidity_percent', fltHumidity.value)
+  istOut.family('chiller_pump_rps', 'gauge', 'Booster pump setting, rotations per second.')
+  istOut.sample('chiller_pump_rps', lstRPS[0])
+  istOut.family('chiller_flow_lpm', 'gauge', 'Coolant flow rate, l/min.')
+  istOut.sample('chiller_flow_lpm', lstLPM[0], {'kind': 'set'})
+  istOut.sample('chiller_flow_lpm', lstLPM[1], {'kind': 'measured'})
+
+  istOut.family('chiller_channel_updates', 'counter', 'Updates of each element of the shared arrays.')
+  for strArray, (lstValues, lstSeqs, lstTimes) in dictState.items():
+    for i, intSeq in enumerate(lstSeqs):
+      istOut.sample('chiller_channel_updates_total', intSeq, {'array': strArray, 'index': i})
+  istOut.family('chiller_channel_update_time_seconds', 'gauge', 'Time of the last update of each element of the shared arrays.', 'seconds')
+  for strArray, (lstValues, lstSeqs, lstTimes) in dictState.items():
+    for i, fltTime in enumerate(lstTimes):
+      istOut.sample('chiller_channel_update_time_seconds', fltTime, {'array': strArray, 'index': i})
+
+  intStatus = intStatusCode.value
+  istOut.family('chiller_status', 'stateset', 'Global status code.')
+  for istCode in StatusCode:
+    istOut.sample('chiller_status', istCode == intStatus, {'chiller_status': istCode.name})
+  intSetting = dictState['intSettings'][0][0]
+  istOut.family('chiller_setting', 'stateset', 'System setting.')
+  for istSetting in SysSettings:
+    istOut.sample('chiller_setting', istSetting == intSetting, {'chiller_setting': istSetting.name})
+  istOut.family('chiller_progress_percent', 'gauge', 'Progress of the routine.', 'percent')
+  istOut.sample('chiller_progress_percent', fltProgress.value)
+  istOut.family('chiller_process_state', 'gauge', 'State of each process, ' +
+                ', '.join('{}={}'.format(istProcState.name, int(istProcState)) for istProcState in ProcessState) + '.')
+  for istProcess, intState in zip(Process, intProcessStates[:]):
+    istOut.sample('chiller_process_state', intState, {'process': istProcess.name})
+
+  if istMetrics is not None:
+    lstStats = istMetrics.stats()
+    istOut.family('chiller_command_latency_seconds', 'histogram', 'Latency of each try of a device command.', 'seconds')
+    for dictStats in lstStats:
+      dictLabels = {'device': dictStats['device'], 'command': dictStats['command']}
+      intCount = 0
+      for fltBound, intBucket in zip(tupBuckets, dictStats['buckets']):
+        intCount += intBucket
+        istOut.sample('chiller_command_latency_seconds_bucket', intCount, dict(dictLabels, le='{:g}'.format(fltBound).replace('inf', '+Inf')))
+      istOut.sample('chiller_command_latency_seconds_count', dictStats['tries'], dictLabels)
+      istOut.sample('chiller_command_latency_seconds_sum', dictStats['mean'] * dictStats['tries'], dictLabels)
+    istOut.family('chiller_command_retries', 'counter', 'Tries of a device command that failed.')
+    for dictStats in lstStats:
+      istOut.sample('chiller_command_retries_total', dictStats['retries'], {'device': dictStats['device'], 'command': dictStats['command']})
+    istOut.family('chiller_command_failures', 'counter', 'Device commands given up after the last retry.')
+    for dictStats in lstStats:
+      istOut.sample('chiller_command_failures_total', dictStats['failures'], {'device': dictStats['device'], 'command': dictStats['command']})
+
+    dictQueue = istMetrics.queuestats()
+    istOut.family('chiller_log_queue_depth', 'gauge', 'Log messages waiting for the listener, -1 unknown.')
+    istOut.sample('chiller_log_queue_depth', dictQueue['depth'])
+    istOut.family('chiller_log_queue_messages', 'counter', 'Log messages taken off the queue.')
+    istOut.sample('chiller_log_queue_messages_total', dictQueue['messages'])
+    istOut.family('chiller_log_queue_bytes', 'counter', 'Bytes of log message text taken off the queue.', 'bytes')
+    istOut.sample('chiller_log_queue_bytes_total', dictQueue['bytes'])
+    istOut.family('chiller_log_queue_rate_bytes_per_second', 'gauge', 'Bytes of log message text per second, last 10 s.')
+    istOut.sample('chiller_log_queue_rate_bytes_per_second', dictQueue['rate'])
+  return istOut.text()
+
+# ------------------------------------------------------------------------------
+class _clsHandler(BaseHTTPRequestHandler):
+  funcText = None                            # set by clsMetricsServer
+
+  def do_GET(self):
+    if self.path.split('?')[0] not in ('/', '/metrics'):
+      self.send_error(404)
+      return
+    try:
+      bytBody = self.funcText().encode()
+    except Exception as err:
+      logging.warning(' Metrics server: ' + repr(err))
+      self.send_error(500)
+      return
+    self.send_response(200)
+    self.send_header('Content-Type', strContentType)
+    self.send_header('Content-Length', str(len(bytBody)))
+    self.end_headers()
+    self.wfile.write(bytBody)
+
+  def log_message(self, strFormat, *args):   # no line on the console per scrape
+    logging.debug(' Metrics server: ' + strFormat % args)
+
+class _clsHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+  daemon_threads = True
+
+# ------------------------------------------------------------------------------
+# Class Metrics Server ---------------------------------------------------------
+class clsMetricsServer:
+  def __init__(self, intPort, funcText, strHost='127.0.0.1'):
+    '''
+      Serve funcText() on http://strHost:intPort/metrics from a daemon thread.
+    '''
+    clsHandler = type('clsHandler', (_clsHandler,), {'funcText': staticmethod(funcText)})
+    self._istServer = _clsHTTPServer((strHost, intPort), clsHandler)
+    self.intPort = self._istServer.server_address[1]
+    threading.Thread(target=self._istServer.serve_forever, name='Metrics', daemon=True).start()
+    logging.info(' Metrics server on http://' + strHost + ':' + str(self.intPort) + '/metrics')
+
+  def close(self):
+    self._istServer.shutdown()
+    self._istServer.server_close()
+
+
+if __name__ == '__main__':
+
+  # Serve a threads runtime state on a free port and scrape it.
+  import time
+  import urllib.request
+  from multiprocessing import Value, Array
+  from ChillerSharedState import clsSharedState
+  from ChillerMetrics import funcMetricsSetup
+
+  istState = clsSharedState([('intSettings', 'i', [SysSettings.BOOT, 0, 0, 0]), ('fltTemps', 'd', [20] * 8),
+                             ('fltHumidity', 'd', [45]), ('fltRPS', 'd', [10, 10]), ('fltLPM', 'd', [0.5, 0])],
+                            'threads', dictHistory={'fltTemps': (14400, 0.)})
+  for i in range(600):                     # 10 min of TRes cooling 0.5 C/min
+    istState.fltTemps.update([1], [20 - i / 120.])
+    istState.fltTemps._stc.fltRowTime[i] -= 600 - i
+  istMetrics = funcMetricsSetup(['Chiller'], 2, 'threads')
+  istMetrics.record('Chiller', 'PollCycle?', 0.012)
+  lstArgs = (istState, Value('i', 0), Array('i', [0] * 7), istState.fltHumidity, Value('d', 0.), istMetrics)
+  istServer = clsMetricsServer(0, lambda: funcExposition(*lstArgs))
+  strURL = 'http://127.0.0.1:' + str(istServer.intPort) + '/metrics'
+  print(urllib.request.urlopen(strURL).read().decode()[:600], '...')
+  fltStart = time.perf_counter()
+  for i in range(200):
+    urllib.request.urlopen(strURL).read()
+  print('scrape: {:.2f} ms'.format(1e3 * (time.perf_counter() - fltStart) / 200))
+  fltStart = time.perf_counter()
+  for i in range(200):
+    funcExposition(*lstArgs)
+  print('exposition: {:.3f} ms'.format(1e3 * (time.perf_counter() - fltStart) / 200))
+  istServer.close()
@@ -73,6 +73,13 @@ class clsPseudoDevice:
     """
     return 0
 
+# ----------------------------
+  def samples(self) :
+    """
+      function to get the last read out values without copy, see ChillerDevices.py
+    """
+    return self.last()
+
 
 # ------------------------------------------------------------------------------
 # Class Pseudo Humidity (inherited Device) -------------------------------------
@@ -203,11 +210,17 @@ class clsPseudoChiller ( clsPseudoDevice ):
     TRes  = TResOld*( 1- TempPercentChange)+ TSet*TempPercentChange
 
     self._value = round(TRes,4)
+    if ' ' in strcmdname.strip():
+      self._dictPoll = { 'ALMCODE?' : 0.0, 'PTLOC?' : self._value, 'SP?' : TSet, 'PUMP?' : 255.0, 'REFRSW?' : -1.0 }
 
 # ----------------------------
   def last(self) :
     return self._value
 
+# ----------------------------
+  def lastpoll(self) :
+    return getattr(self, '_dictPoll', {})
+
 # ------------------------------------------------------------------------------
 # Class Pump (inherited device) ------------------------------------------------
 class clsPseudoPump ( clsPseudoDevice ):
@@ -223,6 +236,10 @@ class clsPseudoPump ( clsPseudoDevice ):
     """
       Pump: function of reading data
     """
+    if strcmdname == 'TELEMETRY':
+      fltFrequency = round(10 + 2 * random.random(), 1)
+      self._value = {'STATUS': 3, 'FAULT': 0, 'FREQUENCY': fltFrequency, 'CURRENT': round(0.1 * fltFrequency, 1)}
+      return
     if int(random.random() * 1000) % 2 == 0 :
       self._value = 10
     else:
@@ -10,6 +10,8 @@
 		
 	History: --------------------------------------------------------------------
 	  v1.0 - First public release.
+	  v1.1 - Oct-2026  The parser is not kept, commands are held in dictionaries
+	         which pickle, so ChillerRdConfig.funcCompiled can cache them.
 	  
 	Environment: ----------------------------------------------------------------
 	  This program is written in Python 3.6.2.  Python can be freely downloaded
@@ -37,6 +39,9 @@
 
     * cfgname()
       - return: the configuration file name
+
+    * funcCommands( strCmdFileName )
+      - return: clsCommands of the file, parsed once and cached
 		
 	Dictionary of abbreviations: ------------------------------------------------
 	  cmd = command
@@ -52,6 +57,15 @@
 import configparser   # Configurable parser functions/classes.
 import logging        # Flexible event logging funtions/classes.
 import re             # Regular expression operations.
+from ChillerRdConfig import funcCompiled   # Parse once, cache by file modification time.
+
+
+# ------------------------------------------------------------------------------
+# function funcCommands( strCmdFileName ):
+#   compiled clsCommands of the file, through funcCompiled
+#
+def funcCommands(strCmdFileName):
+  return funcCompiled(strCmdFileName, lambda strFileName: clsCommands(strFileName, False))
 
 
 # Class section ---------------------------------------------------------------
@@ -85,34 +99,37 @@ class clsCommands:
     # if lower case keys preferred, use ConfigParser
     #
 
-    self._istcmdcfg = configparser.RawConfigParser( allow_no_value=True )
-    self._istcmdcfg.read( strCmdFileName )
+    istcmdcfg = configparser.RawConfigParser( allow_no_value=True )
+    istcmdcfg.read( strCmdFileName )
     logging.info( self._strClassName + ' Loading command file: ' + strCmdFileName );
 
     #
     # load the configuration device by device
     # and key (command) by key
+    # into dictionaries: {device name: {command (lower case): value}}
     #
 
-    for strDevName in self._istcmdcfg.sections():
+    self._dictcmdcfg = {}
+    for strDevName in istcmdcfg.sections():
       logging.debug( self._strClassName + ' Device name: ' + strDevName)
 
-      for strCmdKey in self._istcmdcfg[strDevName]:
-        strValcomment = self._istcmdcfg[strDevName][strCmdKey]
+      self._dictcmdcfg[strDevName] = {}
+      for strCmdKey in istcmdcfg[strDevName]:
+        strValcomment = istcmdcfg[strDevName][strCmdKey] or ''
 
         #
         # fixing the inline comment problem
         # assuming the comments starting with '#'
         #
         strVal = [x for x in strValcomment.split('#')][0].strip()
-        self._istcmdcfg.set(strDevName, strCmdKey, strVal)
+        self._dictcmdcfg[strDevName][strCmdKey] = strVal
         logging.debug( self._strClassName + '  command, value: ' + strCmdKey + ' '+ strVal)
 
     #
     # check if __shnamesection is defined in the command config file,
     # if not print the error !!
     #
-    if self.__shnamesection not in self._istcmdcfg.sections() :
+    if self.__shnamesection not in self._dictcmdcfg :
       logging.error( self._strClassName + ' Command configuration having no ' + self.__shnamesection + ' section! ')
       logging.error( self._strClassName + ' Needed to interpret the input commands, please check ' + self._strName )
       raise ValueError ( self._strClassName + ' ' + self.__shnamesection + ' section not found.' )
@@ -150,14 +167,14 @@ class clsCommands:
     #
     # device name obtained through Short Name
     #
-    strDevName = self._istcmdcfg[ self.__shnamesection ][ strShName ]
+    strDevName = self._dictcmdcfg[ self.__shnamesection ][ strShName.lower() ]
     
     strCmdVal = ''
-    if strCmdName not in self._istcmdcfg[ strDevName ]:
+    if strCmdName.lower() not in self._dictcmdcfg[ strDevName ]:
       logging.error( self._strClassName + ' Command ' + strCmdName + ' not found in section ' + strDevName + ' config file: ' + self._strName )
       return None
     else :
-      strCmdVal = self._istcmdcfg[ strDevName ][ strCmdName ]
+      strCmdVal = self._dictcmdcfg[ strDevName ][ strCmdName.lower() ]
 
     return (strDevName, strCmdVal, strCmdPar)
 
@@ -170,7 +187,7 @@ class clsCommands:
       function to get the list of the devices names
       which are the section names in the configuration file
     """
-    return self._istcmdcfg.sections()
+    return list( self._dictcmdcfg.keys() )
 
 # ------------------------------------------------------------------------------
 # function devicekeys(strDevName):
@@ -182,10 +199,10 @@ class clsCommands:
       function to get the list of the commands for each device
       which are the keys of the device section
     """
-    if strDevName not in self._istcmdcfg.sections():
+    if strDevName not in self._dictcmdcfg:
       logging.error( self._strClassName + ' Device ' + strDevName + ' not found in config file: ' + self._strName )
       return None
-    return list( self._istcmdcfg[ strDevName ].keys() )
+    return list( self._dictcmdcfg[ strDevName ].keys() )
  
 
 # ------------------------------------------------------------------------------
@@ -18,6 +18,9 @@ History: ----------------------------------------------------------------------
   V1.4 - Jul-2018  Added code for the Arduino UNO to read the flow meter (Proteus
            08004BN1) and control three actuators (Swagelok SS-62TS4-41DC).
            Updated comments and modified screen messages to operator.
+  V1.5 - Oct-2026  The file is parsed once into an immutable, typed snapshot
+           (getint, getfloat, getlist), kept in an on-disk cache checked against
+           the file modification time, see funcCompiled.
 Environment: ------------------------------------------------------------------
   This program is written in Python 3.6.  Python can be freely downloaded from 
 http://www.python.org/.  This program has been tested on PCs running Windows 10.
@@ -28,10 +31,21 @@ Author List: -------------------------------------------------------------------
   W. Heidorn  Iowa State University, USA  wheidorn@iastate.edu
   
 Notes: -------------------------------------------------------------------------
+  Keys are not case sensitive (stored in lower case), section names are.
+  ChillerCtrl.py compiles the configuration and command files once before it
+starts the processes.  The processes then get them from the cache file
+(strCacheName) instead of parsing the text files again.
 
 Dictionary of abbreviations: ---------------------------------------------------
+  bol - boolean
   cls - class
+  dict - dictionary
+  flt - float
+  int - integer
+  ist - instance
+  lst - list
   str - string
+  tup - tuple
 '''
 
 # function __init__ ( strconfname ): 
@@ -48,10 +62,86 @@ Dictionary of abbreviations: ---------------------------------------------------
 #   provide the section (device) name
 #   return the list of keys for this section (device)
 #
+# function getint / getfloat / getlist( strsection, strkey )
+#   same as get, value converted when the file was parsed
+#
+# function funcConfig( strconfname ):
+#   clsConfig( strconfname, None ) through funcCompiled
+#
+# function funcCompiled( strFileName, funcBuild ):
+#   return funcBuild( strFileName ), from the cache file while the file is unchanged
+#
 
 # Import section --------------------------------------------------------------
 import configparser
 import logging
+import os
+import pickle
+
+strCacheName = '.ChillerConfig.cache'   # compiled configuration and command files
+intCacheVersion = 1                      # increase when the compiled classes change
+_dictCompiled = {}                       # compiled files of this process
+
+# ------------------------------------------------------------------------------
+def _funcTyped(strval):
+  '''
+    int, float or the string itself.
+  '''
+  for funcType in (int, float):
+    try:
+      return funcType(strval)
+    except ValueError:
+      pass
+  return strval
+
+# ------------------------------------------------------------------------------
+def funcConfig(strconfname):
+  '''
+    Compiled clsConfig of the file, all sections logged when it is parsed.
+  '''
+  return funcCompiled(strconfname, lambda strFileName: clsConfig(strFileName, None))
+
+# ------------------------------------------------------------------------------
+def funcCompiled(strFileName, funcBuild):
+  '''
+    Return funcBuild(strFileName), e.g. a clsConfig or clsCommands of the file.
+  It is built once per process and once per change of the file: the result is
+  pickled to strCacheName with the modification time and size of the file and
+  loaded from there while they are the same.
+  '''
+  try:
+    stat = os.stat(strFileName)
+    tupKey = (os.path.abspath(strFileName), stat.st_mtime_ns, stat.st_size)
+  except OSError:
+    return funcBuild(strFileName)         # let the class report the missing file
+  if tupKey in _dictCompiled:
+    return _dictCompiled[tupKey]
+
+  dictCache = {}
+  try:
+    with open(strCacheName, 'rb') as fileCache:
+      intVersion, dictCache = pickle.load(fileCache)
+    if intVersion != intCacheVersion:
+      dictCache = {}
+  except Exception:                       # no cache yet, or a broken one
+    dictCache = {}
+
+  if tupKey in dictCache:
+    logging.debug('Configuration file ' + strFileName + ' loaded from ' + strCacheName)
+    istCompiled = dictCache[tupKey]
+  else:
+    istCompiled = funcBuild(strFileName)
+    dictCache = {tupOld: istOld for tupOld, istOld in dictCache.items() if tupOld[0] != tupKey[0]}
+    dictCache[tupKey] = istCompiled
+    try:
+      strTmpName = strCacheName + '.' + str(os.getpid())
+      with open(strTmpName, 'wb') as fileCache:
+        pickle.dump((intCacheVersion, dictCache), fileCache, pickle.HIGHEST_PROTOCOL)
+      os.replace(strTmpName, strCacheName)    # other processes never see half a file
+    except OSError as err:
+      logging.warning('Configuration cache ' + strCacheName + ' not written: ' + str(err))
+  _dictCompiled[tupKey] = istCompiled
+  return istCompiled
 
 # Class section ---------------------------------------------------------------
 class clsConfig:
@@ -64,57 +154,103 @@ class clsConfig:
     """
     self.strname = strconfname
     # allow_no_value=True: key having no value allowed
-    # RawConfigParser: KEY not turned to lower case: key
-    #                  if lower case keys preferred, use ConfigParser
-    self.__config = configparser.RawConfigParser( allow_no_value=True )
-    self.__config.read( strconfname )
+    # RawConfigParser: keys are turned to lower case
+    config = configparser.RawConfigParser( allow_no_value=True )
+    config.read( strconfname )
     logging.info( 'Loading configuration file: ' + strconfname );
 
-    # fixing the inline comment problem
-    for strsection in self.__config.sections():
-      if strdevnamelist is not None  and  strsection not in strdevnamelist: 
-        logging.debug('Configure: ' + strsection + ' skipped. ')
-        continue;
+    # The parser is not kept.  Values (inline comments removed) and their typed
+    # conversions go to dictionaries which are not changed afterwards.
+    self.__dictconfig = {}
+    self.__dicttyped = {}
+    for strsection in config.sections():
+      bollog = strdevnamelist is None  or  strsection in strdevnamelist
+      if bollog:
+        logging.info('Configure: ' + strsection)
+      else:
+        logging.debug('Configure: ' + strsection + ' not logged. ')
 
-      logging.info('Configure: ' + strsection)
-      for strkey in self.__config[strsection]:
-        strvalcomment = self.__config[strsection][strkey]
+      self.__dictconfig[strsection] = {}
+      self.__dicttyped[strsection] = {}
+      for strkey in config[strsection]:
+        strvalcomment = config[strsection][strkey] or ''
         #
         # assuming inline comments starting with '#'
         #
         strval = [x for x in strvalcomment.split('#')][0].strip()
-        self.__config.set(strsection, strkey, strval)
-        logging.info(' - ' + strkey + ' '+ strval)
+        self.__dictconfig[strsection][strkey] = strval
+        self.__dicttyped[strsection][strkey] = _funcTyped(strval)
+        if bollog:
+          logging.info(' - ' + strkey + ' '+ strval)
 
     logging.info( ' ---- ---- ---- ---- ');
+    self.__bolfrozen = True
+
+  def __setattr__(self, strname, value):
+    """
+      the snapshot is immutable once parsed
+    """
+    if self.__dict__.get('_clsConfig__bolfrozen'):
+      raise AttributeError('clsConfig ' + self.strname + ' is read only.')
+    object.__setattr__(self, strname, value)
 
 
   def get(self, strsection, strkey):
     """
       function to get a value by providing the section name and key name
     """
-    if strsection not in self.__config.sections():
+    if strsection not in self.__dictconfig:
       logging.error(' - ' + strsection + ' not found in config file: ' + self.strname )
       return ""
-    if strkey not in self.__config[ strsection ]:
+    if strkey.lower() not in self.__dictconfig[ strsection ]:
       logging.error(' - ' + strkey + ' not found in config section: ' + strsection )
       return ""
-    return self.__config[ strsection ][ strkey ]
+    return self.__dictconfig[ strsection ][ strkey.lower() ]
+
+  def _typed(self, strsection, strkey, clstype):
+    """
+      typed value of the key, ValueError if it is missing or not a clstype
+    """
+    value = self.__dicttyped.get( strsection, {} ).get( strkey.lower() )
+    if value is None:
+      self.get( strsection, strkey )        # logs what is missing
+      raise ValueError(' - ' + strsection + ', ' + strkey + ' has no value in config file: ' + self.strname )
+    if not isinstance( value, clstype ):
+      raise ValueError(' - ' + strsection + ', ' + strkey + ' = ' + str(value) + ' is not a number of type ' + str(clstype) )
+    return value
+
+  def getint(self, strsection, strkey):
+    """
+      function to get a value as integer
+    """
+    return self._typed( strsection, strkey, int )
+
+  def getfloat(self, strsection, strkey):
+    """
+      function to get a value as float (integers accepted)
+    """
+    return float( self._typed( strsection, strkey, (int, float) ) )
+
+  def getlist(self, strsection, strkey):
+    """
+      function to get a comma separated value as list of strings
+    """
+    return [ x.strip(' ') for x in self.get( strsection, strkey ).split(',') ]
 
   def sections(self):
     """
       function to get the list of the sections in the config file
     """
-    return self.__config.sections()
+    return list( self.__dictconfig.keys() )
 
   def keys(self, strsection):
     """
       function to get the list of the sections in the config file
     """
-    if strsection not in self.__config.sections():
+    if strsection not in self.__dictconfig:
       logging.error(' - ' + strsection + ' not found in config file: ' + self.strname )
       return []
-    return list( self.__config[ strsection ].keys() )
+    return list( self.__dictconfig[ strsection ].keys() )
  
   def name(self):
     """
@@ -17,6 +17,8 @@ History: ----------------------------------------------------------------------
   V1.4 - Jul-2018  Added code for the Arduino UNO to read the flow meter (Proteus
           08004BN1) and control three actuators (Swagelok SS-62TS4-41DC).
           Updated comments and modified screen messages to operator.
+  V1.5 - Oct-2026  Device classes are imported when a device is opened, so each
+          process loads only the driver (or pseudo device) it uses.
 Environment: ------------------------------------------------------------------
   This program is written in Python 3.6.  Python can be freely downloaded from 
 http://www.python.org/.  This program has been tested on PCs running Windows 10.
@@ -54,12 +56,28 @@ Dictionary of abbreviations: ---------------------------------------------------
 
 # Import Section --------------------------------------------------------------
 import logging                     # Flexible event logging functions/classes.
+import importlib                   # Device modules are imported when first used.
 
 #User defined classes
 import ChillerRdConfig             # Module with device configuration data.
-from ChillerDevices import *       #real devices classes: Chiller, Pump, Humidity, Thermocouple
-from ChillerPseudoDevices import * # Pseudo device classes for testing code.
-from ArduinoDevice import *        #The arduino process
+
+# Module and class of each device: {device name: ((real module, class), (pseudo module, class))}.
+# ChillerDevices (real devices), ChillerPseudoDevices (pseudo devices for testing code) and
+# ArduinoDevice are imported by funcDeviceClass, only in the processes that open such a device.
+dictDeviceClasses = {
+  'Chiller':      (('ChillerDevices', 'clsChiller'),      ('ChillerPseudoDevices', 'clsPseudoChiller')),
+  'Pump':         (('ChillerDevices', 'clsPump'),         ('ChillerPseudoDevices', 'clsPseudoPump')),
+  'Humidity':     (('ChillerDevices', 'clsHumidity'),     ('ChillerPseudoDevices', 'clsPseudoHumidity')),
+  'Thermocouple': (('ChillerDevices', 'clsThermocouple'), ('ChillerPseudoDevices', 'clsPseudoThermocouple')),
+  'Arduino':      (('ArduinoDevice',  'clsArduino'),      ('ArduinoDevice',        'clsPseudoArduino')),
+}
+
+def funcDeviceClass(strDevName, bolRunPseudo):
+  '''
+    Class of the device, real or pseudo, its module imported now if not yet.
+  '''
+  strModule, strClass = dictDeviceClasses[ strDevName ][ 1 if bolRunPseudo else 0 ]
+  return getattr( importlib.import_module( strModule ), strClass )
 
 # -----------------------------------------------------------------------------
 class clsDevicesHandler:
@@ -87,37 +105,13 @@ class clsDevicesHandler:
 
       #print ('Device name: ' + strDevName )
       strPort = istConfig.get(strDevName, 'Port')
-      intBaud = int( istConfig.get(strDevName, 'Baud'))
-      if strDevName == 'Chiller':
-        if bolRunPseudo == True: 
-          self.__dictDevices[ strDevName ] = clsPseudoChiller(strDevName)
-        else:
-          #self.__dictDevices[ strDevName ] = clsPseudoChiller(strDevName)
-          self.__dictDevices[ strDevName ] = clsChiller(strDevName, strPort, intBaud)
-      elif strDevName == 'Pump':
-        if bolRunPseudo == True: 
-          self.__dictDevices[ strDevName ] = clsPseudoPump(strDevName)
-        else:
-          #self.__dictDevices[ strDevName ] = clsPseudoPump(strDevName)
-          self.__dictDevices[ strDevName ] = clsPump(strDevName, strPort, intBaud)
-      elif strDevName == 'Humidity':
-        if bolRunPseudo == True: 
-          self.__dictDevices[ strDevName ] = clsPseudoHumidity(strDevName)
-        else:
-          self.__dictDevices[ strDevName ] = clsHumidity(strDevName, strPort, intBaud)
-      elif strDevName == 'Thermocouple':
-        if bolRunPseudo == True: 
-          self.__dictDevices[ strDevName ] = clsPseudoThermocouple(strDevName)
-        else:
-          self.__dictDevices[ strDevName ] = clsThermocouple(strDevName, strPort, intBaud)
-      elif strDevName == 'Arduino':
-        if bolRunPseudo == True:
-          self.__dictDevices[strDevName] = clsPseudoArduino(strDevName)
-        else:
-          #self.__dictDevices[strDevName] = clsPseudoArduino(strDevName)
-          self.__dictDevices[strDevName] = clsArduino(strDevName, strPort, intBaud)
-      else:
+      intBaud = istConfig.getint(strDevName, 'Baud')
+      if strDevName not in dictDeviceClasses:
         logging.error( ' Device name: ' + strDevName + ' not found! ')
+      elif bolRunPseudo == True:
+        self.__dictDevices[ strDevName ] = funcDeviceClass( strDevName, True )(strDevName)
+      else:
+        self.__dictDevices[ strDevName ] = funcDeviceClass( strDevName, False )(strDevName, strPort, intBaud)
 
   def readdevice(self, strDevName, strCmdName, strCmdPara, fltGblArray) :
     """
@@ -0,0 +1,282 @@
+'''
+  Program ChillerRecorder.py
+
+Description: ------------------------------------------------------------------
+   This file contains the binary data recorder of the chiller control.  Every
+update of a recorded channel of the shared state (temperatures, humidity, pump
+setting, flow rate, valve state, see lstChannels) is appended, as it is written,
+to a run file of the process writing it:
+
+     2018-10-02_10-15AM_ChillerRun.<process>.chr
+
+with the full time.time() resolution.  Nothing goes through the logging queue
+and nothing has to be parsed back out of the text log.
+
+   A file is a header and chunks:
+
+     header  magic b'CHILLREC', version (uint16), start time (float64),
+             length (uint32) of the JSON {"channels": [names], "process": name}
+     chunk   b'CHNK', number of records n (uint32), first and last time (float64),
+             n channel ids (uint16), n times (float64), n values (float64)
+
+all little endian.  The chunks are columnar: the times, or the values, of a
+chunk are one array.  A chunk is written every intChunkRecords records or
+fltFlushPeriod seconds, so a crash loses at most the last few seconds.
+
+   python ChillerRecorder.py files.chr   prints the records as csv,
+DataStripper.py turns the files of a run into its output.csv.
+
+History: ----------------------------------------------------------------------
+   V1.0 - Oct-2026  First release.
+
+Environment: ------------------------------------------------------------------
+   This program is written in Python 3.8.  Python can be freely downloaded
+from http://www.python.org/.  This program has been tested on PCs running
+Windows 10.
+
+Author List: -------------------------------------------------------------------
+  R. McKay    Iowa State University, USA  mckay@iastate.edu
+  J. Yu       Iowa State University, USA  jieyu@iastate.edu
+  W. Heidorn  Iowa State University, USA  wheidorn@iastate.edu
+
+Notes: -------------------------------------------------------------------------
+   One file per process: no lock between processes, no shared file.  The
+records of a file are in time order, the files of a run merge with heapq.merge.
+   funcRecorderSetup() in ChillerCtrl.py gives the file name base to the
+processes in the environment.  funcRecorderStart() (clsChillerRun.funcInitialize)
+opens the file of the process and hooks it to the shared state updates.
+   A reader stops at a chunk cut short (the process was killed while writing).
+
+Dictionary of abbreviations: ---------------------------------------------------
+  arr - array
+  bol - boolean
+  byt - bytes
+  cls - class
+  dict - dictionary
+  flt - float
+  func - function
+  int - integer
+  ist - instance
+  lst - list
+  str - string
+  tup - tuple
+'''
+
+# Import section --------------------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import array
+import heapq
+import atexit
+import struct
+import threading
+import multiprocessing as mp
+import ChillerSharedState
+
+strRecordEnv = 'CHILLER_RECORD'      # file name base of the run
+bytMagic = b'CHILLREC'
+intVersion = 1
+stcHeader = struct.Struct('<8sHdI')  # magic, version, start time, JSON length
+stcChunk = struct.Struct('<4sIdd')   # b'CHNK', records, first time, last time
+intChunkRecords = 1024
+fltFlushPeriod = 5.                  # seconds
+
+# Recorded channels: (array, index, name).  The channel id is the position in
+# the list: append new channels at the end, the old files keep their ids.
+lstChannels = [('fltTemps', 0, 'TSet'), ('fltTemps', 1, 'TRes'), ('fltTemps', 2, 'T1'), ('fltTemps', 3, 'T2'),
+               ('fltTemps', 4, 'T3'), ('fltTemps', 5, 'T4'), ('fltTemps', 6, 'TH1'), ('fltTemps', 7, 'TH2'),
+               ('fltHumidity', 0, 'Humidity'), ('fltRPS', 0, 'PumpRPS'), ('fltLPM', 0, 'FlowSet'),
+               ('fltLPM', 1, 'FlowRate'), ('intSettings', 0, 'State'), ('intSettings', 3, 'Valve')]
+dictChannelIds = {(strArray, index): intId for intId, (strArray, index, strName) in enumerate(lstChannels)}
+
+_istRecorder = None                  # recorder of this process
+_lockRecorder = threading.Lock()
+
+# ------------------------------------------------------------------------------
+# Class Recorder ---------------------------------------------------------------
+class clsRecorder:
+  def __init__(self, strFileName, strProcess=''):
+    '''
+      A new run file strFileName, appended chunk by chunk.
+    '''
+    self.strFileName = strFileName
+    self._file = open(strFileName, 'wb')
+    bytJSON = json.dumps({'channels': [strName for strArray, index, strName in lstChannels],
+                          'process': strProcess}).encode()
+    self._file.write(stcHeader.pack(bytMagic, intVersion, time.time(), len(bytJSON)) + bytJSON)
+    self._file.flush()
+    self._lock = threading.Lock()
+    self._arrIds = array.array('H')
+    self._arrTimes = array.array('d')
+    self._arrValues = array.array('d')
+    self._fltFirst = 0.
+    self.intRecords = 0
+
+  def append(self, intId, fltTime, fltValue):
+    '''
+      One record, O(1): the chunk is written when full or old enough.
+    '''
+    with self._lock:
+      if not self._arrIds:
+        self._fltFirst = time.monotonic()
+      self._arrIds.append(intId)
+      self._arrTimes.append(fltTime)
+      self._arrValues.append(fltValue)
+      if len(self._arrIds) >= intChunkRecords or time.monotonic() - self._fltFirst >= fltFlushPeriod:
+        self._write()
+
+  def _write(self):
+    if not self._arrIds or self._file.closed:
+      return
+    lstArrays = [self._arrIds, self._arrTimes, self._arrValues]
+    if sys.byteorder == 'big':
+      for arr in lstArrays:
+        arr.byteswap()
+    self._file.write(stcChunk.pack(b'CHNK', len(self._arrIds), min(self._arrTimes), max(self._arrTimes)) +
+                     b''.join(arr.tobytes() for arr in lstArrays))
+    self._file.flush()
+    self.intRecords += len(self._arrIds)
+    self._arrIds = array.array('H')
+    self._arrTimes = array.array('d')
+    self._arrValues = array.array('d')
+
+  def flush(self):
+    with self._lock:
+      self._write()
+
+  def close(self):
+    with self._lock:
+      self._write()
+      self._file.close()
+
+# ------------------------------------------------------------------------------
+def _funcOnUpdate(strArray, lstIndex, lstValues, fltTime):
+  '''
+    Shared state update hook: the recorded elements to the recorder.
+  '''
+  for index, value in zip(lstIndex, lstValues):
+    intId = dictChannelIds.get((strArray, index))
+    if intId is not None:
+      _istRecorder.append(intId, fltTime, value)
+
+# ------------------------------------------------------------------------------
+def funcRecorderSetup(strBase):
+  '''
+    Called once by the main program before the processes start: file name base
+  of the run, and the recorder of the main process (console settings).
+  '''
+  os.environ[strRecordEnv] = strBase
+  return funcRecorderStart()
+
+def funcRecorderStart():
+  '''
+    The recorder of this process, opened and hooked to the shared state on the
+  first call.  None without funcRecorderSetup() (a routine run alone).
+  '''
+  global _istRecorder
+  with _lockRecorder:
+    if _istRecorder is None and os.environ.get(strRecordEnv):
+      strProcess = mp.current_process().name.replace(' ', '')
+      _istRecorder = clsRecorder(os.environ[strRecordEnv] + '.' + strProcess + '.chr', strProcess)
+      atexit.register(_istRecorder.close)
+      ChillerSharedState.funcSetUpdateHook(_funcOnUpdate)
+  return _istRecorder
+
+def funcRecorder():
+  return _istRecorder
+
+# ------------------------------------------------------------------------------
+def funcReadHeader(file):
+  '''
+    (start time, {"channels": [...], "process": ...}) of an open run file.
+  '''
+  bytHeader = file.read(stcHeader.size)
+  bytRead, intFileVersion, fltStart, intJSON = stcHeader.unpack(bytHeader)
+  if bytRead != bytMagic or intFileVersion > intVersion:
+    raise ValueError(' ' + file.name + ' is not a chiller record file of version <= ' + str(intVersion))
+  return fltStart, json.loads(file.read(intJSON).decode())
+
+def funcReadChunks(strFileName):
+  '''
+    The chunks of a run file: (array of ids, array of times, array of values).
+  '''
+  with open(strFileName, 'rb') as file:
+    funcReadHeader(file)
+    while True:
+      bytChunk = file.read(stcChunk.size)
+      if len(bytChunk) < stcChunk.size:
+        return
+      bytTag, intCount, fltFirst, fltLast = stcChunk.unpack(bytChunk)
+      bytData = file.read(18 * intCount)
+      if bytTag != b'CHNK' or len(bytData) < 18 * intCount:
+        return                             # cut short
+      lstArrays = [array.array('H'), array.array('d'), array.array('d')]
+      lstArrays[0].frombytes(bytData[:2 * intCount])
+      lstArrays[1].frombytes(bytData[2 * intCount:10 * intCount])
+      lstArrays[2].frombytes(bytData[10 * intCount:])
+      if sys.byteorder == 'big':
+        for arr in lstArrays:
+          arr.byteswap()
+      yield tuple(lstArrays)
+
+def funcReadRecords(strFileName):
+  '''
+    The records (time, channel name, value) of a run file, in time order.
+  '''
+  with open(strFileName, 'rb') as file:
+    lstNames = funcReadHeader(file)[1]['channels']
+  for arrIds, arrTimes, arrValues in funcReadChunks(strFileName):
+    for intId, fltTime, fltValue in zip(arrIds, arrTimes, arrValues):
+      yield (fltTime, lstNames[intId], fltValue)
+
+def funcMergeRecords(lstFileNames):
+  '''
+    The records (time, channel name, value) of the files of a run, in time order.
+  '''
+  return heapq.merge(*[funcReadRecords(strFileName) for strFileName in lstFileNames])
+
+
+if __name__ == '__main__':
+
+  if len(sys.argv) > 1:                    # the records of the files as csv
+    print('time,channel,value')
+    for fltTime, strName, fltValue in funcMergeRecords(sys.argv[1:]):
+      print('{:.6f},{},{!r}'.format(fltTime, strName, fltValue))
+    sys.exit()
+
+  # Record 100000 updates of fltTemps[2:6] and compare with the <HIDDEN> log line.
+  import io
+  import logging
+  import tempfile
+  from ChillerSharedState import clsSharedState
+
+  strBase = os.path.join(tempfile.mkdtemp(), 'Demo')
+  funcRecorderSetup(strBase)
+  istState = clsSharedState([('fltTemps', 'd', [20] * 8)], 'threads')
+  intCount = 25000
+  fltStart = time.perf_counter()
+  for i in range(intCount):
+    istState.fltTemps[2:6] = [20. + i * 1e-3] * 4
+  fltRecord = time.perf_counter() - fltStart
+  _istRecorder.close()
+  strFile = _istRecorder.strFileName
+  lstRecords = list(funcReadRecords(strFile))
+  print('{} records, {} bytes: {:.2f} us per update of 4 channels'.format(len(lstRecords), os.path.getsize(strFile),
+        1e6 * fltRecord / intCount))
+  print('last:', lstRecords[-1])
+
+  istLog = logging.getLogger('demo')
+  istLog.propagate = False
+  istHandler = logging.StreamHandler(io.StringIO())
+  istHandler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p'))
+  istLog.addHandler(istHandler)
+  fltStart = time.perf_counter()
+  for i in range(intCount):
+    istLog.warning('<HIDDEN> TempReadings T1: {:5.2f}, T2: {:5.2f}, T3: {:5.2f}, T4: {:5.2f} '.format(*[20. + i * 1e-3] * 4))
+  print('log line: {:.2f} us, 1 s time resolution, 2 decimals'.format(1e6 * (time.perf_counter() - fltStart) / intCount))
+  fltStart = time.perf_counter()
+  intRead = sum(len(arrIds) for arrIds, arrTimes, arrValues in funcReadChunks(strFile))
+  print('read back: {:.2f} us per record'.format(1e6 * (time.perf_counter() - fltStart) / intRead))
@@ -21,15 +21,23 @@ import logging          # Needed for logging to occur
 import logging.handlers # Needed for multiprocess logging with a file handler
 import time             
 import sys
+from queue import Empty #Raised by the get of both the multiprocessing and the threads queues
 from enum import IntEnum
 from functools import total_ordering
 from datetime import timedelta 
 
 # User Macros
-from ChillerRdDevices import * #Allows reading from devices
+from ChillerRdDevices import clsDevicesHandler #Allows reading from devices, drivers load on use
 from ChillerRdConfig  import * #Configures devices
 from ChillerRdCmd     import * #Configures commands
-from SendEmails       import * #Configures email sender
+from ChillerRuntime   import funcStartupReport #Startup times with --profile-startup
+from ChillerScheduler import funcDeadline #Polling deadlines from the run config, jitter statistics
+from ChillerCommandBus import funcActor, Priority #One command at a time per device, stops and set points first
+from ChillerMetrics import funcMetrics #Latency, retries & failures of the commands in shared memory
+from ChillerRecorder import funcRecorderStart #Binary run file of the channels this process writes
+from ChillerLogQueue import clsLogQueueHandler, clsLogFormatter #Compact messages on the logging queue
+from ChillerLogStore import clsLogStore #Log segments, compressed, with a time index
+fltImported = time.time() #Modules of this process loaded (startup profile)
 
 @total_ordering
 
@@ -161,13 +169,16 @@ class clsChillerRun :
     this is not done in the local process or done in a separate process the
     devices will not communicate!!!
     '''
+    self._istRecorder = funcRecorderStart() #Records the shared state updates of this process
     if intStatusCode.value > StatusCode.OK: return
     self._strclassname = '< RUNNING >' 
     try:
       if strDevNameList != ['Routine']:
 
+        # The files are compiled once by ChillerCtrl.py before the processes start,
+        # funcConfig and funcCommands load them from the cache.
         # configuration of how the devices are connected to the PC
-        self._istConnCfg = clsConfig( 'ChillerConnectConfig.txt', strDevNameList)
+        self._istConnCfg = funcConfig( 'ChillerConnectConfig.txt' )
 
         # pass the configuration of how the devices connection
         # to the device handler
@@ -176,86 +187,195 @@ class clsChillerRun :
 
         # interpretation of machine readable commands into human readable commands
         # and vice versa
-        self._istCommand = clsCommands( 'ChillerEquipmentCommands.txt', strDevNameList)
+        self._istCommand = funcCommands( 'ChillerEquipmentCommands.txt' )
 
         # configuration of the running routine 
-        self._istRunCfg = clsConfig( 'ChillerRunConfig.txt', strDevNameList )
+        self._istRunCfg = funcConfig( 'ChillerRunConfig.txt' )
 
       else:
-        self._istRunCfg = clsConfig( 'ChillerRunConfig.txt', ['Chiller','Pump'] )
+        self._istRunCfg = funcConfig( 'ChillerRunConfig.txt' )
 
     except:
       logging.fatal("FAILED TO INITIALIZE "+str(strDevNameList)+" Aborting! Please check connections!")
       intStatusCode.value = StatusCode.DONE
+    funcStartupReport('imported', fltImported)
+    funcStartupReport('initialized')
+
+# ------------------------------------------------------------------------------
+# Function: funcStopPriority ---------------------------------------------------
+  def funcStopPriority(intStatusCode):
+    '''
+      Priority of the stop of a device at the end of its loop: EMERGENCY for
+    a FATAL status (eshutdown), the stop ahead of anything else waiting.
+    '''
+    return Priority.EMERGENCY if intStatusCode.value >= StatusCode.FATAL else Priority.STOP
 
 # ------------------------------------------------------------------------------
 # Function: sendcommand --------------------------------------------------------
-  def sendcommand(self, strUserCommand,intStatusCode,fltTemps,fltRPS=[]) :
+  def sendcommand(self, strUserCommand,intStatusCode,fltTemps,fltRPS=[],intPriority=None) :
+    """
+      function to send command to any of the devices, through the command bus
+      actor of the device: one command at a time, stops and set points before
+      the polls waiting with them (ChillerCommandBus.py).
+      return: clsCommandResult(command, ok, value, error, latency)
     """
-      function to send command to any of the devices
+    strdevname = self._istCommand.getdevicecommand( strUserCommand )[0]
+    funcExecute = lambda strCommand: self.executecommand(self, strCommand, intStatusCode, fltTemps, fltRPS)
+    istResult = funcActor(strdevname, funcExecute).call(strUserCommand, intPriority, funcExecute)
+    if istResult.latency > 5.:
+      logging.debug(' Command %s waited %.1f s for %s' % (strUserCommand, istResult.latency, strdevname))
+    return istResult
+
+  def executecommand(self, strUserCommand,intStatusCode,fltTemps,fltRPS=[]) :
+    """
+      function to send command to the device, called by its actor only
+      return: the value read (device last())
     """
     logging.debug(' Start to send user command ' + strUserCommand )
     strdevname, strcmdname, strcmdpara = self._istCommand.getdevicecommand( strUserCommand )
     logging.debug('sending command %s %s %s' % (strdevname, strcmdname, strcmdpara) )
+    istMetrics = funcMetrics()
+    strStatName = strUserCommand[1:].split('=')[0] #Statistics per command, not per value
     bolCommandSent = False
     nAttempts = 0
     while bolCommandSent == False: #Send Command Loop
+      fltTry = time.perf_counter()
       try:  #Try to send a command if it fails or gives an error try again. After 3 fails it kills everything
         if strdevname == 'Arduino':
           self._istDevHdl.readdevice (strdevname,strcmdname, strcmdpara, [fltTemps,fltRPS])
         else:        
           self._istDevHdl.readdevice( strdevname, strcmdname, strcmdpara, fltTemps)
         bolCommandSent = True
+        if istMetrics is not None:
+          istMetrics.record(strdevname, strStatName, time.perf_counter() - fltTry)
+        if not getattr(self, '_bolReplied', False): #First device reply of this process
+          self._bolReplied = True
+          funcStartupReport('first reply')
 
       except:
         logging.info(' Send Command Failure! %s %s %s' % (strdevname, strcmdname, strcmdpara))
         nAttempts += 1
+        if istMetrics is not None:
+          istMetrics.record(strdevname, strStatName, time.perf_counter() - fltTry, \
+                            repr(sys.exc_info()[1]), bolGiveUp = nAttempts > 2)
         time.sleep(1)
       if nAttempts > 2:
         intStatusCode.value = StatusCode.FATAL
-        bolCommandSent = True
+        raise RuntimeError(' Send Command Failure! %s %s %s' % (strdevname, strcmdname, strcmdpara))
+    return self._istDevHdl.getdevice( strdevname ).last()
 
 # -----------------------------------------------------------------------------
 # Listener Process ------------------------------------------------------------
   def procListener (self, queue, intStatusArray,strLogName) :
     """
-      Process that reads the queue and then puts whatever read to the log file
-      with a name strLogName.
+      Process that reads the queue and then puts whatever read to the log of
+      the run strLogName: compressed segments and their time index, see
+      ChillerLogStore.py.  The queue holds clsLogMessage, formatted and
+      routed by the logging processes (ChillerLogQueue.py).  They are taken
+      off the queue in batches and written through a buffered segment, flushed
+      every FlushPeriod seconds and synced to disk after a WARNING or worse.
+      At most ConsoleRate lines a second are echoed to the screen, warnings
+      always.  Messages, bytes and queue depth go to the statistics block.
     """
-    root = logging.getLogger()# Defines the logger
-    h = logging.FileHandler(strLogName,'a')
-    f = logging.Formatter('%(asctime)s %(levelname)s: %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p')# Creates format of all logged material
-    h.setFormatter(f)# Sets format of the handler
-    root.addHandler(h) #Adds the handler to the logger
-    while True:
-      self.funcResetDog(Process.LISTENER,intStatusArray)
+    # Default values, [Logging] section of the run configuration
+    fltFlushPeriod = 1.   # seconds between two flushes of the log file
+    intBatchSize = 500    # records written per batch at most
+    fltConsoleRate = 20.  # lines per second echoed to the screen
+    fltSegmentMB = 16.    # MB of log lines per segment
+    bolCompress = True    # closed segments gzip compressed
+    try:
+      istRunCfg = funcConfig( 'ChillerRunConfig.txt' )
+      fltFlushPeriod = istRunCfg.getfloat( 'Logging', 'FlushPeriod' )
+      intBatchSize = istRunCfg.getint( 'Logging', 'BatchSize' )
+      fltConsoleRate = istRunCfg.getfloat( 'Logging', 'ConsoleRate' )
+      fltSegmentMB = istRunCfg.getfloat( 'Logging', 'SegmentMB' )
+      bolCompress = istRunCfg.get( 'Logging', 'Compress' ).lower() != 'none'
+    except:
+      pass #No logging before the listener runs, the defaults are used
+
+    istStore = clsLogStore(strLogName, intSegment = int(fltSegmentMB * (1 << 20)), bolCompress = bolCompress)
+    f = clsLogFormatter() # Creates format of all logged material
+    fltNextFlush = time.monotonic() + fltFlushPeriod
+    fltTokens = fltConsoleRate    # console lines that can be printed now
+    fltTokenTime = time.monotonic()
+    intSuppressed = 0             # console lines not printed since the last one
+    bolRunning = True
+    while bolRunning:
+      self.funcResetDog(Process.LISTENER,intStatusArray) #Once a batch, or a flush period when quiet
       try:
-        # This sets conditions to quit the procListener process when the listener recieves None in the queue.
-        record = queue.get()
-        if record is None:
-          break
-        logger = logging.getLogger(record.name) #This finds the name of the log in the queue
-        logger.handle(record) # Handles the log, printing it to the strLogName File
-
-        if "TempReadings" in record.message: #Ignores reading out full temp log
-          continue
-        elif "HIDDEN" in record.message:
-          continue
-        else:
-          print(record.asctime + " "+ record.levelname+" "+record.message) # Prints the log to the screen
+        lstBatch = []
+        try:
+          lstBatch.append(queue.get(timeout = max(0., fltNextFlush - time.monotonic())))
+          while len(lstBatch) < intBatchSize: #Drain what is waiting
+            lstBatch.append(queue.get_nowait())
+        except Empty:
+          pass
+
+        bolSync = False
+        lstLines = []
+        lstConsole = []
+        intBytes = 0
+        fltFirst, fltLast = float('inf'), 0. #Times of the records, for the index of the log
+        for record in lstBatch:
+          # This sets conditions to quit the procListener process when the listener recieves None in the queue.
+          if record is None:
+            bolRunning = False
+            break
+          # Written here, not through the root logger: with --runtime=threads
+          # the root logger also holds the QueueHandler and the record would loop back.
+          lstLines.append(f.line(record))
+          intBytes += len(record.message)
+          fltFirst, fltLast = min(fltFirst, record.created), max(fltLast, record.created)
+          if record.levelno >= logging.WARNING:
+            bolSync = True
+          if record.console: #<HIDDEN> and TempReadings go to the file only
+            lstConsole.append((record.levelno, f.console(record)))
+        if lstLines:
+          istStore.write('\n'.join(lstLines) + '\n', fltFirst, fltLast)
+        istMetrics = funcMetrics()
+        if istMetrics is not None:
+          try:
+            intDepth = queue.qsize()
+          except NotImplementedError: #multiprocessing queue on macOS
+            intDepth = -1
+          istMetrics.recordqueue(len(lstLines), intBytes, intDepth)
+
+        fltNow = time.monotonic()
+        if bolSync or not bolRunning or fltNow >= fltNextFlush:
+          istStore.flush(bolSync or not bolRunning)
+          fltNextFlush = fltNow + fltFlushPeriod
+
+        # Prints the log to the screen, a burst is cut to ConsoleRate lines a second
+        fltTokens = min(fltConsoleRate, fltTokens + (fltNow - fltTokenTime) * fltConsoleRate)
+        fltTokenTime = fltNow
+        lstPrint = []
+        for intLevel, strLine in lstConsole:
+          if fltTokens >= 1 or intLevel >= logging.WARNING:
+            if intSuppressed:
+              lstPrint.append(" ... " + str(intSuppressed) + " log lines not shown, see " + istStore.strSegmentName)
+              intSuppressed = 0
+            lstPrint.append(strLine)
+            fltTokens -= 1
+          else:
+            intSuppressed += 1
+        if lstPrint:
+          print('\n'.join(lstPrint))
       except Exception:
-        import sys, traceback
+        import traceback
         print('Whoops! Problem:', file=sys.stderr)
         traceback.print_exc(file=sys.stderr)
+    istStore.close()
 
 # Function: process_configure -------------------------------------------------
   def funcLoggingConfig(queue,intLoggingLevel) :
     """
        function that must be present in any process that uses the logger
     """
-    h = logging.handlers.QueueHandler(queue) #Connects the handler to the main queue
     root = logging.getLogger() #Creates a new logging process root
-    root.addHandler(h) # Connects the logging process to the handler
+    # With --runtime=threads all routines share one root logger, connect it once.
+    if not any(isinstance(h, logging.handlers.QueueHandler) and h.queue is queue for h in root.handlers):
+      h = clsLogQueueHandler(queue) #Connects the handler to the main queue, compact messages
+      root.addHandler(h) # Connects the logging process to the handler
     root.setLevel(intLoggingLevel) # This sets what level is logged in each process
 
 # ------------------------------------------------------------------------------
@@ -277,11 +397,11 @@ class clsChillerRun :
     intIdxTLiquid  =   0 # index of the thermocouple connected to liquid temperature, 0 - 3
 
     try:  #Try to load values from the run config file
-      fltTUpperLimit = float( self._istRunCfg.get( 'Thermocouple', 'LiquidUpperThreshold' ) )
-      fltTLowerLimit = float( self._istRunCfg.get( 'Thermocouple', 'LiquidLowerThreshold' ) )
-      intFrequency   = int  ( self._istRunCfg.get( 'Thermocouple', 'Frequency' ) )
-      intDataPerRead = int  ( self._istRunCfg.get( 'Thermocouple', 'DataPerRead' ) )
-      intIdxTLiquid  = int  ( self._istRunCfg.get( 'Thermocouple', 'IdxLiquidTemperature' ) )
+      fltTUpperLimit = self._istRunCfg.getfloat( 'Thermocouple', 'LiquidUpperThreshold' )
+      fltTLowerLimit = self._istRunCfg.getfloat( 'Thermocouple', 'LiquidLowerThreshold' )
+      intFrequency   = self._istRunCfg.getint  ( 'Thermocouple', 'Frequency' )
+      intDataPerRead = self._istRunCfg.getint  ( 'Thermocouple', 'DataPerRead' )
+      intIdxTLiquid  = self._istRunCfg.getint  ( 'Thermocouple', 'IdxLiquidTemperature' )
 
       if   intFrequency <              1 : 
         logging.warning( self._strclassname + ' setting Frequency ' + str(intFrequency) + ' < 1. Set to 1.')
@@ -305,22 +425,23 @@ class clsChillerRun :
       return
 
     #wait until all programs have initiallized
-    while intSettings[Setting.STATE] == SysSettings.BOOT:
-      time.sleep(1)
+    self.funcWaitStart(intSettings)
+    istRead = funcDeadline(self._istRunCfg, 'Thermocouple', 'ReadPeriod')  #fltTemps updates
+    istData = funcDeadline(self._istRunCfg, 'Thermocouple', 'Frequency', float(intFrequency)) #<DATA> records
 
     # keep reading data until the process is killed or 
     # kill the process if the global status is more serious than an SHUTDOWN
     while ( intStatusCode.value < StatusCode.KILLED) : 
-      # read thermocouple data, every other second
-      for idata in range(15) :
+      # read thermocouple data every ReadPeriod seconds, log it every Frequency seconds
+      while not istData.due() :
           self.funcResetDog(Process.TEMP_REC,intStatusArray)
           self.sendcommand(self,'tRead',intStatusCode,fltTemps)
-          fltTempTup = list( istThermocouple.last() ) 
-          logging.info( '<HIDDEN> TempReadings T1: {:5.2f}, T2: {:5.2f}, T3: {:5.2f}, T4: {:5.2f} '.format( \
-                        fltTempTup[0], fltTempTup[1], fltTempTup[2], fltTempTup[3]) ) 
+          fltTempTup = istThermocouple.samples() 
+          if self._istRecorder is None: #Else every read is in the run file, full time resolution
+            logging.info( '<HIDDEN> TempReadings T1: {:5.2f}, T2: {:5.2f}, T3: {:5.2f}, T4: {:5.2f} '.format( \
+                          fltTempTup[0], fltTempTup[1], fltTempTup[2], fltTempTup[3]) ) 
 
-          for i in range(4): #Adds the current temperatures into the global temps
-            fltTemps[i+2]=fltTempTup[i]
+          fltTemps[2:6] = fltTempTup[:4] #Adds the current temperatures into the global temps, one update
           
           # keep on track the liquid temperature read out
           # needed by humidity function 
@@ -335,10 +456,12 @@ class clsChillerRun :
             logging.error( self._strclassname + ' liquid temperature '+ self._fltTempLiquid +
                            ' > upper limit ' + fltTUpperLimit + '! Return! ') 
             intStatusCode.value = StatusCode.ERROR
-          time.sleep(2)
+          istRead.wait()
+          if intStatusCode.value >= StatusCode.KILLED: break
       logging.info('<DATA> Temps TSet: {:5.2f}, TRes: {:5.2f}, T1: {:5.2f}, T2: {:5.2f}, T3: {:5.2f}, T4: {:5.2f}'.format( \
                     fltTemps[0],fltTemps[1],fltTemps[2],fltTemps[3],fltTemps[4],fltTemps[5],fltTemps[6],fltTemps[7]) )
     # after finishing running
+    logging.info( self._strclassname + ' ' + istRead.summary() )
     logging.info( self._strclassname + ' Temperature finished recording. ' )
 
 # ------------------------------------------------------------------------------
@@ -357,9 +480,9 @@ class clsChillerRun :
     intFrequency      =  30 # one data point per ? seconds
 
     try: 
-      fltStopUpperLimit = float( self._istRunCfg.get( 'Humidity', 'StopUpperThreshold' ) )
-      fltWarnUpperLimit = float( self._istRunCfg.get( 'Humidity', 'WarnUpperThreshold' ) )
-      intFrequency      = int  ( self._istRunCfg.get( 'Humidity', 'Frequency' ) )
+      fltStopUpperLimit = self._istRunCfg.getfloat( 'Humidity', 'StopUpperThreshold' )
+      fltWarnUpperLimit = self._istRunCfg.getfloat( 'Humidity', 'WarnUpperThreshold' )
+      intFrequency      = self._istRunCfg.getint  ( 'Humidity', 'Frequency' )
       if intFrequency < 1:
         logging.warning( self._strclassname + ' Humidity reading frequency ' + str( intFrequency ) + '! set to 1.')
         intFrequency = 1
@@ -375,22 +498,21 @@ class clsChillerRun :
     oldSetting = [0,0] #Initial conditions
 
     #wait until all programs have initiallized
-    while intSettings[Setting.STATE] == SysSettings.BOOT:
-      time.sleep(1)
+    self.funcWaitStart(intSettings)
+    istRead = funcDeadline(self._istRunCfg, 'Humidity', 'Frequency', float(intFrequency)) #one read per Frequency s
 
     #Humidity Process
     while(intStatusCode.value < StatusCode.KILLED ) :
       self.funcResetDog(Process.HUMI_REC,intStatusArray)
 
       self.sendcommand(self, 'hRead',intStatusCode,fltTemps)
-      lstValues = istHumidity.last()
+      lstValues = istHumidity.samples()
 
       fltHum = lstValues[0]
       fltT1 = lstValues[1]
       fltT2 = lstValues[2]
 
-      fltTemps[6] = fltT1
-      fltTemps[7] = fltT2
+      fltTemps[6:8] = [fltT1, fltT2]
 
       #TODO Make this also read out temperature data...
  
@@ -418,7 +540,8 @@ class clsChillerRun :
         intSettings[Setting.TCHANGE] = True
         logging.info("< RUNNING > Reverting to original programming")
 
-      time.sleep( intFrequency - 1 )
+      istRead.wait()
+    logging.info( self._strclassname + ' ' + istRead.summary() )
     logging.info( self._strclassname + ' Humidity finished recording. ' )
 
 # ------------------------------------------------------------------------------
@@ -433,15 +556,19 @@ class clsChillerRun :
     istTemp = self._istDevHdl.getdevice( 'Chiller' )
 
     #wait until all programs have initiallized
-    while intSettings[Setting.STATE] == SysSettings.BOOT:
-      time.sleep(1)
+    self.funcWaitStart(intSettings)
 
     #Turn on Chiller
     self.sendcommand(self, 'cStart',intStatusCode,fltTemps)
     logging.info ( self._strclassname + ' Chiller started. ')
+    istPoll = funcDeadline(self._istRunCfg, 'Chiller', 'PollPeriod') #seconds between the starts of two poll cycles
+    istData = funcDeadline(self._istRunCfg, 'Chiller', 'DataPeriod') #<HIDDEN> Chiller Poll of an unchanged poll
+    tupPumpRefr = (1, 1) #PUMP? and REFRSW? of the last poll, 0 is off
+    dictLastPoll = None  #Last poll logged, without the reservoir temperature
 
     #Chiller idles 
     while intStatusCode.value < StatusCode.ABORT:
+      intTSeq = intSettings.seq(Setting.TCHANGE) #Set point changes after this wake the loop
       #Check To Exit Loop
       if intSettings[Setting.STATE] > SysSettings.SHUTDOWN:
         break
@@ -453,21 +580,38 @@ class clsChillerRun :
         logging.info('< RUNNING > Chiller Set Temp: '+str(NewTemp))
       #Do the idle thing(Check Chiller, and Read Temperature)
       else:
-        self.sendcommand(self, 'cAlarmStat?', intStatusCode,fltTemps)
+        # Alarm, reservoir temperature, set point, pump and refrigeration in one pass
+        self.sendcommand(self, 'cPollCycle?', intStatusCode,fltTemps)
+        dictPoll = istTemp.lastpoll()
         if istTemp.last() == -9999: #This is the message for a fatal error!!!!
           intStatusCode.value = StatusCode.FATAL
         if intStatusCode.value > StatusCode.ERROR: break
-        self.sendcommand(self, 'cGetResTemp?',intStatusCode,fltTemps)
-        ReservoirTemp = istTemp.last()
-        fltTemps[1] = ReservoirTemp  #TODO Needs to be tested...
-        logging.info("<DATA> TempReadings TRes = "+str(ReservoirTemp))
-        if intStatusCode.value > StatusCode.ERROR: break
-        time.sleep(2.8) #This may not be necessary
+        if 'PTLOC?' in dictPoll:
+          ReservoirTemp = dictPoll['PTLOC?']
+          fltTemps[1] = ReservoirTemp  #TODO Needs to be tested...
+          logging.info("<DATA> TempReadings TRes = "+str(ReservoirTemp))
+        # A warning when the pump or the refrigeration turns off, not every poll
+        tupState = (dictPoll.get('PUMP?', 1), dictPoll.get('REFRSW?', 1))
+        if tupState != tupPumpRefr:
+          if 0 in tupState:
+            logging.warning('< RUNNING > Chiller reports pump ' + str(dictPoll.get('PUMP?')) + \
+                            ', refrigeration ' + str(dictPoll.get('REFRSW?')))
+          elif 0 in tupPumpRefr:
+            logging.info('< RUNNING > Chiller reports pump and refrigeration on again')
+          tupPumpRefr = tupState
+        # The poll when it changes (the reservoir temperature is logged above) or every DataPeriod
+        dictState = {strKey: value for strKey, value in dictPoll.items() if strKey != 'PTLOC?'}
+        if istData.due() or dictState != dictLastPoll:
+          logging.info('<HIDDEN> Chiller Poll: ' + str(dictPoll))
+          dictLastPoll = dictState
+        # Sleep until the next poll, a set point change (tset, routine) wakes it at once
+        istPoll.wait(lambda fltTimeout: intSettings.wait(Setting.TCHANGE, intTSeq, fltTimeout))
         self.funcResetDog(Process.CHILLER,intStatusArray)
 
     #Shutdown chiller
+    logging.info( self._strclassname + ' ' + istPoll.summary() )
     time.sleep(5)
-    self.sendcommand(self,'cStop',intStatusCode,fltTemps)
+    self.sendcommand(self,'cStop',intStatusCode,fltTemps,intPriority=self.funcStopPriority(intStatusCode))
     logging.info( self._strclassname + ' Chiller finished shutdown. ')
     intStatusCode.value = StatusCode.DONE
 
@@ -482,8 +626,7 @@ class clsChillerRun :
     self.funcInitialize(self,["Pump"], bolRunPseudo,intStatusCode)
 
     #wait until all programs have initialized
-    while intSettings[Setting.STATE] == SysSettings.BOOT:
-      time.sleep(1)
+    self.funcWaitStart(intSettings)
 
     #Turn on Pump
     StartComs = ['iUnlockDrive','iUnlockParameter','iRPS=10','iStart']
@@ -492,20 +635,31 @@ class clsChillerRun :
       time.sleep(5)
     logging.info('< RUNNING > Pump Set RPS: 10')
     logging.info ( self._strclassname + ' Pump started. ')
+    istPoll = funcDeadline(self._istRunCfg, 'Pump', 'PollPeriod') #telemetry in regular mode
     intNoFlow = False #This will give a warning if the flow drops to low...
                       # then cause the system to shutdown
+    intFlowSeq = fltLPM.seq(1)   #Flow rate sample the pump last acted on
+    fltRPSTime = time.time()     #Time of the last RPS change
 
     #Pump idles 
     while intStatusCode.value < StatusCode.ABORT:
+      intPSeq = intSettings.seq(Setting.PCHANGE) #RPS changes after this wake the loop
       #Check To Exit Loop
       if intSettings[Setting.STATE] > SysSettings.SHUTDOWN: break
         
       #Do the idle thing (autoFlow adjust, Check Pump, Wait) OR (Check Pump, Wait)
       elif bolAutoFlow == True:  #AutoFlow mode
-        self.sendcommand(self, 'iStatus?', intStatusCode, fltTemps,fltRPS)
+        self.sendcommand(self, 'iTelemetry?', intStatusCode, fltTemps,fltRPS)
+        self.funcPumpTelemetry(self)
         time.sleep(1)
+        # Only act on a flow rate measured after the last RPS change and not acted on before.
+        tupFlow = fltLPM.sample(1)
+        if tupFlow.seq == intFlowSeq or tupFlow.time < fltRPSTime:
+          self.funcResetDog(Process.PUMP,intStatusArray)
+          continue
+        intFlowSeq = tupFlow.seq
         fltFlowSetting = fltLPM[0]
-        fltCurrentFlow = fltLPM[1]
+        fltCurrentFlow = tupFlow.value
         fltCurRPS = fltRPS[0]
         Interval = 0.1
         fltFlowMax = fltFlowSetting + Interval/2.
@@ -541,6 +695,7 @@ class clsChillerRun :
           intSettings[Setting.PCHANGE] = False
           logging.info('< RUNNING > Pump Set RPS: '+str(NewRPS))
           fltRPS[0] = NewRPS
+          fltRPSTime = time.time()
           time.sleep(5)
           self.funcResetDog(Process.PUMP,intStatusArray)
           intNoFlow = False
@@ -563,6 +718,7 @@ class clsChillerRun :
           intSettings[Setting.PCHANGE] = False
           logging.info('< RUNNING > Pump Set RPS: '+str(NewRPS))
           fltRPS[0] = NewRPS
+          fltRPSTime = time.time()
           time.sleep(5)
           self.funcResetDog(Process.PUMP,intStatusArray)
           intNoFlow = False
@@ -582,16 +738,34 @@ class clsChillerRun :
         time.sleep(5)
         self.funcResetDog(Process.PUMP,intStatusArray)
       else:  #Regular Mode
-        self.sendcommand(self, 'iStatus?', intStatusCode,fltTemps,fltRPS)
-        time.sleep(1)
+        self.sendcommand(self, 'iTelemetry?', intStatusCode,fltTemps,fltRPS)
+        self.funcPumpTelemetry(self)
         if intStatusCode.value > StatusCode.ERROR: break
-        time.sleep(4) #This may not be necessary
+        istPoll.wait(lambda fltTimeout: intSettings.wait(Setting.PCHANGE, intPSeq, fltTimeout)) #pset or the routine wake it at once
         self.funcResetDog(Process.PUMP,intStatusArray)
 
     #Shutdown pump
-    self.sendcommand(self,'iStop',intStatusCode,fltTemps,fltRPS)
+    self.sendcommand(self,'iStop',intStatusCode,fltTemps,fltRPS,self.funcStopPriority(intStatusCode))
     logging.info( self._strclassname + ' Pump finished shutdown. ')
 
+# ------------------------------------------------------------------------------
+# Function: Pump Telemetry -----------------------------------------------------
+  def funcPumpTelemetry (self):
+    '''
+    Logs the inverter telemetry (status, fault, output frequency, motor current)
+    read by the last iTelemetry? command.  A new fault code is logged as a warning.
+    '''
+    dictTelemetry = self._istDevHdl.getdevice('Pump').last()
+    if not isinstance(dictTelemetry, dict): return
+    logging.info('<HIDDEN> Pump Telemetry: ' + str(dictTelemetry))
+    intFault = dictTelemetry.get('FAULT', 0)
+    if intFault != getattr(self, '_intPumpFault', 0):
+      if intFault != 0:
+        logging.warning('< RUNNING > Pump inverter reports fault code ' + str(intFault))
+      else:
+        logging.info('< RUNNING > Pump inverter fault cleared')
+    self._intPumpFault = intFault
+
 # ------------------------------------------------------------------------------
 # Arduino Process --------------------------------------------------------------
   def procArduino(self,queue,intStatusCode,intStatusArray,intSettings,fltTemps,fltRPS,fltLPM,intLoggingLevel,bolRunPseudo) :
@@ -605,17 +779,19 @@ class clsChillerRun :
     istArduino = self._istDevHdl.getdevice( 'Arduino' )
 
     #wait until all programs have initialized
-    while intSettings[Setting.STATE] == SysSettings.BOOT:
-      time.sleep(1)
+    self.funcWaitStart(intSettings)
 
     #Reset the toggle state
     toggleState = 0 #Bypass mode
     self.sendcommand(self, 'aReset', intStatusCode,fltTemps)
     logging.info(self._strclassname + 'Resetting valve state to Bypass Mode.')
+    self.sendcommand(self, 'aStream', intStatusCode,fltTemps) #Flow rate from a rolling average
     strStates = ["Bypass Mode","Stave Mode"]
+    istRead = funcDeadline(self._istRunCfg, 'Arduino', 'ReadPeriod') #flow rate updates
     
     #Main Arduino Process
     while intStatusCode.value < StatusCode.KILLED:
+      intVSeq = intSettings.seq(Setting.TOGGLE) #Valve changes after this wake the loop
       #Change valve state
       if intSettings[Setting.TOGGLE] != toggleState:
         logging.info( self._strclassname + 'Toggling valve state to '+strStates[intSettings[Setting.TOGGLE]])
@@ -631,16 +807,17 @@ class clsChillerRun :
         self.funcResetDog(Process.ARDUINO,intStatusArray)
         logging.info( '<DATA> Arduino FlowRate = {:4.2f} l/min'.format( fltRps ) )
         fltRPS[1] = float(fltRps)
-        fltLPM[1] = float(fltRps)
+        fltLPM[1] = float(fltRps) #New sample, the pump process acts on it once
         if intStatusCode.value > StatusCode.FATAL:
           break
 
         #TODO Add in a check for pump settings vs flow rate... 
         # probably not necessary until actuator valves are in
         
-        time.sleep(2)
+        istRead.wait(lambda fltTimeout: intSettings.wait(Setting.TOGGLE, intVSeq, fltTimeout))
         
     self.sendcommand(self, 'aOpen', intStatusCode,fltTemps)
+    self.sendcommand(self, 'aStopStream', intStatusCode,fltTemps)
     logging.info('< RUNNING > Arduino finished shutdown. ') 
 
 # ------------------------------------------------------------------------------
@@ -657,10 +834,10 @@ class clsChillerRun :
 
     #Start Up -----------------------------------
     try:
-      intStartTemp = int(self._istRunCfg.get('Chiller','StartTemperature'))  
-      intStopTemp = int(self._istRunCfg.get( 'Chiller', 'StopTemperature'))
-      fltRunRPS = float(self._istRunCfg.get('Pump','RunRPS'))
-      fltRunLPM = float(self._istRunCfg.get('Pump','RunLPM'))
+      intStartTemp = self._istRunCfg.getint('Chiller','StartTemperature')
+      intStopTemp = self._istRunCfg.getint( 'Chiller', 'StopTemperature')
+      fltRunRPS = self._istRunCfg.getfloat('Pump','RunRPS')
+      fltRunLPM = self._istRunCfg.getfloat('Pump','RunLPM')
     except:
       logging.warning("< RUNNING > Missing chiller Start Temperature, StopTemperature and/or RunRPS, using 20, 22, and 22 respectively")
       intStartTemp =20
@@ -669,8 +846,7 @@ class clsChillerRun :
       fltRunLPM = 1.
 
     #wait until all programs have initialized
-    while intSettings[Setting.STATE] == SysSettings.BOOT:
-      time.sleep(1)
+    self.funcWaitStart(intSettings)
 
     #Tell the devices to go to start conditions
     fltRPS[0] = fltRunRPS
@@ -695,9 +871,9 @@ class clsChillerRun :
       intChiNLoops  = 0
       name = 'Chiller'
       try:
-        intChiNLoops  = abs(int( self._istRunCfg.get( name, 'NLoops' ) ) )
-        intStopTemp = int(self._istRunCfg.get( name, 'StopTemperature'))
-        fltRunRPS = float(self._istRunCfg.get('Pump','RunRPS'))
+        intChiNLoops  = abs( self._istRunCfg.getint( name, 'NLoops' ) )
+        intStopTemp = self._istRunCfg.getint( name, 'StopTemperature')
+        fltRunRPS = self._istRunCfg.getfloat('Pump','RunRPS')
       except:
         logging.fatal("Sections: "+ name + ", Key: NLoops not present in configure: %s" % \
                        self._istRunCfg.name())
@@ -712,9 +888,9 @@ class clsChillerRun :
       #Get Temperature and Time Period Lists
       try:
         # split values by ',' and then remove the white spaces.
-        strTemperatureList = [ x.strip(' ') for x in self._istRunCfg.get( name, 'Temperatures' ).split(',') ]
-        strTimePeriodList  = [ x.strip(' ') for x in self._istRunCfg.get( name, 'TimePeriod'   ).split(',') ]
-        strToggleList  = [ x.strip(' ') for x in self._istRunCfg.get( name, 'ToggleState'   ).split(',') ]
+        strTemperatureList = self._istRunCfg.getlist( name, 'Temperatures' )
+        strTimePeriodList  = self._istRunCfg.getlist( name, 'TimePeriod'   )
+        strToggleList  = self._istRunCfg.getlist( name, 'ToggleState'   )
       except:
         logging.fatal("Section: "+ name + ", Key: Temperatures, TimePeriod, ToggleState not present in configure: %s" % \
                        self._istRunCfg.name() )
@@ -792,26 +968,40 @@ class clsChillerRun :
     """
     gives the temperature of the stave
     """ 
-    fltStaveTemp = (fltTemps[2]+fltTemps[3])/2 #This reads temperature from the thermocouples
+    lstTemps = fltTemps[:] #One consistent copy
+    fltStaveTemp = (lstTemps[2]+lstTemps[3])/2 #This reads temperature from the thermocouples
     if fltStaveTemp == 20:
-      fltStaveTemp = fltTemps[1] #if nothing has updated use the temperature read by the chiller
+      fltStaveTemp = lstTemps[1] #if nothing has updated use the temperature read by the chiller
     return fltStaveTemp
 
+# Function: Stave Slope --------------------------------------------------------
+  def funcStaveSlope (fltTemps, fltSeconds=120):
+    """
+    gives the slope of the stave temperature in C/min, least squares over the
+    last fltSeconds of the fltTemps history.  None with less than two samples.
+    """
+    lstTemps = fltTemps[:]
+    if (lstTemps[2]+lstTemps[3])/2 == 20:
+      lstIndex = [1] #if nothing has updated use the temperature read by the chiller
+    else:
+      lstIndex = [2, 3] #slope of the mean is the mean of the slopes
+    lstSlopes = [fltTemps.window(i, fltSeconds).slope for i in lstIndex]
+    if None in lstSlopes:
+      return None
+    return 60 * sum(lstSlopes) / len(lstSlopes)
+
 # Function: Temp Wait ----------------------------------------------------------
   def funcTempWait (self,intTime, intStatusCode, intStatusArray, intSettings, fltTemps, bolWaitInput):
     """
     This checks to see when the fluid temperature gets to the set temperature
+    and the stave temperature levels off (slope from the fltTemps history)
     """
 
-    Tancient = 0 #Oldest Temp Change
-    Told = 0 #Next oldest Temp Change
-
     while True: #This loop stays until it is broken
       intWaitTime = intTime #Time to wait between checks to reach temperature should be >30seconds
       
       fltSetTemp = fltTemps[0]
       fltStaveTemp = self.funcStaveTemp(fltTemps)
-      Tslope = 1000
       TslopeLevel = 0.1 # C/min
 
       intMaxWait = 90 # max time to wait before chiller ends the wait.      
@@ -827,39 +1017,24 @@ class clsChillerRun :
           elif fltSetTemp != fltTemps[0]: break #If the set temp changes go back to the beginning                  
           time.sleep(5)
           self.funcResetDog(Process.ROUTINE, intStatusArray)
-        Tancient = Told
-        Told = fltStaveTemp
-        fltStaveTemp = self.funcStaveTemp(fltTemps)
-        Tmean = (Tancient+Told+fltStaveTemp)/3
-        Tslope = ((Tmean-fltStaveTemp)+(Tancient-Tmean))/2
         TRes = fltTemps[1]
         if fltSetTemp != fltTemps[0]: break
 
       #Wait for the slope to level off
-      while abs(Tslope) > TslopeLevel:
+      while True:
         fltStaveTemp = self.funcStaveTemp(fltTemps)
-        Tmean = (Tancient+Told+fltStaveTemp)/3
-        Tslope = ((Tmean-fltStaveTemp)+(Tancient-Tmean))/2
+        Tslope = self.funcStaveSlope(fltTemps)
+        if Tslope is not None and abs(Tslope) <= TslopeLevel: break
 
         logging.info( "< RUNNING > Routine waiting for abs.temp. slope to flatten. Current: "\
-                      +str(round(abs(Tslope),2))+' > '+str(TslopeLevel)+"  [C/min]")
-        Tancient = Told
-        Told = fltStaveTemp
-        for j in range(2):
-          #Calculate slope for an untested value
-          fltStaveTemp = self.funcStaveTemp(fltTemps) 
-          Tmean = (Tancient+Told+fltStaveTemp)/3
-          Tslope = ((Tmean-fltStaveTemp)+(Tancient-Tmean))/2 
-          Tancient = Told
-          Told = fltStaveTemp
-
-          for i in range(6 * intWaitTime): #The actual waiting
-            if intStatusCode.value > StatusCode.ERROR or \
-              ((intStatusCode.value == StatusCode.SHUTDOWN or intStatusCode.value == StatusCode.ERROR) \
-                and intSettings[Setting.STATE] != SysSettings.SHUTDOWN): return
-            elif fltSetTemp != fltTemps[0]: break #If the set temp changes go back to the beginning                  
-            time.sleep(5)
-            self.funcResetDog(Process.ROUTINE, intStatusArray)
+                      +(str(round(abs(Tslope),2)) if Tslope is not None else '-')+' > '+str(TslopeLevel)+"  [C/min]")
+        for i in range(12 * intWaitTime): #The actual waiting
+          if intStatusCode.value > StatusCode.ERROR or \
+            ((intStatusCode.value == StatusCode.SHUTDOWN or intStatusCode.value == StatusCode.ERROR) \
+              and intSettings[Setting.STATE] != SysSettings.SHUTDOWN): return
+          elif fltSetTemp != fltTemps[0]: break #If the set temp changes go back to the beginning                  
+          time.sleep(5)
+          self.funcResetDog(Process.ROUTINE, intStatusArray)
         if intCurrentWait >= intMaxWait:
           logging.info( "< RUNNING > Routine wait ended after "+ str(intCurrentWait)+" min. The system took too long!")
           logging.info( "< RUNNING > Stave reached Temperature " + str(round(fltStaveTemp,2))+ " C from Tset: "\
@@ -955,12 +1130,13 @@ class clsChillerRun :
     
     # Set up email system -------------
     if bolSendEmail == True:
+      from SendEmails import clsSendEmails #smtplib & email are only loaded by the WatchDog, when used
 
       # Create Mailing List
       defaultMailList = ['wheidorn@iastate.edu']# Default mailing list
-      self._istRunCfg = clsConfig( 'ChillerRunConfig.txt', [])
+      self._istRunCfg = funcConfig( 'ChillerRunConfig.txt' )
       try: 
-        mailList = [ x.strip(' ') for x in self._istRunCfg.get( 'Email', 'Users' ).split(',') ]
+        mailList = self._istRunCfg.getlist( 'Email', 'Users' )
         if mailList[0] == '': #Check to make certain an email was added
           mailList = defaultMailList
       except:
@@ -1003,8 +1179,7 @@ class clsChillerRun :
     maxFrostTime = 60
 
     #wait until all programs have initiallized
-    while intSettings[Setting.STATE] == SysSettings.BOOT:
-      time.sleep(1)
+    self.funcWaitStart(intSettings)
 
     #The main watchdog loop ------------
     while intStatusCode.value < StatusCode.DONE:      
@@ -1082,6 +1257,14 @@ class clsChillerRun :
           mail('DONE Shutdown!!','The system has been shutdown. The program was completed with no fuss!\n')
           sentMessage = True
 
+# Function: funcWaitStart ------------------------------------------------------
+  def funcWaitStart (intSettings):
+    '''
+    Start barrier.  Blocks until main has started all processes and left the
+    BOOT state, without polling.
+    '''
+    intSettings.waituntil(Setting.STATE, lambda intState: intState != SysSettings.BOOT)
+
 # Function: funcResetDog -------------------------------------------------------
   def funcResetDog (intProcess,intStatusArray): #Puts the WatchDog into OK, which stops an error
     '''
@@ -1130,9 +1313,11 @@ class clsChillerRun :
       strMessage.append("  "+ strTempNames[i] +": "+ str(round(p,1))+u"\u00B0C")
       i+=1
     strMessage.append("\n     Humidity: " + str(round(fltHumidity.value,2)) + " %")
-    strMessage.append("\n Pump Setting: " + str(round(fltRPS[0],2)) + " rps")
-    strMessage.append("    Set FRate: " + str(round(fltLPM[0],2)) + " l/min")
-    strMessage.append("    Flow Rate: " + str(round(fltRPS[1],2)) + " l/min")
+    lstRPS = fltRPS[:]
+    lstLPM = fltLPM[:]
+    strMessage.append("\n Pump Setting: " + str(round(lstRPS[0],2)) + " rps")
+    strMessage.append("    Set FRate: " + str(round(lstLPM[0],2)) + " l/min")
+    strMessage.append("    Flow Rate: " + str(round(lstRPS[1],2)) + " l/min")
     strMessage = ''.join(strMessage) 
     return strMessage
 
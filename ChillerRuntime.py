@@ -0,0 +1,153 @@
+'''
+  Program ChillerRuntime.py
+
+Description: ------------------------------------------------------------------
+   This file contains what ChillerCtrl.py needs to run the Listener, recorders,
+Arduino, Chiller, Pump, Routine and WatchDog routines of clsChillerRun either
+as separate processes (default, --runtime=processes) or as threads of one
+process (--runtime=threads).
+
+   In the threads runtime no module is imported twice, the configuration files
+are read in one process and the shared values live in plain memory: array
+('i'/'d') for the arrays and clsValue for the single values, instead of the
+locked multiprocessing Array/Value.
+
+   It also holds the startup profile (--profile-startup): every process logs
+how long after its start it had imported its modules, initialized its devices
+and got its first device reply:
+     <STARTUP> Temp Rec  imported      0.412 s
+
+History: ----------------------------------------------------------------------
+   V1.0 - Oct-2026  First release.
+   V1.1 - Oct-2026  Added the startup profile.
+
+Environment: ------------------------------------------------------------------
+   This program is written in Python 3.8.  Python can be freely downloaded
+from http://www.python.org/.  This program has been tested on PCs running
+Windows 10.
+
+Author List: -------------------------------------------------------------------
+  R. McKay    Iowa State University, USA  mckay@iastate.edu
+  J. Yu       Iowa State University, USA  jieyu@iastate.edu
+  W. Heidorn  Iowa State University, USA  wheidorn@iastate.edu
+
+Notes: -------------------------------------------------------------------------
+   The routines are called with the class clsChillerRun itself as self and keep
+their devices and configuration as class attributes.  Each thread is therefore
+given its own subclass of clsChillerRun as self, so the routines do not see
+each other's attributes, the same as in separate processes.
+   A thread cannot be killed from outside.  terminate() raises SystemExit in the
+thread, which takes effect the next time it runs Python code (i.e. after the
+current sleep or serial read returns).  The threads are daemons, they end with
+the main program.
+   The profile setting and the start time of a process reach it through the
+environment variables strProfileEnv and strStartEnv, set by ChillerCtrl.py just
+before it starts the process.  A spawned process inherits them with the rest
+of the environment.
+
+Dictionary of abbreviations: ---------------------------------------------------
+  cls - class
+  flt - float
+  int - integer
+  lst - list
+  str - string
+'''
+
+# Import section --------------------------------------------------------------
+
+import os
+import time
+import array
+import ctypes
+import queue
+import logging
+import threading
+import multiprocessing as mp
+
+lstRuntimes = ['processes', 'threads']
+strProfileEnv = 'CHILLER_PROFILE_STARTUP'   # '1' = log the startup times
+strStartEnv = 'CHILLER_START_TIME'          # time.time() the process was started
+fltStarted = float(os.environ.get(strStartEnv, 0)) or time.time()  # of this process
+
+# ------------------------------------------------------------------------------
+# Class Value ------------------------------------------------------------------
+class clsValue:
+  def __init__(self, strTypecode, value):
+    '''
+      In memory stand in for multiprocessing.Value: one int ('i') or float ('d')
+    in the attribute value.
+    '''
+    self._funcType = float if strTypecode == 'd' else int
+    self.value = self._funcType(value)
+    self._lock = threading.RLock()
+
+  def get_lock(self):
+    return self._lock
+
+  def __repr__(self):
+    return 'clsValue(' + repr(self.value) + ')'
+
+# ------------------------------------------------------------------------------
+def Array(strTypecode, lstValues):
+  '''
+    In memory stand in for multiprocessing.Array.
+  '''
+  return array.array(strTypecode, lstValues)
+
+# ------------------------------------------------------------------------------
+# Class Runtime Thread ---------------------------------------------------------
+class clsRuntimeThread(threading.Thread):
+  def __init__(self, target, name, args=(), kwargs=None):
+    '''
+      Same arguments as multiprocessing.Process.  When the first argument is a
+    class (clsChillerRun) the target gets a fresh subclass of it instead.
+    '''
+    self.fltStarted = time.time()
+    lstArgs = list(args)
+    if lstArgs and isinstance(lstArgs[0], type):
+      lstArgs[0] = type(lstArgs[0].__name__ + '_' + name.strip().replace(' ', ''), (lstArgs[0],), {})
+    super().__init__(target=target, name=name, args=tuple(lstArgs), kwargs=kwargs or {}, daemon=True)
+
+  def start(self):
+    self.fltStarted = time.time()
+    super().start()
+
+  @property
+  def pid(self):
+    return getattr(self, 'native_id', None) or self.ident
+
+  def terminate(self):
+    '''
+      Raise SystemExit in the thread.
+    '''
+    if self.ident is None or not self.is_alive():
+      return
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(self.ident), ctypes.py_object(SystemExit))
+
+# ------------------------------------------------------------------------------
+def funcStartupReport(strStage, fltTime=None, fltStart=None):
+  '''
+    With the startup profile on, log the time of strStage (now if fltTime is
+  None) since fltStart, by default the start of the process or thread.
+  '''
+  if os.environ.get(strProfileEnv) != '1':
+    return
+  istThread = threading.current_thread()
+  if isinstance(istThread, clsRuntimeThread):
+    strName, fltStart0 = istThread.name, istThread.fltStarted
+  else:
+    strName, fltStart0 = mp.current_process().name, fltStarted
+  fltTime = time.time() if fltTime is None else fltTime
+  fltStart = fltStart if fltStart is not None else fltStart0
+  logging.info('<STARTUP> {:9s} {:12s} {:7.3f} s'.format(strName, strStage, max(0., fltTime - fltStart)))
+
+# ------------------------------------------------------------------------------
+def funcRuntime(strRuntime):
+  '''
+    Return the (queue class, Value, Array, process class) of the runtime.
+  '''
+  if strRuntime == 'threads':
+    return (queue.Queue, clsValue, Array, clsRuntimeThread)
+  elif strRuntime == 'processes':
+    return (mp.Queue, mp.Value, mp.Array, mp.Process)
+  raise ValueError(' Unknown runtime ' + str(strRuntime) + ', use one of ' + str(lstRuntimes))
@@ -0,0 +1,199 @@
+'''
+  Program ChillerScheduler.py
+
+Description: ------------------------------------------------------------------
+   This file contains the deadline scheduler of the device loops.  A loop asks
+for the deadline of its device once, from the period set in ChillerRunConfig.txt,
+and then waits for it at the end of each pass instead of sleeping a fixed time:
+
+     istRead = funcDeadline(istRunCfg, 'Humidity', 'Frequency', 30.)
+     while ... :
+       ... read the device ...
+       istRead.wait()
+
+   The deadlines are start + k * period on the monotonic clock, so the time a
+command takes is taken off the sleep and the samples do not drift, however
+long the run.  A pass that takes longer than a period (overrun) skips the
+deadlines it missed instead of reading several times in a row to catch up.
+For each deadline the lateness of the wake up (jitter) and the overruns are
+counted, and logged every hour and at the end of the loop:
+
+     <HIDDEN> Schedule Humidity: 120 ticks, jitter mean 0.4 ms max 2.1 ms, 0 overruns
+
+History: ----------------------------------------------------------------------
+   V1.0 - Oct-2026  First release.
+
+Environment: ------------------------------------------------------------------
+   This program is written in Python 3.8.  Python can be freely downloaded
+from http://www.python.org/.  This program has been tested on PCs running
+Windows 10.
+
+Author List: -------------------------------------------------------------------
+  R. McKay    Iowa State University, USA  mckay@iastate.edu
+  J. Yu       Iowa State University, USA  jieyu@iastate.edu
+  W. Heidorn  Iowa State University, USA  wheidorn@iastate.edu
+
+Notes: -------------------------------------------------------------------------
+   wait() takes a function to sleep with, e.g. the wait of a shared array so a
+setting change wakes the loop before the deadline.  The deadline is then not
+used up, the next wait() sleeps until the same deadline.
+
+Dictionary of abbreviations: ---------------------------------------------------
+  bol - boolean
+  cfg - configuration
+  cls - class
+  dict - dictionary
+  flt - float
+  func - function
+  int - integer
+  ist - instance
+  str - string
+'''
+
+# Import section --------------------------------------------------------------
+
+import time
+import logging
+
+# Period in seconds of each device loop, used when ChillerRunConfig.txt has none.
+dictPeriods = {
+  ('Thermocouple', 'ReadPeriod'): 2.,     # fltTemps[2-5] updates
+  ('Thermocouple', 'Frequency'):  29.,    # <DATA> temperature records
+  ('Humidity',     'Frequency'):  30.,    # humidity reads
+  ('Chiller',      'PollPeriod'):  1.,    # alarm, reservoir temperature, ... poll
+  ('Chiller',      'DataPeriod'): 30.,    # <HIDDEN> Chiller Poll records, unchanged poll
+  ('Pump',         'PollPeriod'):  5.,    # inverter telemetry
+  ('Arduino',      'ReadPeriod'):  1.,    # flow rate updates
+}
+fltReportPeriod = 3600.   # seconds between two statistics logs
+
+# ------------------------------------------------------------------------------
+# Class Deadline ---------------------------------------------------------------
+class clsDeadline:
+  def __init__(self, strName, fltPeriod, fltStart=None):
+    '''
+      Deadlines every fltPeriod seconds, the first one a period after fltStart
+    (time.monotonic(), default now).
+    '''
+    if fltPeriod <= 0:
+      raise ValueError(' Schedule ' + strName + ': period ' + str(fltPeriod) + ' s must be > 0.')
+    self.strName = strName
+    self.fltPeriod = float(fltPeriod)
+    self._fltStart = time.monotonic() if fltStart is None else fltStart
+    self._intNext = 1                   # index k of the next deadline
+    self._fltReport = self._fltStart + fltReportPeriod
+    self.intTicks = 0                   # deadlines met (waited for or found due)
+    self.intOverruns = 0                # passes longer than a period
+    self.intMissed = 0                  # deadlines skipped by the overruns
+    self.fltJitterSum = 0.              # lateness of the wake ups, seconds
+    self.fltJitterMax = 0.
+
+  def deadline(self):
+    '''
+      time.monotonic() of the next deadline.
+    '''
+    return self._fltStart + self._intNext * self.fltPeriod
+
+  def remaining(self):
+    return max(0., self.deadline() - time.monotonic())
+
+  def _tick(self, fltNow):
+    '''
+      The next deadline is met at fltNow: count it and move to the following
+    one, skipping those already passed.
+    '''
+    fltLate = fltNow - self.deadline()
+    self.intTicks += 1
+    if fltLate >= self.fltPeriod:       # the pass took more than a period
+      intSkip = int(fltLate // self.fltPeriod)
+      self.intOverruns += 1
+      self.intMissed += intSkip
+      self._intNext += intSkip
+      fltLate -= intSkip * self.fltPeriod
+    self.fltJitterSum += fltLate
+    self.fltJitterMax = max(self.fltJitterMax, fltLate)
+    self._intNext += 1
+    if fltNow >= self._fltReport:
+      self._fltReport = fltNow + fltReportPeriod
+      logging.info('<HIDDEN> ' + self.summary())
+
+  def due(self):
+    '''
+      True, and the deadline used up, if the next deadline has passed.  For
+    things done every few passes of a loop waiting on another deadline.
+    '''
+    fltNow = time.monotonic()
+    if fltNow < self.deadline():
+      return False
+    self._tick(fltNow)
+    return True
+
+  def wait(self, funcWait=None):
+    '''
+      Sleep until the next deadline.  funcWait(fltTimeout) sleeps instead of
+    time.sleep and returns True when woken early, then wait returns False and
+    the deadline is kept.  True when the deadline was reached.
+    '''
+    fltTimeout = self.remaining()
+    if funcWait is None:
+      time.sleep(fltTimeout)
+    elif funcWait(fltTimeout):
+      return False
+    fltNow = time.monotonic()
+    while fltNow < self.deadline():     # sleep may return a little early
+      time.sleep(self.deadline() - fltNow)
+      fltNow = time.monotonic()
+    self._tick(fltNow)
+    return True
+
+  def stats(self):
+    '''
+      {ticks, overruns, missed, mean and max jitter in seconds}
+    '''
+    return {'ticks': self.intTicks, 'overruns': self.intOverruns, 'missed': self.intMissed,
+            'jitter_mean': self.fltJitterSum / self.intTicks if self.intTicks else 0.,
+            'jitter_max': self.fltJitterMax}
+
+  def summary(self):
+    dictStats = self.stats()
+    return 'Schedule {}: {} ticks of {:g} s, jitter mean {:.1f} ms max {:.1f} ms, {} overruns ({} missed)'.format(
+           self.strName, dictStats['ticks'], self.fltPeriod, 1e3 * dictStats['jitter_mean'],
+           1e3 * dictStats['jitter_max'], dictStats['overruns'], dictStats['missed'])
+
+# ------------------------------------------------------------------------------
+def funcDeadline(istRunCfg, strSection, strKey, fltDefault=None):
+  '''
+    clsDeadline of a device loop, its period from the key strKey of section
+  strSection of the run configuration, else fltDefault or dictPeriods.
+  '''
+  fltPeriod = fltDefault if fltDefault is not None else dictPeriods[(strSection, strKey)]
+  try:
+    fltPeriod = istRunCfg.getfloat(strSection, strKey)
+  except (ValueError, AttributeError):
+    logging.warning(' Section: ' + strSection + ', Key: ' + strKey + ' not found! Using ' + str(fltPeriod) + ' s.')
+  if fltPeriod <= 0:
+    logging.warning(' Section: ' + strSection + ', Key: ' + strKey + ' = ' + str(fltPeriod) + ' <= 0! Using 1 s.')
+    fltPeriod = 1.
+  return clsDeadline(strSection, fltPeriod)
+
+
+if __name__ == '__main__':
+
+  # A loop of period 0.1 s whose work takes 0-60 ms, with a sleep(0.1) as in the
+  # old loops and with the deadline.
+  import random
+
+  intPasses = 50
+  fltStart = time.monotonic()
+  for i in range(intPasses):
+    time.sleep(random.uniform(0., 0.06))
+    time.sleep(0.1)
+  print('sleep   : {} passes in {:.3f} s, should be {:.3f} s'.format(intPasses, time.monotonic() - fltStart, intPasses * 0.1))
+
+  istDeadline = clsDeadline('Demo', 0.1)
+  fltStart = time.monotonic()
+  for i in range(intPasses):
+    time.sleep(random.uniform(0., 0.06))
+    istDeadline.wait()
+  print('deadline: {} passes in {:.3f} s, should be {:.3f} s'.format(intPasses, time.monotonic() - fltStart, intPasses * 0.1))
+  print(istDeadline.summary())
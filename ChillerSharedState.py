@@ -0,0 +1,457 @@
+'''
+  Program ChillerSharedState.py
+
+Description: ------------------------------------------------------------------
+   This file contains the shared state block of the chiller control: the arrays
+fltTemps, fltRPS, fltLPM and intSettings that all processes read and write.
+They live in one multiprocessing.shared_memory block (a bytearray with
+--runtime=threads) with a ctypes layout.  Every element (channel) carries a
+sequence number, counting its updates, and the time of its last update, so a
+control loop can tell a new sample from one it has already acted on:
+
+     tupFlow = fltLPM.sample(1)      # (value, seq, time)
+     if tupFlow.seq != intLastSeq: ...
+
+   Each array is guarded by a seqlock.  Writers take the writer lock and bump
+the array counter to odd before and to even after the update.  Readers do not
+lock: they copy the array and retry if the counter was odd or has moved, so a
+slice, a loop over the array or snapshot() never sees half of an update.
+Writing a slice (fltTemps[2:6] = lstValues) is one update.
+
+   Each array also has a condition on the writer lock, notified by every update.
+A device loop sleeps in wait() instead of time.sleep() and wakes as soon as a
+setting it owns changes, e.g. the chiller on intSettings[Setting.TCHANGE]:
+
+     intSeq = intSettings.seq(Setting.TCHANGE)       # before checking the flag
+     ...
+     intSettings.wait(Setting.TCHANGE, intSeq, 1.0)  # sleep 1 s or until set
+
+waituntil() is the start barrier: the processes block in it until main leaves
+the BOOT state.
+
+   An array can also keep its history: a ring of the last intDepth updates,
+timestamped, in the same block.  update() appends the whole array as one row
+(O(1), under the writer lock it already holds); an update in the same
+fltResolution seconds bin as the last row replaces it, so the ring always
+spans intDepth * fltResolution seconds.  Any process reads a window of a channel:
+
+     lstTimes, lstValues = fltTemps.history(1, 600)  # TRes, last 10 min
+     istWindow = fltTemps.window(1, 600)            # count, mean, min, max, slope
+
+History: ----------------------------------------------------------------------
+   V1.0 - Oct-2026  First release.
+   V1.1 - Oct-2026  Added wait() and waituntil() to wake loops on updates.
+   V1.2 - Oct-2026  Added the history rings, history() and window().
+   V1.3 - Oct-2026  Added the update hook of the data recorder.
+
+Environment: ------------------------------------------------------------------
+   This program is written in Python 3.8.  Python can be freely downloaded
+from http://www.python.org/.  The module multiprocessing.shared_memory needs
+Python 3.8 or newer.  This program has been tested on PCs running Windows 10.
+
+Author List: -------------------------------------------------------------------
+  R. McKay    Iowa State University, USA  mckay@iastate.edu
+  J. Yu       Iowa State University, USA  jieyu@iastate.edu
+  W. Heidorn  Iowa State University, USA  wheidorn@iastate.edu
+
+Notes: -------------------------------------------------------------------------
+   The arrays index like the multiprocessing Arrays they replace, the code
+using fltTemps[1] or "for flt in fltTemps" is unchanged.
+   The process that creates the block owns it and removes it at exit.  The
+spawned processes attach to it by name when their arguments are unpickled.
+   A reader gives up waiting for a writer after intRetries tries (a writer
+killed in the middle of an update) and returns what it read.  The next writer
+makes the counter even again before its own update.
+   The rings hold doubles, also for the 'i' arrays.  The window statistics are
+computed on array('d') copies with the built-in sum, min and max (C loops);
+slope is the least squares slope in units per second.
+
+Dictionary of abbreviations: ---------------------------------------------------
+  cls - class
+  flt - float
+  int - integer
+  ist - instance
+  lst - list
+  stc - structure (ctypes)
+  str - string
+  tup - tuple
+'''
+
+# Import section --------------------------------------------------------------
+
+import time
+import array
+import atexit
+import ctypes
+import operator
+import threading
+import collections
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+dictCTypes = {'i': ctypes.c_int32, 'd': ctypes.c_double}
+intRetries = 10000       # reader tries before it stops waiting for a writer
+
+_funcOnUpdate = None     # funcOnUpdate(strArray, lstIndex, lstValues, fltTime) after each update
+
+# One element as read: value, number of updates, time.time() of the last update.
+clsSample = collections.namedtuple('clsSample', ['value', 'seq', 'time'])
+
+# Statistics of a channel over a time window; slope in units per second, None
+# with less than 2 samples.
+clsWindow = collections.namedtuple('clsWindow', ['count', 'mean', 'min', 'max', 'slope', 'start', 'end'])
+
+# ------------------------------------------------------------------------------
+def _stcLayout(lstSpec):
+  '''
+    ctypes structure of the block.
+    lstSpec = [(strName, strTypecode, intLen, intDepth, fltResolution)].
+  '''
+  lstFields = []
+  for strName, strTypecode, intLen, intDepth, fltResolution in lstSpec:
+    lstArrayFields = [('intSeqLock', ctypes.c_uint64),             # odd while written
+                      ('intSeq', ctypes.c_uint64 * intLen),        # updates per element
+                      ('fltTime', ctypes.c_double * intLen),       # time of last update
+                      ('value', dictCTypes[strTypecode] * intLen)]
+    if intDepth:
+      lstArrayFields += [('intHead', ctypes.c_uint64),                      # rows appended
+                         ('fltRowTime', ctypes.c_double * intDepth),        # time of each row
+                         ('fltRows', ctypes.c_double * (intDepth * intLen))] # rows, one after the other
+    stcArray = type('stc_' + strName, (ctypes.Structure,), {'_fields_': lstArrayFields})
+    lstFields.append((strName, stcArray))
+  return type('stcState', (ctypes.Structure,), {'_fields_': lstFields})
+
+# ------------------------------------------------------------------------------
+def funcSetUpdateHook(funcOnUpdate):
+  '''
+    Call funcOnUpdate(strArray, lstIndex, lstValues, fltTime) after each update
+  made by this process, outside the writer lock (ChillerRecorder.py).
+  '''
+  global _funcOnUpdate
+  _funcOnUpdate = funcOnUpdate
+
+# ------------------------------------------------------------------------------
+def funcWindow(lstTimes, lstValues):
+  '''
+    clsWindow of the samples (lstTimes, lstValues).
+  '''
+  intCount = len(lstValues)
+  if intCount == 0:
+    return clsWindow(0, None, None, None, None, None, None)
+  fltMean = sum(lstValues) / intCount
+  fltSlope = None
+  if intCount > 1:
+    fltT0 = lstTimes[0]                    # times from the window start, better conditioned
+    lstT = array.array('d', [fltTime - fltT0 for fltTime in lstTimes])
+    fltTMean = sum(lstT) / intCount
+    fltVar = sum(map(operator.mul, lstT, lstT)) - intCount * fltTMean * fltTMean
+    if fltVar > 0:
+      fltSlope = (sum(map(operator.mul, lstT, lstValues)) - intCount * fltTMean * fltMean) / fltVar
+  return clsWindow(intCount, fltMean, min(lstValues), max(lstValues), fltSlope, lstTimes[0], lstTimes[-1])
+
+# ------------------------------------------------------------------------------
+def _funcAttach(strName, lstSpec, lock, lstConds):
+  '''
+    Unpickle a clsSharedState in a spawned process.
+  '''
+  return clsSharedState(lstSpec, strName=strName, lock=lock, lstConds=lstConds)
+
+# ------------------------------------------------------------------------------
+# Class Shared State -----------------------------------------------------------
+class clsSharedState:
+  def __init__(self, lstChannels, strRuntime='processes', strName=None, lock=None, lstConds=None, dictHistory=None):
+    '''
+      lstChannels = [(strName, strTypecode, lstStartValues)] creates the block,
+    each array is then the attribute strName.  dictHistory = {strName: (intDepth,
+    fltResolution)} gives the arrays keeping a history.  strName/lock/lstConds
+    attach to an existing block (used when unpickled).
+    '''
+    if strName is None:
+      dictHistory = dictHistory or {}
+      self._lstSpec = [(strArray, strTypecode, len(lstValues)) + tuple(dictHistory.get(strArray, (0, 0.))) \
+                       for strArray, strTypecode, lstValues in lstChannels]
+    else:
+      self._lstSpec = lstChannels
+    stcState = _stcLayout(self._lstSpec)
+
+    if strName is not None:                      # attach
+      self._shm = shared_memory.SharedMemory(name=strName)
+      buf = self._shm.buf
+      self._lock = lock
+    elif strRuntime == 'threads':                # one process, plain memory
+      self._shm = None
+      buf = bytearray(ctypes.sizeof(stcState))
+      self._lock = threading.Lock()
+      lstConds = [threading.Condition(self._lock) for strSpec in self._lstSpec]
+    else:                                        # create, owned by this process
+      self._shm = shared_memory.SharedMemory(create=True, size=ctypes.sizeof(stcState))
+      buf = self._shm.buf
+      self._lock = mp.Lock()
+      lstConds = [mp.Condition(self._lock) for strSpec in self._lstSpec]
+      atexit.register(self._shm.unlink)
+    self._lstConds = lstConds
+    # Map the structure by address: a ctypes object made with from_buffer holds
+    # the buffer exported and SharedMemory.close() then fails.
+    cFirst = ctypes.c_char.from_buffer(buf)
+    self._buf = buf
+    self._stc = stcState.from_address(ctypes.addressof(cFirst))
+    del cFirst
+
+    for (strArray, strTypecode, intLen, intDepth, fltResolution), cond in zip(self._lstSpec, lstConds):
+      setattr(self, strArray, clsSharedArray(self, strArray, cond, intDepth, fltResolution))
+    if strName is None:
+      fltNow = time.time()
+      for strArray, strTypecode, lstValues in lstChannels:
+        stcArray = getattr(self._stc, strArray)
+        for i, value in enumerate(lstValues):
+          stcArray.value[i] = value
+          stcArray.fltTime[i] = fltNow
+
+  def __reduce__(self):
+    if self._shm is None:
+      raise TypeError(' A threads runtime state block can not be passed to another process.')
+    return (_funcAttach, (self._shm.name, self._lstSpec, self._lock, self._lstConds))
+
+  def snapshot(self):
+    '''
+      Consistent copy of every array: {strName: (lstValues, lstSeqs, lstTimes)}.
+    '''
+    return {tupSpec[0]: getattr(self, tupSpec[0]).snapshot() for tupSpec in self._lstSpec}
+
+# ------------------------------------------------------------------------------
+# Class Shared Array -----------------------------------------------------------
+class clsSharedArray:
+  def __init__(self, istState, strArray, cond, intDepth=0, fltResolution=0.):
+    '''
+      One array of the block, indexed like a multiprocessing Array.  cond is
+    the condition on the writer lock notified by update().  intDepth rows of
+    history, fltResolution seconds apart at least.
+    '''
+    self._istState = istState
+    self._strArray = strArray
+    self._cond = cond
+    self._stc = getattr(istState._stc, strArray)
+    self._intLen = len(self._stc.value)
+    self._intDepth = intDepth
+    self._fltResolution = fltResolution
+
+  def __reduce__(self):
+    return (getattr, (self._istState, self._strArray))
+
+  def __len__(self):
+    return self._intLen
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return self.snapshot()[0][index]
+    return self._stc.value[index]
+
+  def __setitem__(self, index, value):
+    if isinstance(index, slice):
+      self.update(range(self._intLen)[index], value)
+    else:
+      self.update([index % self._intLen if index < 0 else index], [value])
+
+  def __iter__(self):
+    return iter(self.snapshot()[0])
+
+  def __repr__(self):
+    return self._strArray + str(self.snapshot()[0])
+
+  @property
+  def value(self):
+    '''
+      Element 0, for the one element arrays replacing a multiprocessing Value.
+    '''
+    return self._stc.value[0]
+
+  @value.setter
+  def value(self, value):
+    self.update([0], [value])
+
+  def update(self, lstIndex, lstValues):
+    '''
+      Write lstValues to the elements lstIndex as one update.
+    '''
+    lstValues = list(lstValues)
+    if len(lstValues) != len(lstIndex):
+      raise ValueError(' ' + self._strArray + ': ' + str(len(lstValues)) + ' values for ' + str(len(lstIndex)) + ' elements.')
+    stc = self._stc
+    with self._cond:                       # the writer lock
+      fltNow = time.time()
+      if stc.intSeqLock & 1:               # left odd by a writer killed in an update
+        stc.intSeqLock += 1
+      stc.intSeqLock += 1
+      for i, value in zip(lstIndex, lstValues):
+        stc.value[i] = value
+        stc.intSeq[i] += 1
+        stc.fltTime[i] = fltNow
+      if self._intDepth:
+        self._append(fltNow)
+      stc.intSeqLock += 1
+      self._cond.notify_all()
+    if _funcOnUpdate is not None:
+      _funcOnUpdate(self._strArray, lstIndex, lstValues, fltNow)
+
+  def _append(self, fltNow):
+    '''
+      The array as a history row, in update() while the writer lock is held.
+    '''
+    stc = self._stc
+    intHead = stc.intHead
+    if intHead and self._fltResolution and \
+       fltNow // self._fltResolution == stc.fltRowTime[(intHead - 1) % self._intDepth] // self._fltResolution:
+      intHead -= 1                         # same fltResolution bin: replaces the last row
+    intRow = intHead % self._intDepth
+    stc.fltRowTime[intRow] = fltNow
+    stc.fltRows[intRow * self._intLen:(intRow + 1) * self._intLen] = stc.value[:]
+    stc.intHead = intHead + 1
+
+  def snapshot(self):
+    '''
+      Consistent copy (lstValues, lstSeqs, lstTimes) of the array.
+    '''
+    stc = self._stc
+    for iTry in range(intRetries):
+      intSeqLock = stc.intSeqLock
+      if intSeqLock & 1:
+        time.sleep(0)
+        continue
+      tupCopy = (stc.value[:], stc.intSeq[:], stc.fltTime[:])
+      if stc.intSeqLock == intSeqLock:
+        return tupCopy
+    return (stc.value[:], stc.intSeq[:], stc.fltTime[:])
+
+  def sample(self, index):
+    '''
+      clsSample(value, seq, time) of one element.
+    '''
+    lstValues, lstSeqs, lstTimes = self.snapshot()
+    return clsSample(lstValues[index], lstSeqs[index], lstTimes[index])
+
+  def seq(self, index):
+    return self._stc.intSeq[index]
+
+  def history(self, index, fltSeconds=None):
+    '''
+      (array('d') of times, array('d') of values) of element index over the
+    last fltSeconds seconds (all the ring if None), oldest first.
+    '''
+    if not self._intDepth:
+      raise ValueError(' ' + self._strArray + ' keeps no history.')
+    stc = self._stc
+    if index < 0:
+      index += self._intLen
+    for iTry in range(intRetries):
+      intSeqLock = stc.intSeqLock
+      if intSeqLock & 1:
+        time.sleep(0)
+        continue
+      tupCopy = self._history(index, fltSeconds)
+      if stc.intSeqLock == intSeqLock:
+        return tupCopy
+    return self._history(index, fltSeconds)
+
+  def _history(self, index, fltSeconds):
+    '''
+      Copy of the rows of history(), without the seqlock check.
+    '''
+    stc = self._stc
+    intDepth, intLen = self._intDepth, self._intLen
+    intHead = stc.intHead
+    intCount = min(intHead, intDepth)      # rows in the ring, the oldest at intOldest
+    intOldest = (intHead - intCount) % intDepth
+    intSkip = 0                            # rows older than the window, binary search in the ring
+    if fltSeconds is not None:
+      fltFrom = time.time() - fltSeconds
+      intHi = intCount
+      while intSkip < intHi:
+        intMid = (intSkip + intHi) // 2
+        if stc.fltRowTime[(intOldest + intMid) % intDepth] < fltFrom:
+          intSkip = intMid + 1
+        else:
+          intHi = intMid
+    intStart, intCount = (intOldest + intSkip) % intDepth, intCount - intSkip
+    lstTimes, lstValues = array.array('d'), array.array('d')
+    for intFrom, intTo in ((intStart, min(intStart + intCount, intDepth)), (0, intStart + intCount - intDepth)):
+      if intFrom < intTo:                  # the window, in one or two pieces
+        lstTimes.frombytes(ctypes.string_at(ctypes.addressof(stc.fltRowTime) + 8 * intFrom, 8 * (intTo - intFrom)))
+        lstValues.extend(stc.fltRows[intFrom * intLen + index:intTo * intLen:intLen])
+    return lstTimes, lstValues
+
+  def window(self, index, fltSeconds=None):
+    '''
+      clsWindow (count, mean, min, max, slope per second, start, end) of element
+    index over the last fltSeconds seconds.
+    '''
+    return funcWindow(*self.history(index, fltSeconds))
+
+  def wait(self, index, intSeq, fltTimeout=None):
+    '''
+      Sleep until element index is updated after sequence number intSeq or
+    fltTimeout seconds passed.  True if it was updated.
+    '''
+    stc = self._stc
+    with self._cond:
+      return self._cond.wait_for(lambda: stc.intSeq[index] != intSeq, fltTimeout)
+
+  def waituntil(self, index, funcTest, fltTimeout=None):
+    '''
+      Sleep until funcTest(value of element index) is true or fltTimeout
+    seconds passed.  True if it is.
+    '''
+    stc = self._stc
+    with self._cond:
+      return self._cond.wait_for(lambda: funcTest(stc.value[index]), fltTimeout)
+
+# ------------------------------------------------------------------------------
+def _funcWriteLoop(fltTemps, intCount):
+  '''
+    Writer of the check below, at module level to be picklable.
+  '''
+  for i in range(intCount):
+    fltTemps[2:6] = [float(i)] * 4
+
+
+if __name__ == '__main__':
+
+  # Two processes: one writes fltTemps[2:6] as fast as it can, the main one
+  # checks that it never reads a half written update.
+  from ChillerSharedState import _funcWriteLoop as funcWriter
+  mp.set_start_method('spawn')
+  istState = clsSharedState([('fltTemps', 'd', [20] * 8)])
+  fltTemps = istState.fltTemps
+  intCount = 100000
+  istWriter = mp.Process(target=funcWriter, args=(fltTemps, intCount))
+  istWriter.start()
+  intReads = intTorn = 0
+  while istWriter.is_alive():
+    lstTemps = fltTemps[2:6]
+    intReads += 1
+    intTorn += len(set(lstTemps)) > 1
+  istWriter.join()
+  print('reads:', intReads, 'torn:', intTorn, 'last:', fltTemps.sample(2))
+
+  fltStart = time.time()
+  for i in range(intCount):
+    fltTemps[1]
+  fltIndex = (time.time() - fltStart) / intCount
+  fltStart = time.time()
+  for i in range(intCount):
+    fltTemps.sample(1)
+  fltSample = (time.time() - fltStart) / intCount
+  print('fltTemps[1] {:.2f} us, sample(1) {:.2f} us'.format(1e6 * fltIndex, 1e6 * fltSample))
+
+  # History: 4 hours at 1 s of fltTemps, append cost and window queries.
+  istState = clsSharedState([('fltTemps', 'd', [20] * 8)], 'threads', dictHistory={'fltTemps': (14400, 1.)})
+  fltTemps = istState.fltTemps
+  fltStart = time.time()
+  for i in range(20000):                   # more than the ring, cooling 0.1 C/s
+    fltTemps[1] = 20 - i / 10.
+    fltTemps._stc.fltRowTime[(fltTemps._stc.intHead - 1) % 14400] = fltStart - 20000 + i  # one row per second
+  fltAppend = (time.time() - fltStart) / 20000
+  print('update with history {:.2f} us'.format(1e6 * fltAppend))
+  for fltSeconds in (120, 3600, None):
+    fltStart = time.time()
+    istWindow = fltTemps.window(1, fltSeconds)
+    print('window({}) {:.2f} ms: {}'.format(fltSeconds, 1e3 * (time.time() - fltStart), istWindow))
@@ -10,6 +10,7 @@ History: ----------------------------------------------------------------------
   V1.0 - Oct-2017  First public release.
   V1.4 - Jul-2018  Updated comments.
   V1.5 - Sep-2018  Removed generating lookup table code and inserted complete table.
+  V1.6 - Oct-2026  Added calc, CRC of a whole bytes/bytearray/memoryview in one call.
 Environment: ------------------------------------------------------------------
 	This program is written in Python 3.6.  Python can be freely downloaded from 
 http://www.python.org/.  This program has been tested on PCs running Windows 10.
@@ -71,6 +72,15 @@ class CycRedundCheck :
     crc = (crc >> 8) ^ self.table[(crc ^ by) & 0xFF]
     return (crc & 0xFFFF)
 
+  def calc( self, data, crc=0xFFFF):
+    """Given bytes, bytearray or memoryview and starting CRC, Calc the CRC-16 in one pass"""
+    if isinstance(data, memoryview) and data.format != 'B':
+        data = data.cast('B')
+    table = self.table
+    for by in data:
+        crc = (crc >> 8) ^ table[(crc ^ by) & 0xFF]
+    return crc
+
   def calcString( self, st, crc):
     """Given a bunary string and starting CRC, Calc a final CRC-16 """
     for ch in st:
@@ -89,3 +99,4 @@ if __name__ == '__main__':
     for ch in st:
         crc = ck.calcByte( ch, crc)
     print("Calculated CRC = 0x%x" %crc)
+    print("Calculated CRC = 0x%x (calc)" %ck.calc( b"\x01\x06\x00\x2C\x00\x8D" ))
@@ -6,204 +6,196 @@ Author: William Heidorn, Iowa State University, USA
 A program that reads *.log files from the ISU chiller control system and
 converts them into a readable csv file.
 
-'''
-import sys
-import os
-
-
-intCounter = 29
-Toggle = False
+The binary run files of the same run (*.chr, see ChillerRecorder.py) give the
+csv without parsing the log:  python DataStripper.py Run.*.chr
+They hold the channels of the shared state only: RUN (the routine messages of
+the log) and FlowMeter (the Arduino voltage) are not recorded and are 0.
 
-#Defines the counter used which is a global used to correct the temperature time values 
-def intCounterMinus():
-  global intCounter
-  intCounter += -1
-def intCounterReset():
-  global intCounter
-  intCounter = 29
+The log of a run is read through its index (Run.idx, see ChillerLogStore.py),
+the segments compressed or not.  Only a time window of it, local times:
 
-def GetDate( Line ):
-  '''
-    Calculates the date and returns the time in seconds assuming 0s is Jan 1, 0
-  '''
-  strDate = str(Line)[:10]  
-  intYear = int(str(strDate)[6:])
-  intMonth = int(str(strDate)[:2])
-  intDay = int(str(strDate)[3:5])
+     python DataStripper.py Run.log --from=mm-dd-yyyy_hh-mm-ss --to=mm-dd-yyyy_hh-mm-ss
 
-  for intMonthCounter in range (1,intMonth):
-    if intMonthCounter == 2:
-      if intYear % 4 == 0:
-        intDay += 29
-      else:
-        intDay += 28
-    elif intMonthCounter == 4 or intMonthCounter == 6 or intMonthCounter == 9 or intMonthCounter == 11:
-      intDay += 30
-    else:
-      intDay += 31
-
-  if intYear % 4 == 0:
-    intDay += intYear * 366
-  else:
-    intDay += intYear * 365
-
-  fltDateTime = intDay * 24 * 3600
-  return fltDateTime
-
-#Finds the time from a given line of the log and returns a flt time in seconds
-def GetTime( Line ):
-  '''
-    Calculates the time from a given line of the logfile
-  '''
-  strAMorPM = str(Line)[20:22]
-  strTime = str(Line)[11:19]
-  fltDate = GetDate(Line)
-    
-  fltTime = sum(x * int(t) for x, t in zip([3600, 60, 1], strTime.split(":")))
-  
-  if strAMorPM == 'PM' and str(Line)[11:13]!='12':
-    fltTime = fltTime + 3600*12
-  elif strAMorPM == 'AM' and str(Line)[11:13]=='12':
-    fltTime = fltTime - 3600*12
-
-  fltTime+=fltDate
-  #print(strTime+' '+strAMorPM+' '+strDate+' '+str(fltTime))
-  return fltTime
-
-#Finds information from a useful line and adds it to the csv file
-def ReadLine( Line,fltStartTime):
-  '''
-    Function that converts a single line of code into a date, time and info string
-  '''
-  absfltTime = GetTime(Line)
-  fltTime = absfltTime- fltStartTime #Gets the time since the program started 
+reads the blocks of the segments holding it only.
 
-  RPS = ' '
-  FlowRate = ' '
-  TRes = ' '
-  T1 = ' '
-  T2 = ' '
-  T3 = ' '
-  T4 = ' '
-  TSet = ' '
-  Hum = ' '
-  TH1 = ' '
-  TH2 = ' '
-  Volt = ' '
+The logs are read as streams, merged in time order and written as they come:
+the memory does not grow with the length of the run.  The lines are parsed by
+the grammar of ChillerLogGrammar.py, the absolute times are time.time() as in
+the csv of the binary run files.
 
-  RUN = '0' # No routine notification
+'''
+import sys
+import os
+import time
+import heapq
+from ChillerRecorder import funcMergeRecords
+from ChillerLogStore import funcLogLines, funcLogExists
+from ChillerLogGrammar import funcParseLines, funcTime
+
+
+SortWindow = 60. # seconds a row waits for the back-dated readings of its log
+BatchSize = 1000 # rows written at a time
+
+#State of the reading of one log: the counter used to correct the temperature
+#time values of a read of the thermocouple logger, and the valve toggle
+def NewState():
+  return {'Counter': 29, 'Toggle': False}
+
+#The columns of the csv file filled by each kind of record of the log
+KindColumns = {'FlowRate': ('FlowRate',), 'TRes': ('TRes',), 'Thermo': ('T1','T2','T3','T4'),
+               'ThermoHidden': ('T1','T2','T3','T4'), 'Temps': ('TSet','TRes','T1','T2','T3','T4'), 'Humidity': ('Hum','TH1','TH2'),
+               'Voltage': ('Volt',), 'WaitTRes': ('TSet',), 'PumpSet': ('RPS',), 'ChillerSet': ('TSet',)}
+RowNames = ['absTime','relTime','TSet','TRes','T1','T2','T3','T4','Hum','Volt','RPS','FlowRate','TH1','TH2','TStave','RUN','Toggle']
+KindIndexes = dict((Kind, [RowNames.index(Name) for Name in Names]) for Kind, Names in KindColumns.items())
+BlankRow = [' '] * (len(RowNames) - 2)
+RunCodes = {'WaitTRes': '2', 'ChillerSet': '2', 'WaitSlope': '3', 'StaveReached': '4',
+            'PumpSet': '1', 'Toggled': '1', 'Running': '1'}
+            # 0 No routine notification
             # 1 Notification that is not determined
             # 2 Waiting for fluid to reach set temp
             # 3 Waiting for slope to flatten
             # 4 Reached set temp
 
-  global Toggle
-
-  if '<DATA>' in Line: #IT is a data line
-    Line = Line.split('<DATA>')[-1]
-    if 'Arduino' in Line: # It is a flow rate measurement
-      string = Line.split('=')[-1]
-      string = string.strip(' l/min\n')
-      FlowRate = string
-
-      #print(FlowRate)
-    elif 'TempReadings' in Line: #Temperature Readings
-      if 'TRes' in Line: #Temp from chiller
-        string = Line.split('=')[-1]
-        string = string.strip(' \n')
-        TRes = string
-        #print(TRes)
-
-      else: #Temp from temperature logger old
-        string = Line.strip('TempReadings \n')
-        string = string.split(',')
-        T1 = string[0].split(':')[-1]
-        T2 = string[1].split(':')[-1]
-        T3 = string[2].split(':')[-1]
-        T4 = string[3].split(':')[-1]
-        global intCounter # This changes the time so that it will be correct
-        fltTime = fltTime -float(intCounter)
-        absfltTime = absfltTime - float(intCounter)
-        intCounterMinus() #Subtracts one from the counter
-        #print(T1)
-        
-    elif 'Temps' in Line: #Get set temperature
-      string = Line.strip('Temps TSet: ')
-      string = string.split(',')
-      string = string[0]
-      TSet = string
-      #print(TSet)
-
-    elif 'Humidity' in Line: #Get humidity and its temperatures
-      string = Line.strip(' \n')
-      string = string.split(',')
-      Hum = string[0].split(':')[-1]
-      TH1 = string[1].split(':')[-1]
-      TH2 = string[2].split(':')[-1]
-      #print(Hum)
+#Finds information from a record of the log and makes a row of the csv file
+def ReadLine( Record,fltStartTime,State):
+  '''
+    Function that converts a record of the log (ChillerLogGrammar.py) into
+    a row: start time, time since the start in s, data (' ' if not in the
+    record), RUN and valve toggle.
+  '''
+  fltTime = Record.time - fltStartTime #Gets the time since the program started 
+  Row = [str(fltStartTime), fltTime] + BlankRow
+  for i, fltValue in zip(KindIndexes.get(Record.kind, ()), Record.values):
+    Row[i] = str(fltValue)
+
+  if Record.kind == 'Thermo': #Temp from temperature logger old, a read of 29 points
+    # This changes the time so that it will be correct
+    Row[1] = fltTime -float(State['Counter'])
+    State['Counter'] += -1 #Subtracts one from the counter
+    if State['Counter'] == 0:
+      State['Counter'] = 29
+  elif Record.kind == 'Toggled':
+    State['Toggle'] = not State['Toggle']
 
-  if 'HIDDEN' in Line:
-    Line = Line.split("<HIDDEN>")[-1]
+  #Create Averaged Temperature
+  if Row[4] != ' ':
+    Row[14] = str((float(Row[4])+float(Row[5]))/2.)
+  Row[15] = RunCodes.get(Record.kind, '0')
+  Row[16] = str(int(State['Toggle']))
+  return Row
+
+#The records of a log from fltFrom to fltTo (time.time(), None: no limit)
+def ReadRecords( file, fltFrom, fltTo, Sizes=None ):
+  '''
+    The index gives the blocks of the window, the first and last of them also
+    hold lines out of it.  Sizes[0] counts the characters read.
+  '''
+  Lines = funcLogLines(file, fltFrom, fltTo)
+  if Sizes is not None:
+    Lines = CountSize(Lines, Sizes)
+  for Record in funcParseLines(Lines):
+    if (fltFrom is not None and Record.time < fltFrom) or (fltTo is not None and Record.time > fltTo):
+      continue
+    yield Record
 
-    if 'Arduino' in Line:
-      string = Line.split(':')[-1]
-      string = string.strip(' \n')
-      Volt = string
-    elif 'TempReadings' in Line:
-      string = Line.strip('TempReadings \n')
-      string = string.split(',')
-      T1 = string[0].split(':')[-1]
-      T2 = string[1].split(':')[-1]
-      T3 = string[2].split(':')[-1]
-      T4 = string[3].split(':')[-1]
-	    
-  if 'RUNNING' in Line:
-    Line = Line.split("< RUNNING >")[-1]
-    
-    # RUNNING Commands
-    if 'Changing Temperature' in Line:
-      RUN = '2'
-      string = Line.split(':')[-1]
-      string = string.split('C')
-      string = string.strip(' ')
-      TSet = string
-    elif 'Waiting 1 min for TRes' in Line:
-      RUN = '2'
-      string = Line.split(':')[-1]
-      if 'Waiting' in string:
-        return
-      string = string.strip(' \n')
-      TSet = string
-    elif 'Routine waiting' in Line:
-      RUN = '3'
-    elif 'Stave reached' in Line:
-      RUN = '4'
-    else:
-      RUN = '1'
-      if 'Pump Set' in Line:
-        string = Line.split(':')[-1]
-        string = string.strip(' \n')
-        RPS = string
-      elif 'Chiller Set' in Line:
-        string = Line.split(':')[-1]
-        string = string.strip(' \n')
-        TSet = string
-        RUN = '2'
-      elif 'Arduino Toggled' in Line:
-        if Toggle == True:
-          Toggle = False
-        else:
-          Toggle = True
+def CountSize( Lines, Sizes ):
+  for Line in Lines:
+    Sizes[0] += len(Line)
+    yield Line
 
-  #Create Averaged Temperature
-  if T1 == ' ':
-    TStave = ' '
-  else:
-    TStave = str((float(T1)+float(T2))/2.)
-      
+#Reads one log as a stream of rows in time order
+def ReadLog( file, fltStartTime, fltFrom, fltTo, Sizes ):
+  '''
+    The readings of the thermocouple logger are back-dated up to 29 s, so a
+    row waits in a heap until the log is SortWindow seconds past it.  Sizes[0]
+    counts the characters read.
+  '''
+  State = NewState()
+  Heap = []
+  nLine = 0
+  fltNewest = float('-inf')
+  for Record in ReadRecords(file, fltFrom, fltTo, Sizes):
+    DataLine = ReadLine(Record,fltStartTime,State)
+    heapq.heappush(Heap, (DataLine[1], nLine, DataLine)) #Same times stay in the order of the log
+    nLine += 1
+    fltNewest = max(fltNewest, DataLine[1])
+    while Heap[0][0] < fltNewest - SortWindow:
+      yield heapq.heappop(Heap)[2]
+  while Heap:
+    yield heapq.heappop(Heap)[2]
+
+#Combines lines with multiple sets of information
+def Condense( Rows ):
+  '''
+    One row per time: the blank (' ') or '0' fields of the first row of a time
+    take the value of the next rows of that time.
+  '''
+  NewLine = None
+  for DataLine in Rows:
+    if NewLine is not None and DataLine[1] == NewLine[1]:
+      for i in range(len(NewLine)):
+        if NewLine[i] != DataLine[i] and NewLine[i] in (' ', '0'):
+          NewLine[i] = DataLine[i]
+      continue
+    if NewLine is not None:
+      yield NewLine
+    NewLine = list(DataLine)
+  if NewLine is not None:
+    yield NewLine
+
+#Writes the rows to the output file as a simple set of numbers separated by commas
+def WriteRows( Rows, outputFile ):
+  '''
+    Blank spots take the value of the row before, the time is converted from
+    seconds to min.  Returns the number of rows.
+  '''
+  nvars = 16
+  oldLine = [0. for i in range(nvars)]
+  Batch = []
+  nRows = 0
+  for line in Rows:
+    for i in range(nvars):
+      if line[i] ==' ':
+        line[i] = oldLine[i]
+      else:
+        oldLine[i] = line[i]
+    line[1] = float(line[1])/60.
+    Batch.append(', '.join(map(str, line))+'\n')
+    if len(Batch) >= BatchSize:
+      outputFile.write(''.join(Batch))
+      nRows += len(Batch)
+      Batch = []
+  outputFile.write(''.join(Batch))
+  return nRows + len(Batch)
+
+#Converts the records of the binary run files into the csv file
+def RecordsToCsv( inputfiles, strOutput='output.csv' ):
+  '''
+    Writes one line per record time, the channels not recorded at that time
+    keep their last value.  RUN and FlowMeter are not recorded: 0.
+  '''
+  Columns = ['TSet','TRes','T1','T2','T3','T4','Humidity','FlowMeter','PumpRPS','FlowRate','TH1','TH2']
+  Values = dict((Name, 0.) for Name in Columns + ['Valve'])
+  fltStartTime = None
+  Line = None
+  outputFile = open(strOutput,'w')
+  outputFile.write('absTime[s],relTime[min],Tset[C],TRes[C],T1[C],T2[C],T3[C],T4[C],THum[%],FlowMeter[V],RPS[rps],FlowRate[l/min],TH1[C],TH2[C],TStave[C],RUN,Toggle[bol]\n')
+  for fltTime, Name, fltValue in funcMergeRecords(inputfiles): #Time order over all the files
+    if fltStartTime is None:
+      fltStartTime = fltTime
+    if Line is not None and fltTime != Line: #All records of the previous time are in
+      WriteRecordLine(outputFile, Line, fltStartTime, Columns, Values)
+    Line = fltTime
+    if Name in Values:
+      Values[Name] = fltValue
+  if Line is not None:
+    WriteRecordLine(outputFile, Line, fltStartTime, Columns, Values)
+  outputFile.close()
 
-  strLine =str(fltStartTime)+','+str(fltTime)+','+TSet+','+TRes+','+T1+','+T2+','+T3+','+T4+','+Hum+','+Volt+','+RPS+','+FlowRate+','+TH1+','+TH2+','+TStave+','+RUN+','+str(int(Toggle))
-  return strLine
+def WriteRecordLine( outputFile, fltTime, fltStartTime, Columns, Values ):
+  TStave = (Values['T1']+Values['T2'])/2.
+  line = [fltStartTime, (fltTime-fltStartTime)/60.] + [Values[Name] for Name in Columns] + [TStave, 0, int(Values['Valve'])]
+  outputFile.write(','.join(str(x) for x in line)+'\n')
 
 # -----------------------------------------------------------------------------
 # The main loop----------------------------------------------------------------
@@ -219,111 +211,52 @@ def main():
   #Load in the input file
   nargv = len(sys.argv)
   inputfiles = []
+  fltFrom = None
+  fltTo = None
   if (nargv <= 1):
     print("ERROR: Please provide log file")
     return
   else:
     for i in range(1,nargv):
+      try:
+        if sys.argv[i].startswith('--from='):
+          fltFrom = funcTime(sys.argv[i][len('--from='):])
+          continue
+        elif sys.argv[i].startswith('--to='):
+          fltTo = funcTime(sys.argv[i][len('--to='):])
+          continue
+      except ValueError:
+        print("ERROR: Incorrect time. Input style is mm-dd-yyyy_hh-mm-ss")
+        return
       inputfiles.append(sys.argv[i])  
 
+  if all(file.endswith('.chr') for file in inputfiles): #Binary run files, no parsing
+    RecordsToCsv(inputfiles)
+    return
+
   strStartFile = inputfiles[0]
   
   #Load in the file  
   try:
-    inputFile = open(strStartFile,'r')
+    fltStartTime = next(ReadRecords(strStartFile, fltFrom, fltTo)).time
   except:
     print("Data file "+ strStartFile + " not found! Plotting last output in memory!")
     return 
  
-  Line = inputFile.readline()
-  fltStartTime = GetTime(Line)
   #Creates a new output csv file with initial conditions  
   outputFile = open('output.csv','w')  
   Startline = 'absTime[s],relTime[min],Tset[C],TRes[C],T1[C],T2[C],T3[C],T4[C],THum[%],FlowMeter[V],RPS[rps],FlowRate[l/min],TH1[C],TH2[C],TStave[C],RUN,Toggle[bol]\n' 
   outputFile.write(Startline)
-  outputFile.close()
-  inputFile.close()
-  #Opens the csv file to append our data to it
-  outputFile = open('output.csv','a')
-  
-  intCounterReset()
-  DataList=[]
-  i=0
-  
-  # Reads the input file and makes a data list
-  for file in inputfiles:
-    try:
-      inputFile = open(file,'r')
-    except:
-      continue
-    for line in inputFile:
-
-      try:
-        strLine = ReadLine(line,fltStartTime)
-      except:
-        continue
-      if strLine != None:
-        DataLine = strLine.split(',') #Takes the string line and reads it as a list
-        DataLine[1] = float(DataLine[1])#Converts the second data point(relative time) to a float
-        DataList.append(tuple(DataLine)) # converts each line to a tuple 
-        i+=1
-      if intCounter == 0:
-        intCounterReset()
-    inputFile.close()
-
-  #Sorts the data by the time value
-  DataListSorted = sorted(DataList,key =lambda data: data[1]) 
-
-  #Combines lines with multiple sets of information
-  DataListCondensed = []
-  linesToSkip = 0
-  for line in range(len(DataListSorted)-1):
-    if linesToSkip > 0:
-      linesToSkip += -1
-      continue
-    lineTime = DataListSorted[line][1]
-    linesToSkip = 0
-    NextLineTime = DataListSorted[line+1][1] 
-    NewLine = list(DataListSorted[line])
-    while lineTime == NextLineTime:
-      for i in range(len(DataListSorted[line])):
-        Data1 = NewLine[i]
-        Data2 = DataListSorted[line+1+linesToSkip][i]
-        if Data1 == Data2:
-          NewLine[i] = Data1
-        elif Data1 == ' ':
-          NewLine[i] = Data2
-        elif Data1 == '0':
-          NewLine[i] = Data2            
-      linesToSkip+=1
-      try:
-        NextLineTime = DataListSorted[line+1+linesToSkip][1]
-      except:
-        NextLineTime = 999999999
-    if linesToSkip> 0:
-      DataListCondensed.append(tuple(NewLine))
-    else:
-      DataListCondensed.append(DataListSorted[line])
 
-  #Writes the data list to the output file as a simple set of numbers separated by commas
-  nvars = 16
-  oldLine = [0. for i in range(nvars)]
-  #Remove blank spots with old lines
-  for line in DataListCondensed:
-    line = list(line)
-    for i in range(nvars):
-      if line[i] ==' ':
-        line[i] = oldLine[i]
-      else:
-        oldLine[i] = line[i]
-      if i == 1: #Convert time from seconds to min
-        strTimeSec = line[i]
-        strTimeMin = str(float(strTimeSec)/60.)
-        line[i] = strTimeMin 
-    strline = str(line)
-    strline = strline.strip("[] ")
-    strline = strline.replace("'","")
-    outputFile.write(strline+'\n')
+  # Reads the input files as streams merged by the time value
+  Sizes = [0]
+  fltClock = time.perf_counter()
+  Streams = [ReadLog(file, fltStartTime, fltFrom, fltTo, Sizes) for file in inputfiles if funcLogExists(file)]
+  Rows = heapq.merge(*Streams, key=lambda DataLine: DataLine[1])
+  nRows = WriteRows(Condense(Rows), outputFile)
+  outputFile.close()
+  fltClock = time.perf_counter() - fltClock
+  print("{:.1f} MB of log, {} rows in {:.1f} s: {:.1f} MB/s".format(Sizes[0]/1e6, nRows, fltClock, Sizes[0]/1e6/max(fltClock, 1e-9)))
 
 if __name__  == '__main__' :
   main()
@@ -16,53 +16,250 @@ usage: ./FindInfo.py [output.csv] [time] [duration]
 
      duration: This is the amount of data to look at 
 
+batch: ./FindInfo.py --windows=[file] --window=[time],[duration] ... [output.csv] [--out=file.csv]
+
+     The mean, the standard deviation and the number of points of every variable
+     for many windows, e.g. one per plateau of a run.  The file has a window per
+     line, [time] [duration] as above (# starts a comment), --window= adds one.
+     One csv row per window, to the --out= file or printed.  The sums and the
+     sums of squares of the columns are accumulated once (PrefixSums), a window
+     is then the difference of two of them: no rescan of the rows per window.
+
+The columns of the csv are kept in a binary cache next to it, [output.csv].cache:
+a header (CacheHeader, then the JSON of the column names), the times since the
+first row and one float64 array per column, in time order.  It is memory-mapped,
+the rows of the window are found by bisection of the times: a query reads the
+rows of its window only.  The cache is made again when the modification time
+or the size of the csv changes.
+
 '''
 import sys
 import os
 import csv
+import json
+import time
+import mmap
+import array
+import bisect
+import struct
+import operator
+import itertools
+from ChillerLogGrammar import funcTime
 
-def GetDate( Line ):
+CacheMagic = b'FINDINFO'
+CacheVersion = 1
+CacheHeader = struct.Struct('<8sHqQdII')   # magic, version, csv mtime (ns) and size, start time, rows, length of the names
+
+#The columns of a csv file of DataStripper.py, from its cache
+def LoadColumns( filename ):
   '''
-    Calculates the date and returns the time in seconds assuming 0s is Jan 1, 0
+    Returns the column names, the absolute time of the first row, the times
+    since the first row in s and the columns, as memoryviews of float64 in
+    time order, and 'loaded' or 'made'.  The absolute time column includes
+    the relative time of the row.
   '''
-  strDate = str(Line)[:10]  
-  intYear = int(str(strDate)[6:])
-  intMonth = int(str(strDate)[:2])
-  intDay = int(str(strDate)[3:5])
-
-  for intMonthCounter in range (1,intMonth):
-    if intMonthCounter == 2:
-      if intYear % 4 == 0:
-        intDay += 29
-      else:
-        intDay += 28
-    elif intMonthCounter == 4 or intMonthCounter == 6 or intMonthCounter == 9 or intMonthCounter == 11:
-      intDay += 30
-    else:
-      intDay += 31
-
-  if intYear % 4 == 0:
-    intDay += intYear * 366
+  stat = os.stat(filename)
+  Key = (stat.st_mtime_ns, stat.st_size)
+  strCacheName = filename + '.cache'
+  try:
+    Columns = ReadCache(strCacheName, Key)
+    if Columns is not None:
+      return Columns + ('loaded',)
+  except (OSError, ValueError, struct.error):   # a broken cache is made again
+    pass
+  WriteCache(filename, strCacheName, Key)
+  return ReadCache(strCacheName, Key) + ('made',)
+
+def ReadCache( strCacheName, Key ):
+  '''
+    The columns of the cache, None if it is not the one of Key.
+  '''
+  with open(strCacheName, 'rb') as fileCache:
+    Map = mmap.mmap(fileCache.fileno(), 0, access=mmap.ACCESS_READ)
+  Magic, Version, MTime, Size, fltStart, nRows, nNames = CacheHeader.unpack_from(Map, 0)
+  if Magic != CacheMagic or Version != CacheVersion or (MTime, Size) != Key:
+    Map.close()
+    return None
+  Info = json.loads(Map[CacheHeader.size:CacheHeader.size+nNames].decode())
+  if Info['byteorder'] != sys.byteorder:
+    Map.close()
+    return None
+  View = memoryview(Map)
+  Offset = (CacheHeader.size + nNames + 7)//8*8
+  Columns = []
+  for i in range(len(Info['names'])+1):
+    Columns.append(View[Offset:Offset+8*nRows].cast('d'))
+    Offset += 8*nRows
+  return Info['names'], fltStart, Columns[0], Columns[1:]
+
+def WriteCache( filename, strCacheName, Key ):
+  '''
+    Reads the csv once into one array per column and writes the cache.
+  '''
+  with open(filename,'r') as ffile:
+    csv_reader = csv.reader(ffile)
+    datainfo = next(csv_reader)
+    nVar = len(datainfo)
+    dataArray = [array.array('d') for x in range(nVar)]
+    for row in csv_reader:
+      if len(row) < nVar: #Empty, or cut short by a csv being written
+        continue
+      for nitem in range(nVar):
+        dataArray[nitem].append(float(row[nitem]))
+      dataArray[0][-1] += float(row[1])*60 #Fixes the absolute start time output
+
+  fltStart = dataArray[0][0] if dataArray[0] else 0.
+  timeList = array.array('d', [fltAbs - fltStart for fltAbs in dataArray[0]])
+  if any(timeList[i] > timeList[i+1] for i in range(len(timeList)-1)): #Rows out of time order
+    Order = sorted(range(len(timeList)), key=timeList.__getitem__)
+    timeList = array.array('d', [timeList[i] for i in Order])
+    dataArray = [array.array('d', [Column[i] for i in Order]) for Column in dataArray]
+
+  Names = json.dumps({'names': datainfo, 'byteorder': sys.byteorder}).encode()
+  strTmpName = strCacheName + '.' + str(os.getpid())
+  with open(strTmpName, 'wb') as fileCache:
+    fileCache.write(CacheHeader.pack(CacheMagic, CacheVersion, Key[0], Key[1], fltStart, len(timeList), len(Names)))
+    fileCache.write(Names + bytes(-(CacheHeader.size + len(Names)) % 8))
+    timeList.tofile(fileCache)
+    for Column in dataArray:
+      Column.tofile(fileCache)
+  os.replace(strTmpName, strCacheName) #Another query never sees half a cache
+
+#The window of a time and a duration, as given to the program
+def GetWindow( strTime, strDuration, fltStart ):
+  '''
+    Returns Tmin and Tmax in s since the first row, ValueError with the
+    message to print if the time or the duration is not right.
+  '''
+  #Get the time
+  if '-' in strTime:
+    try: 
+      fltTime = funcTime(strTime) - fltStart
+    except ValueError:
+      raise ValueError("ERROR: Incorrect time. Input style is mm-dd-yyyy_hh-mm-ss")
   else:
-    intDay += intYear * 365
+    try:
+      fltTime = float(strTime)*60
+    except ValueError:
+      raise ValueError("ERROR: Incorrect time. Input style is a float in min")
+  #Check the interval
+  try:
+    fltDuration = float(strDuration)*60
+  except ValueError:
+    raise ValueError("ERROR: Incorrect duration format. It should be a number in min")
+  return fltTime - fltDuration/2., fltTime + fltDuration/2.
 
-  fltDateTime = intDay * 24 * 3600
-  return fltDateTime
+#The rows of the times Tmin < t < Tmax
+def Window( timeList, Tmin, Tmax ):
+  '''
+    Returns the first row and the row after the last, the times are in order.
+  '''
+  first = bisect.bisect_right(timeList, Tmin)
+  last = bisect.bisect_left(timeList, Tmax, first)
+  return first, max(first, last)
 
-#Finds the time from a given line of the log and returns a flt time in seconds
-def GetTime( Line ):
+#Cumulative sums of the columns, for the statistics of many windows
+def PrefixSums( dataArray ):
   '''
-    Calculates the time from a given line of the logfile
+    Returns per column its first value x0 and the sums of x-x0 and of
+    (x-x0)**2 over the rows before each row, one more at the end.  Shifted
+    by x0, the squares of the absolute times keep their precision.
   '''
+  Sums = []
+  for Column in dataArray:
+    x0 = Column[0] if len(Column) else 0.
+    Shifted = array.array('d', [x - x0 for x in Column])
+    Sum = array.array('d', [0.])
+    Sum.extend(itertools.accumulate(Shifted))
+    SumSq = array.array('d', [0.])
+    SumSq.extend(itertools.accumulate(map(operator.mul, Shifted, Shifted)))
+    Sums.append((x0, Sum, SumSq))
+  return Sums
 
-  strTime = str(Line)[11:19]
-  fltDate = GetDate(Line)
-    
-  fltTime = sum(x * int(t) for x, t in zip([3600, 60, 1], strTime.split("-")))
+#Mean and standard deviation of every column over the rows first to last-1
+def WindowStats( Sums, first, last ):
+  nPoints = last - first
+  Stats = []
+  for x0, Sum, SumSq in Sums:
+    avgVal = (Sum[last] - Sum[first])/nPoints
+    stdDev = max((SumSq[last] - SumSq[first])/nPoints - avgVal**2, 0.)**0.5
+    Stats.append((x0 + avgVal, stdDev))
+  return Stats
 
-  fltTime+=fltDate
-  #print(strTime+' '+strAMorPM+' '+strDate+' '+str(fltTime))
-  return fltTime
+#Reads the windows of a file, [time] [duration] per line
+def ReadWindows( strWindowFile ):
+  Windows = []
+  with open(strWindowFile,'r') as ffile:
+    for line in ffile:
+      Items = line.split('#')[0].replace(',',' ').split()
+      if not Items:
+        continue
+      if len(Items) != 2:
+        raise ValueError("ERROR: Incorrect window '"+line.strip()+"' in "+strWindowFile+", it should be [time] [duration]")
+      Windows.append(tuple(Items))
+  return Windows
+
+#The statistics of many windows, one csv row per window
+def BatchMain( args ):
+  '''
+    args: --windows=file, --window=time,duration, --out=file and the csv file.
+  '''
+  filename = "output.csv"
+  strOutput = None
+  Windows = []
+  try:
+    for arg in args:
+      if arg.startswith('--windows='):
+        Windows += ReadWindows(arg[len('--windows='):])
+      elif arg.startswith('--window='):
+        Items = arg[len('--window='):].split(',')
+        if len(Items) != 2:
+          raise ValueError("ERROR: Incorrect window "+arg+", it should be --window=[time],[duration]")
+        Windows.append(tuple(Items))
+      elif arg.startswith('--out='):
+        strOutput = arg[len('--out='):]
+      else:
+        filename = arg
+  except OSError as err:
+    print("ERROR: Failed to read windows file: "+str(err))
+    return
+  except ValueError as err:
+    print(err)
+    return
+
+  try:
+    datainfo, fltStart, timeList, dataArray, strCache = LoadColumns(filename)
+  except (OSError, ValueError, csv.Error):
+    print("ERROR: Failed to read csv file")
+    return
+  fltClock = time.perf_counter()
+  Sums = PrefixSums(dataArray)
+
+  #One row per window: the window, the number of points, mean and std of each variable
+  Rows = [['time','duration[min]','Tmin[min]','Tmax[min]','nPts'] +
+          [Stat+'('+Name+')' for Name in datainfo for Stat in ('mean','std')]]
+  for strTime, strDuration in Windows:
+    try:
+      Tmin, Tmax = GetWindow(strTime, strDuration, fltStart)
+    except ValueError as err:
+      print(err)
+      return
+    first, last = Window(timeList, Tmin, Tmax)
+    Row = [strTime, strDuration, Tmin/60., Tmax/60., last - first]
+    if last > first:
+      for avgVal, stdDev in WindowStats(Sums, first, last):
+        Row += [avgVal, stdDev]
+    else: #No points in the window
+      Row += ['', ''] * len(datainfo)
+    Rows.append(Row)
+
+  if strOutput is None:
+    csv.writer(sys.stdout, lineterminator='\n').writerows(Rows)
+  else:
+    with open(strOutput,'w',newline='') as outputFile:
+      csv.writer(outputFile).writerows(Rows)
+    print("{} windows of {} ({} cache) in {:.1f} ms: {}".format(len(Windows), filename, strCache,
+          1e3*(time.perf_counter()-fltClock), strOutput))
 
 def main():
   """
@@ -72,11 +269,16 @@ def main():
     print ("ERROR: Code works for python version 3 only")
     raise Exception(" Wrong python version")
 
+  if any(arg.startswith('--window') for arg in sys.argv[1:]):
+    BatchMain(sys.argv[1:])
+    return
+
   #Load in the input conditions
   nargv = len(sys.argv)
   inputfiles = []
   if (nargv <= 2):
     print("ERROR: Please provide  ./FindInfo.py [time] [duration] [file to read=output.csv]")
+    print("       or  ./FindInfo.py --windows=[file] --window=[time],[duration] ... [file to read=output.csv] [--out=file.csv]")
     return
   elif nargv == 3:
     strTime = sys.argv[1]
@@ -91,90 +293,39 @@ def main():
   print("\tTime  : "+strTime)
   print("\tDur.  : "+strDuration)
 
-  #Load in the input csv
+  #Load in the columns of the csv, from its cache
+  fltClock = time.perf_counter()
   try:
-    ffile = open(filename,'r')
-    csv_reader = csv.reader(ffile)
-  except:
+    datainfo, fltStart, timeList, dataArray, strCache = LoadColumns(filename)
+  except (OSError, ValueError, csv.Error):
     print("ERROR: Failed to read csv file")
     return
+  nVar = len(datainfo)
+  print("\tCache : "+strCache+" in {:.1f} ms".format(1e3*(time.perf_counter()-fltClock)))
 
-  #Generate Data Outline
-  nlines = 0
-  for row in csv_reader:
-    if nlines == 0:
-      datainfo = row
-      nVar = len(datainfo)
-    nlines += 1
-
-  #Generate and fill data array
-  ffile2 = open(filename,'r')
-  csv_reader2 = csv.reader(ffile2)
-  dataArray = [[0. for y in range(nlines-1)] for x in range(nVar)]
-  timeList = [0. for y in range(nlines-1)]
-  nrow = 0
-
-  for row in csv_reader2:
-    dataline = row
-    if nrow == 0:
-      nrow = 1 
-      continue
-    nitem = 0
-    for item in dataline:
-      dataArray[nitem][nrow-1] = float(item)
-      if nitem ==1:
-        dataArray[nitem-1][nrow-1] += float(item)*60 #Fixes the absolute start time output
-      nitem+=1
-    timeList[nrow-1] = dataArray[0][nrow-1] - dataArray[0][0]
-    nrow+=1
-
-  #Get the time
-  if '-' in strTime:
-    try: 
-      fltTimeAbs = GetTime(strTime)
-      fltTime = fltTimeAbs - dataArray[0][0]
-    except:
-      print("ERROR: Incorrect time. Input style is mm-dd-yyyy_hh-mm-ss")
-      return
-  else:
-    try:
-      fltTime = float(strTime)*60
-    except:
-      print("ERROR: Incorrect time. Input style is a float in min")
-      return
-  #Check the interval
   try:
-    fltDuration = float(strDuration)*60
-  except:
-    print("ERROR: Incorrect duration format. It should be a number in min")
+    Tmin, Tmax = GetWindow(strTime, strDuration, fltStart)
+  except ValueError as err:
+    print(err)
     return
 
-
-  Tmin = fltTime - fltDuration/2.
-  Tmax = fltTime + fltDuration/2.
+  fltClock = time.perf_counter()
+  first, last = Window(timeList, Tmin, Tmax)
+  nPoints = last - first
+  if nPoints <= 0:
+    print("ERROR: No points found in range specified")
+    return  
 
   #Print out the averages for each row with std deviation
   for var in range(nVar):
-    avgVal = 0
-    stdDev = 0
-    nPoints = 0
-
     #Get Average
-    for line in range(nlines-1):
-      #print(timeList[line])
-      if Tmin < timeList[line] and timeList[line] < Tmax:
-        #print(timeList[line])
-        avgVal += dataArray[var][line]
-        nPoints+=1
-    if nPoints <= 0:
-      print("ERROR: No points found in range specified")
-      return  
-    avgVal = avgVal/(nPoints)
+    Values = dataArray[var][first:last]
+    avgVal = sum(Values)/(nPoints)
     
     #Get StdDev
-    for line in range(nlines-1):
-      if Tmin < timeList[line] and timeList[line] <Tmax:
-        stdDev += (dataArray[var][line]-avgVal)**2
+    stdDev = 0
+    for Value in Values:
+      stdDev += (Value-avgVal)**2
     stdDev = (stdDev/nPoints)**0.5
 
     try:
@@ -190,6 +341,7 @@ def main():
     if var == 0:
       print("\tnPts  : "+str(nPoints)+"\n")
     print("{0:>10}: {1:>8} +/- {2:<6} {3}".format(varName,str(round(avgVal,2)),str(round(stdDev,2)),varUnit))
+  print("\n\tQuery : {:.1f} ms".format(1e3*(time.perf_counter()-fltClock)))
 
 if __name__  == '__main__' :
   main()
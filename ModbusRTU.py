@@ -0,0 +1,305 @@
+'''
+  Program ModbusRTU.py
+
+Description: ------------------------------------------------------------------
+   This file contains the class construct of a small Modbus RTU client used to
+talk to the Lenze ESV751N02YXC inverter (via the ESVZAR0 RS-485 module) that
+drives the booster pump.  It builds the function 03 (read holding registers)
+and 06 (write single register) frames with their CRC, checks the responses and
+decodes them into typed values.
+
+   Registers that sit next to each other are read with a single function 03
+transaction, so status, fault, output frequency and motor current come back in
+one round trip.
+
+   clsFrameCache keeps the final wire bytes of the static commands and of every
+legal RPS set point, computed once.  Run this file to compare the cached,
+table driven and per byte ways to build a set point command:
+     python ModbusRTU.py
+
+History: ----------------------------------------------------------------------
+   V1.0 - Oct-2026  First release.
+
+Environment: ------------------------------------------------------------------
+   This program is written in Python 3.8.  Python can be freely downloaded
+from http://www.python.org/.  This program has been tested on PCs running
+Windows 10.
+
+Author List: -------------------------------------------------------------------
+  R. McKay    Iowa State University, USA  mckay@iastate.edu
+  J. Yu       Iowa State University, USA  jieyu@iastate.edu
+  W. Heidorn  Iowa State University, USA  wheidorn@iastate.edu
+
+Notes: -------------------------------------------------------------------------
+   Register addresses are the zero based addresses sent on the wire, i.e. one
+less than the register numbers of the inverter manual.  STATUS (0x17) and
+FREQUENCY (0x19) are the ones used by the Status? and RPS? commands of
+ChillerEquipmentCommands.txt.  FAULT and CURRENT follow the register list of
+the ESVZAR0 manual, check them against the manual of the installed firmware.
+   Before this module the RPS? command of ChillerEquipmentCommands.txt ended
+with the CRC EE58, the correct CRC of 010300190001 is 55CD.
+
+Dictionary of abbreviations: ---------------------------------------------------
+  bol - boolean
+  cls - class
+  crc - cyclic redundancy check
+  dict - dictionary
+  flt - float
+  int - integer
+  lst - list
+  str - string
+  tup - tuple
+'''
+
+# Import section --------------------------------------------------------------
+
+import struct
+import logging
+from enum import IntEnum
+from CycRedundCheck import *
+
+# ------------------------------------------------------------------------------
+# Class PumpRegister -----------------------------------------------------------
+class PumpRegister (IntEnum) :
+  """
+    Holding registers of the inverter (zero based wire addresses).
+  """
+  CONTROL      = 0x01  # 0x0008 start, 0x0004 stop, 0x0002 lock drive
+  STATUS       = 0x17  # drive status word
+  FAULT        = 0x18  # active fault code, 0 = no fault
+  FREQUENCY    = 0x19  # actual output frequency, 0.1 Hz
+  CURRENT      = 0x1A  # motor current, 0.1 A
+  SPEED        = 0x2C  # frequency set point, 0.1 Hz
+  UNLOCK_DRIVE = 0x30  # write 0 to unlock the start, stop buttons
+  UNLOCK_PARAM = 0x31  # write 0 to unlock the parameters
+
+# Scale applied to the raw register value, registers not listed are integers.
+dictRegisterScale = { PumpRegister.FREQUENCY : 0.1,
+                      PumpRegister.CURRENT   : 0.1,
+                      PumpRegister.SPEED     : 0.1 }
+
+# Registers read every pump cycle, contiguous so they take one transaction.
+lstTelemetry = [ PumpRegister.STATUS, PumpRegister.FAULT, PumpRegister.FREQUENCY, PumpRegister.CURRENT ]
+
+# ------------------------------------------------------------------------------
+# Class Modbus Error -----------------------------------------------------------
+class clsModbusError ( ValueError ):
+  """
+    Raised for a response with a bad CRC, from the wrong slave or function, or
+    for an exception response of the inverter (function code | 0x80).
+  """
+  def __init__(self, strMessage, intCode=None):
+    super().__init__(strMessage)
+    self.intCode = intCode
+
+# ------------------------------------------------------------------------------
+# Class Modbus RTU -------------------------------------------------------------
+class clsModbusRTU:
+  READ_HOLDING  = 0x03
+  WRITE_SINGLE  = 0x06
+  intMaxCount   = 125   # largest number of registers a function 03 may read
+
+  def __init__(self, intSlave=1):
+    """
+      Client for the inverter answering at slave address intSlave.
+    """
+    self.intSlave = intSlave
+    self._istCRC = CycRedundCheck()
+
+# ----------------------------
+  def crc(self, bytesData):
+    """
+      CRC-16 (Modbus) of bytesData.
+    """
+    return self._istCRC.calc(bytesData)
+
+# ----------------------------
+  def _frame(self, bytesPDU):
+    """
+      Prefix the slave address and append the CRC, low byte first.
+    """
+    bytesFrame = bytes([self.intSlave]) + bytesPDU
+    return bytesFrame + struct.pack('<H', self.crc(bytesFrame))
+
+# ----------------------------
+  def readRegisters(self, intAddress, intCount=1):
+    """
+      Function 03 request for intCount registers starting at intAddress.
+    """
+    if intCount < 1 or intCount > self.intMaxCount:
+      raise ValueError(' Cannot read ' + str(intCount) + ' registers in one transaction')
+    return self._frame(struct.pack('>BHH', self.READ_HOLDING, intAddress, intCount))
+
+# ----------------------------
+  def writeRegister(self, intAddress, intValue):
+    """
+      Function 06 request writing intValue (0 - 0xFFFF) to intAddress.
+    """
+    return self._frame(struct.pack('>BHH', self.WRITE_SINGLE, intAddress, intValue & 0xFFFF))
+
+# ----------------------------
+  def check(self, bytesRequest, bytesResponse):
+    """
+      Check CRC, slave address and function code of bytesResponse against the
+      request it answers.  Raise clsModbusError when anything is wrong.
+    """
+    if len(bytesResponse) < 5:
+      raise clsModbusError(' Modbus response too short: ' + bytesResponse.hex())
+    if self.crc(bytesResponse) != 0:  # the CRC over a frame including its CRC is 0
+      raise clsModbusError(' Modbus CRC error: ' + bytesResponse.hex())
+    if bytesResponse[0] != bytesRequest[0]:
+      raise clsModbusError(' Modbus response from slave ' + str(bytesResponse[0]) + \
+                           ' instead of ' + str(bytesRequest[0]))
+    if bytesResponse[1] == bytesRequest[1] | 0x80:
+      raise clsModbusError(' Modbus exception ' + str(bytesResponse[2]) + ' for function ' + \
+                           str(bytesRequest[1]), bytesResponse[2])
+    if bytesResponse[1] != bytesRequest[1]:
+      raise clsModbusError(' Modbus response to function ' + str(bytesResponse[1]) + \
+                           ' instead of ' + str(bytesRequest[1]))
+
+# ----------------------------
+  def decode(self, bytesRequest, bytesResponse):
+    """
+      Return the register values carried by the response: a tuple of unsigned
+      16 bit integers for function 03, the tuple (address, value) echoed by the
+      inverter for function 06.
+    """
+    self.check(bytesRequest, bytesResponse)
+    if bytesRequest[1] == self.READ_HOLDING:
+      intCount = struct.unpack_from('>H', bytesRequest, 4)[0]
+      if bytesResponse[2] != 2 * intCount or len(bytesResponse) != 5 + 2 * intCount:
+        raise clsModbusError(' Modbus response carries ' + str(bytesResponse[2]) + ' bytes for ' + \
+                             str(intCount) + ' registers')
+      return struct.unpack_from('>' + str(intCount) + 'H', bytesResponse, 3)
+    if bytesResponse[:6] != bytesRequest[:6]:
+      raise clsModbusError(' Modbus write not echoed: ' + bytesResponse.hex())
+    return struct.unpack_from('>HH', bytesResponse, 2)
+
+# ----------------------------
+  def plan(self, lstRegisters):
+    """
+      Group the registers into blocks of contiguous addresses.  Return a list of
+      (start address, count) tuples, one function 03 transaction each.
+    """
+    lstBlocks = []
+    for intAddress in sorted(set(int(reg) for reg in lstRegisters)):
+      if lstBlocks and intAddress == sum(lstBlocks[-1]) and lstBlocks[-1][1] < self.intMaxCount:
+        lstBlocks[-1] = (lstBlocks[-1][0], lstBlocks[-1][1] + 1)
+      else:
+        lstBlocks.append((intAddress, 1))
+    return lstBlocks
+
+# ----------------------------
+  def value(self, intAddress, intRaw):
+    """
+      Scale a raw register value into its engineering unit.
+    """
+    if intAddress in dictRegisterScale:
+      return round(intRaw * dictRegisterScale[intAddress], 3)
+    return intRaw
+
+# ----------------------------
+  def values(self, intStart, tupRaw, lstRegisters):
+    """
+      Return {register name : value} for the registers in lstRegisters found
+      in the block of raw values tupRaw starting at address intStart.
+    """
+    dictValues = {}
+    for reg in lstRegisters:
+      intIdx = int(reg) - intStart
+      if 0 <= intIdx < len(tupRaw):
+        strName = reg.name if isinstance(reg, PumpRegister) else str(reg)
+        dictValues[strName] = self.value(int(reg), tupRaw[intIdx])
+    return dictValues
+
+# ------------------------------------------------------------------------------
+# Class Frame Cache ------------------------------------------------------------
+class clsFrameCache:
+  def __init__(self, istModbus, intMin=10, intMax=400):
+    """
+      Wire bytes of the commands sent to the inverter, built once.  A set point
+      command (e.g. 0106002C + value in tenths + CRC) is compiled for every value
+      from intMin to intMax the first time its prefix is used.
+    """
+    self._istModbus = istModbus
+    self._intMin = intMin
+    self._intMax = intMax
+    self._dictStatic = {}    # hex command with CRC -> bytes
+    self._dictSetpoint = {}  # hex prefix -> {value : bytes}
+
+  def static(self, strCommand):
+    """
+      Bytes of a complete hex command (CRC included), e.g. 010600010008D9CC.
+    """
+    bytesFrame = self._dictStatic.get(strCommand)
+    if bytesFrame is None:
+      bytesFrame = bytes.fromhex(strCommand)
+      if self._istModbus.crc(bytesFrame) != 0:
+        logging.warning(' Command ' + strCommand + ' has a wrong CRC, the inverter will not answer it')
+      self._dictStatic[strCommand] = bytesFrame
+    return bytesFrame
+
+  def compile(self, strPrefix):
+    """
+      Build the set point commands of strPrefix for all legal values.
+    """
+    bytesPrefix = bytes.fromhex(strPrefix)
+    dictFrames = {}
+    for intValue in range(self._intMin, self._intMax + 1):
+      bytesFrame = bytesPrefix + struct.pack('>H', intValue)
+      dictFrames[intValue] = bytesFrame + struct.pack('<H', self._istModbus.crc(bytesFrame))
+    self._dictSetpoint[strPrefix] = dictFrames
+    return dictFrames
+
+  def setpoint(self, strPrefix, intValue):
+    """
+      Bytes of strPrefix followed by intValue (16 bit) and the CRC.
+    """
+    dictFrames = self._dictSetpoint.get(strPrefix)
+    if dictFrames is None:
+      dictFrames = self.compile(strPrefix)
+    bytesFrame = dictFrames.get(intValue)
+    if bytesFrame is None:
+      raise ValueError(' Set point ' + str(intValue) + ' outside [' + str(self._intMin) + ', ' + \
+                       str(self._intMax) + ']')
+    return bytesFrame
+
+
+if __name__ == '__main__':
+
+  ist = clsModbusRTU()
+  print('Status? :', ist.readRegisters(PumpRegister.STATUS).hex().upper(), '(expect 010300170001340E)')
+  print('RPS?    :', ist.readRegisters(PumpRegister.FREQUENCY).hex().upper(), '(expect 01030019000155CD)')
+  print('RPS=10  :', ist.writeRegister(PumpRegister.SPEED, 100).hex().upper(), '(expect 0106002C006449E8)')
+  print('Blocks  :', ist.plan(lstTelemetry))
+  bytesRequest = ist.readRegisters(PumpRegister.STATUS, 4)
+  bytesResponse = ist._frame(bytes([0x03, 8]) + struct.pack('>4H', 0x0003, 0, 125, 17))
+  tupRaw = ist.decode(bytesRequest, bytesResponse)
+  print('Decoded :', ist.values(PumpRegister.STATUS, tupRaw, lstTelemetry))
+
+  # Build the RPS=22.5 command: per byte as clsPump did it, with the table
+  # driven CycRedundCheck.calc, and from the cache.
+  import timeit
+  istCRC = CycRedundCheck()
+  istCache = clsFrameCache(ist)
+  istCache.compile('0106002C')
+
+  def perByte():
+    strCommand = '0106002C' + '{:04x}'.format(int(10 * 22.5)).upper()
+    crc = 0xFFFF
+    for ch in bytearray.fromhex(strCommand):
+      crc = istCRC.calcByte(ch, crc)
+    strHexCRC = format(crc, '04x')
+    return bytes.fromhex(strCommand + (strHexCRC[2:] + strHexCRC[0:2]).upper())
+
+  def tableDriven():
+    return ist.writeRegister(PumpRegister.SPEED, 225)
+
+  def cached():
+    return istCache.setpoint('0106002C', 225)
+
+  print('Frames  :', perByte().hex().upper(), tableDriven().hex().upper(), cached().hex().upper())
+  intLoops = 100000
+  for strName, func in (('per byte', perByte), ('table driven', tableDriven), ('cached', cached)):
+    fltTime = min(timeit.repeat(func, number=intLoops, repeat=3))
+    print('{:14s} {:7.3f} us/command'.format(strName, 1e6 * fltTime / intLoops))
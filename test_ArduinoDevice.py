@@ -0,0 +1,82 @@
+'''
+  Tests of clsArduino (ArduinoDevice.py) against the emulated board of
+ArduinoEmulator.py behind a pseudo terminal: the streamed flow rate, the
+valve commands while streaming, and the polling fallback of a sketch without
+streaming mode.
+
+     python -m unittest test_ArduinoDevice
+
+  Pseudo terminals exist on Linux and mac only, the tests are skipped on
+Windows and without pyserial.
+'''
+
+import time
+import logging
+import unittest
+
+try:
+  import pty
+  import serial
+  from ArduinoEmulator import clsArduinoEmulator
+  from ArduinoDevice import clsArduino
+except ImportError:
+  clsArduinoEmulator = None
+
+fltTemps = [20.] * 8                       # fltTemps[3], the outflow, for the flow rate
+
+@unittest.skipIf(clsArduinoEmulator is None, 'needs the module pty and pyserial')
+class TestArduinoStream(unittest.TestCase):
+  def setUp(self):
+    logging.disable(logging.WARNING)
+    self.istEmulator = clsArduinoEmulator(fltVoltage=1.2, fltNoise=0.02)
+    self.istArduino = clsArduino('Arduino', self.istEmulator.strPort, 9600)
+
+  def tearDown(self):
+    self.istArduino.stopStream()
+    self.istEmulator.close()
+    logging.disable(logging.NOTSET)
+
+  def read(self, strCmdName):
+    self.istArduino.read(strCmdName, '', [fltTemps, []])
+    return self.istArduino.last()
+
+  def test_streamed_average(self):
+    self.assertTrue(self.read('C20'))
+    self.assertTrue(self.istArduino.streaming())
+    time.sleep(0.5)
+    fltVoltage, fltAge, intNum = self.istArduino._istStream.average()
+    self.assertGreater(intNum, 5)
+    self.assertLess(fltAge, 0.2)
+    self.assertAlmostEqual(fltVoltage, 1.2, delta=0.02)
+    fltStart = time.monotonic()
+    fltFlow = self.read('F')
+    self.assertLess(time.monotonic() - fltStart, 0.1)   # no query, no 1.8 s waits
+    fltExpected = self.istArduino.funcFlowRate('OK 1.2', fltTemps[3])
+    self.assertAlmostEqual(fltFlow, fltExpected, delta=0.05)
+
+  def test_toggle_and_stop_while_streaming(self):
+    self.assertTrue(self.read('C20'))
+    time.sleep(0.2)
+    self.assertTrue(self.read('V'))                     # the reply comes between the voltages
+    self.assertEqual(self.istEmulator.valves(), ['Close', 'Open', 'Open'])
+    self.assertTrue(self.read('R'))
+    self.assertEqual(self.istEmulator.valves(), ['Open', 'Close', 'Close'])
+    self.assertTrue(self.read('P'))
+    self.assertFalse(self.istArduino.streaming())
+    fltFlow = self.istArduino.readFlowRate(fltTemps[3]) # polled again, no voltage left over
+    self.assertAlmostEqual(fltFlow, self.istArduino.funcFlowRate('OK 1.2', fltTemps[3]), delta=0.05)
+
+  def test_fallback_without_streaming_mode(self):
+    self.istEmulator.bolStreaming = False
+    self.istArduino.fltTimeout = 0.3
+    self.assertFalse(self.read('C20'))                  # no answer: a warning, not an exception
+    self.assertFalse(self.istArduino.streaming())
+    self.istArduino.fltTimeout = 2.0
+    fltFlow = self.istArduino.readFlowRate(fltTemps[3]) # polled as before
+    self.assertAlmostEqual(fltFlow, self.istArduino.funcFlowRate('OK 1.2', fltTemps[3]), delta=0.05)
+    self.assertTrue(self.read('V'))
+    self.assertEqual(self.istEmulator.valves(), ['Close', 'Open', 'Open'])
+
+
+if __name__ == '__main__':
+  unittest.main()